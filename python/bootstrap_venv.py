@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import argparse
+import hashlib
+import json
+import platform
 import subprocess
 import sys
 import shutil
@@ -11,6 +15,8 @@ from pathlib import Path
 PY_DIR = Path(__file__).resolve().parent
 VENV_DIR = PY_DIR / ".venv"
 REQ_FILE = PY_DIR / "requirements.txt"
+# Lives inside .venv so deleting or recreating the venv also discards it.
+STAMP_FILE = VENV_DIR / "bootstrap-stamp.json"
 
 
 def run(cmd: list[str]) -> None:
@@ -45,7 +51,40 @@ def create_venv_if_missing() -> None:
     builder.create(str(VENV_DIR))
 
 
-def install_requirements() -> None:
+def file_digest(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def fingerprint() -> dict[str, object]:
+    """Inputs that decide what pip installs into .venv."""
+    return {
+        "python": sys.version,
+        "executable": str(Path(sys.executable).resolve()),
+        "platform": f"{sys.platform}-{platform.machine()}",
+        "requirements": file_digest(REQ_FILE),
+    }
+
+
+def read_stamp() -> dict[str, object]:
+    try:
+        stamp = json.loads(STAMP_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return stamp if isinstance(stamp, dict) else {}
+
+
+def write_stamp(current: dict[str, object]) -> None:
+    STAMP_FILE.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+
+
+def install_requirements() -> bool:
+    """Install pip packages; returns True when requirements.txt installed cleanly.
+
+    The pip/setuptools upgrade is best-effort and does not decide the result: a failed upgrade
+    alone must not keep the stamp from being written and force a reinstall on every run.
+    """
     py = venv_python()
     if not py.exists():
         raise SystemExit("[python-venv][error] venv python not found after creation")
@@ -65,28 +104,40 @@ def install_requirements() -> None:
         )
         if ensurepip.returncode != 0:
             print("[python-venv][warn] pip unavailable in this Python build; skipping pip package installation")
-            return
+            return False
     print("[python-venv] upgrading pip/setuptools")
-    upgraded = run_optional([str(py), "-m", "pip", "install", "--upgrade", "pip", "setuptools"])
-    if not upgraded:
+    if not run_optional([str(py), "-m", "pip", "install", "--upgrade", "pip", "setuptools"]):
         print("[python-venv][warn] no se pudo actualizar pip/setuptools, se continua con lo disponible")
     if REQ_FILE.exists():
         lines = [line.strip() for line in REQ_FILE.read_text(encoding="utf-8").splitlines()]
         installable = [line for line in lines if line and not line.startswith("#")]
         if not installable:
             print("[python-venv] requirements.txt sin paquetes, skip")
-            return
+            return True
         print("[python-venv] installing requirements")
         installed = run_optional([str(py), "-m", "pip", "install", "-r", str(REQ_FILE)])
         if not installed:
             print("[python-venv][warn] no se pudieron instalar todas las dependencias de requirements.txt")
-    else:
-        print("[python-venv] requirements.txt not found, skipping")
+        return installed
+    print("[python-venv] requirements.txt not found, skipping")
+    return True
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create python/.venv and install python/requirements.txt.")
+    parser.add_argument("--force", action="store_true", help="Reinstall even if nothing changed since the last run.")
+    return parser.parse_args()
 
 
 def main() -> None:
+    args = parse_args()
     create_venv_if_missing()
-    install_requirements()
+    current = fingerprint()
+    if not args.force and read_stamp() == current:
+        digest = str(current["requirements"] or "none")[:12]
+        print(f"[python-venv] skip pip: Python {platform.python_version()} and requirements.txt ({digest}) unchanged")
+    elif install_requirements():
+        write_stamp(current)
     print(f"[python-venv] ready: {VENV_DIR}")
 
 
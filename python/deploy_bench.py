@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the deploy server (``deploy_secure.py bench``).
+
+Starts ``deploy_secure.py serve`` in a subprocess against a local stand-in API (JSON echo +
+SSE broadcaster, in its own process) and drives concurrent keep-alive load from this one:
+- static: a hashed asset (gzip) and index.html
+- spa: a client-side route answered with the index.html fallback
+- proxy-get / proxy-post-<bytes>: /api/* requests relayed to the stand-in API
+- sse: events broadcast by the stand-in API, measured at N clients behind the proxy
+
+Results are written as JSON; ``--compare`` flags regressions against a saved baseline.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import http.client
+import http.server
+import json
+import math
+import multiprocessing
+import platform
+import queue
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import deploy_secure as ds
+
+BENCH_DIR = ds.STATE_DIR / "bench"
+STANDIN_PREFIX = "/api/bench"
+SERVER_STARTUP_TIMEOUT = 30.0
+
+
+# -- stand-in API (runs in a spawned process) ----------------------------------
+
+
+def serve_standin_api(port: int, sse_interval: float) -> None:
+    """Plain HTTP API that echoes JSON and broadcasts timestamped SSE events."""
+    subscribers: list[queue.SimpleQueue] = []
+    lock = threading.Lock()
+
+    def broadcast() -> None:
+        while True:
+            time.sleep(sse_interval)
+            event = f'data: {{"sentNs": {time.time_ns()}}}\n\n'.encode()
+            with lock:
+                targets = list(subscribers)
+            for target in targets:
+                target.put(event)
+
+    class StandinHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path.endswith("/sync/events"):
+                self.stream_events()
+                return
+            self.reply({"ok": True, "path": self.path})
+
+        def do_POST(self) -> None:  # noqa: N802
+            length = int(self.headers.get("Content-Length", "0"))
+            received = self.rfile.read(length)
+            self.reply({"ok": True, "bytes": len(received)})
+
+        def reply(self, payload: dict[str, object]) -> None:
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def stream_events(self) -> None:
+            events: queue.SimpleQueue = queue.SimpleQueue()
+            with lock:
+                subscribers.append(events)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                self.wfile.write(b": ready\n\n")
+                while True:
+                    self.wfile.write(events.get())
+            except OSError:
+                pass
+            finally:
+                with lock:
+                    subscribers.remove(events)
+
+        def log_message(self, fmt: str, *args: object) -> None:
+            pass
+
+    class StandinServer(http.server.ThreadingHTTPServer):
+        daemon_threads = True
+        # Read by listen() in the constructor: the asyncio engine opens its upstream connections
+        # all at once, and a short backlog turns that burst into 1s SYN retries.
+        request_queue_size = 1024
+
+    threading.Thread(target=broadcast, daemon=True).start()
+    server = StandinServer(("127.0.0.1", port), StandinHandler)
+    server.serve_forever()
+
+
+# -- load generation -----------------------------------------------------------
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float, process: subprocess.Popen | None = None) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def summarize(latencies: list[float], errors: int, seconds: float) -> dict[str, object]:
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "p50Ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99Ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "p999Ms": round(percentile(latencies, 0.999) * 1000, 3),
+    }
+
+
+def run_request_load(
+    port: int,
+    context: ssl.SSLContext,
+    make_request: Callable[[], tuple[str, str, bytes | None, dict[str, str]]],
+    *,
+    concurrency: int,
+    duration: float,
+) -> dict[str, object]:
+    """`concurrency` keep-alive clients issuing requests back to back for `duration` seconds."""
+    results: list[tuple[list[float], int]] = []
+    start = threading.Barrier(concurrency + 1)
+    deadline = [0.0]
+
+    def client() -> None:
+        latencies: list[float] = []
+        errors = 0
+        connection = http.client.HTTPSConnection("localhost", port, context=context, timeout=30)
+        start.wait()
+        while time.perf_counter() < deadline[0]:
+            method, path, body, headers = make_request()
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                continue
+            if response.status != 200:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        connection.close()
+        results.append((latencies, errors))
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    deadline[0] = time.perf_counter() + duration
+    began = time.perf_counter()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    return summarize([value for latencies, _ in results for value in latencies], sum(e for _, e in results), elapsed)
+
+
+def run_sse_fanout(port: int, context: ssl.SSLContext, *, clients: int, duration: float) -> dict[str, object]:
+    """Delivery latency of stand-in API events to `clients` SSE subscribers behind the proxy."""
+    results: list[tuple[list[float], int]] = []
+    ready = threading.Barrier(clients + 1, timeout=SERVER_STARTUP_TIMEOUT)
+    stop_at = [0.0]
+
+    def subscriber() -> None:
+        latencies: list[float] = []
+        errors = 0
+        connection = http.client.HTTPSConnection("localhost", port, context=context, timeout=10)
+        try:
+            connection.request("GET", f"{STANDIN_PREFIX}/sync/events", headers={"Accept": "text/event-stream"})
+            response = connection.getresponse()
+            if response.status != 200:
+                raise OSError(f"status {response.status}")
+            response.readline()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            response = None
+        with contextlib.suppress(threading.BrokenBarrierError):
+            ready.wait()
+        while response is not None and time.perf_counter() < stop_at[0]:
+            try:
+                line = response.readline()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                break
+            if not line:
+                break
+            if line.startswith(b"data: "):
+                sent_ns = json.loads(line[6:])["sentNs"]
+                latencies.append((time.time_ns() - sent_ns) / 1e9)
+        connection.close()
+        results.append((latencies, errors))
+
+    threads = [threading.Thread(target=subscriber, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    began = time.perf_counter()
+    stop_at[0] = began + duration
+    for thread in threads:
+        thread.join(duration + 15)
+    summary = summarize(
+        [value for latencies, _ in results for value in latencies],
+        sum(e for _, e in results),
+        time.perf_counter() - began,
+    )
+    summary["clients"] = clients
+    return summary
+
+
+# -- driver --------------------------------------------------------------------
+
+
+def pick_static_asset() -> tuple[str, str]:
+    """Largest hashed asset of the active release (served from its in-memory pack or disk)."""
+    index = ds.load_release_index(ds.get_current_release_dir())
+    assets = sorted(
+        (int(entry.get("bytes") or 0), rel) for rel, entry in index.items() if rel.startswith("assets/")
+    )
+    if not assets:
+        ds.fail("La release activa no tiene archivos en assets/ para el benchmark estatico.")
+    return f"/{assets[-1][1]}", ds.get_current_release_dir().parent.name
+
+
+def run_benchmarks(args: argparse.Namespace) -> None:
+    ds.ensure_dirs()
+    if not ds.CURRENT_RELEASE_FILE.exists():
+        ds.fail("No hay release activa: ejecuta `build` antes de `bench`.")
+    asset_path, release = pick_static_asset()
+    cert_file, _key = ds.local_cert_paths("rsa")
+    if not cert_file.exists():
+        ds.fail(f"Falta {cert_file}: ejecuta `serve` una vez para generar el certificado local.")
+    context = ssl.create_default_context(cafile=str(cert_file))
+
+    post_sizes = [int(size) for size in args.post_sizes.split(",") if size.strip()]
+    scenarios: dict[str, Callable[[], dict[str, object]]] = {}
+    gzip_headers = {"Accept-Encoding": "gzip"}
+    api_port, frontend_port = free_port(), free_port()
+
+    def load(method: str, path: str, body: bytes | None = None, headers: dict[str, str] | None = None):
+        request = (method, path, body, headers or {})
+        return lambda: run_request_load(
+            frontend_port, context, lambda: request, concurrency=args.concurrency, duration=args.duration
+        )
+
+    scenarios["static-asset"] = load("GET", asset_path, headers=gzip_headers)
+    scenarios["static-index"] = load("GET", "/", headers=gzip_headers)
+    scenarios["spa-fallback"] = load("GET", "/vault/items/42", headers=gzip_headers)
+    scenarios["proxy-get"] = load("GET", f"{STANDIN_PREFIX}/echo")
+    for size in post_sizes:
+        scenarios[f"proxy-post-{size}"] = load(
+            "POST", f"{STANDIN_PREFIX}/echo", b"x" * size, {"Content-Type": "application/octet-stream"}
+        )
+    scenarios["sse"] = lambda: run_sse_fanout(
+        frontend_port, context, clients=args.sse_clients, duration=args.duration
+    )
+    if args.scenarios:
+        wanted = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+        unknown = [name for name in wanted if name not in scenarios]
+        if unknown:
+            ds.fail(f"Escenarios desconocidos: {', '.join(unknown)} (disponibles: {', '.join(scenarios)})")
+        scenarios = {name: scenarios[name] for name in wanted}
+
+    standin = multiprocessing.get_context("spawn").Process(
+        target=serve_standin_api, args=(api_port, args.sse_interval_ms / 1000), daemon=True
+    )
+    standin.start()
+    server_args = [
+        sys.executable,
+        str(Path(ds.__file__).resolve()),
+        "serve",
+        "--frontend-https-port",
+        str(frontend_port),
+        "--api-origin",
+        f"http://127.0.0.1:{api_port}",
+        "--engine",
+        args.engine,
+        "--workers",
+        str(args.workers),
+        "--asset-pack-mb",
+        str(args.asset_pack_mb),
+    ]
+    # A file, not a pipe: nobody reads stderr while the server runs, and a full pipe would block it.
+    server_stderr = tempfile.TemporaryFile()
+    server = subprocess.Popen(server_args, stdout=subprocess.DEVNULL, stderr=server_stderr)
+    try:
+        if not wait_for_port(api_port, SERVER_STARTUP_TIMEOUT):
+            ds.fail("La API de prueba no arranco.")
+        if not wait_for_port(frontend_port, SERVER_STARTUP_TIMEOUT, server):
+            detail = ""
+            if server.poll() is not None:
+                server_stderr.seek(0)
+                detail = server_stderr.read().decode(errors="replace")[-2000:]
+            ds.fail(f"El servidor no arranco en el puerto {frontend_port}. {detail}")
+        ds.info(
+            f"Benchmark: release {release}, engine {args.engine}, workers {args.workers}, "
+            f"{args.concurrency} clientes, {args.duration:g}s por escenario"
+        )
+        results: dict[str, dict[str, object]] = {}
+        for name, scenario in scenarios.items():
+            results[name] = scenario()
+            ds.info(f"{name}: {ds.format_stats(results[name])}")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        server_stderr.close()
+        standin.terminate()
+
+    report = {
+        "createdAt": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "release": release,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": multiprocessing.cpu_count(),
+        "config": {
+            "engine": args.engine,
+            "workers": args.workers,
+            "assetPackMb": args.asset_pack_mb,
+            "concurrency": args.concurrency,
+            "durationSeconds": args.duration,
+            "sseClients": args.sse_clients,
+            "sseIntervalMs": args.sse_interval_ms,
+            "staticAsset": asset_path,
+        },
+        "scenarios": results,
+    }
+    output = Path(args.output) if args.output else BENCH_DIR / f"bench-{dt.datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    ds.info(f"Resultados: {output}")
+
+    if args.compare:
+        regressions = compare_reports(json.loads(Path(args.compare).read_text(encoding="utf-8")), report, args.threshold)
+        if regressions:
+            ds.fail(f"{regressions} regresion(es) de mas del {args.threshold:g}% frente a {args.compare}")
+        ds.info(f"Sin regresiones de mas del {args.threshold:g}% frente a {args.compare}")
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float) -> int:
+    """Log per-scenario deltas; a regression is rps down or p99 up by more than `threshold` %."""
+    if baseline.get("config", {}).get("engine") != current["config"]["engine"]:
+        ds.info("Aviso: la referencia uso otro engine; la comparacion puede no ser significativa.")
+    regressions = 0
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            ds.info(f"{name}: sin referencia")
+            continue
+        rps_delta = percent_change(float(base["rps"]), float(result["rps"]))
+        p99_delta = percent_change(float(base["p99Ms"]), float(result["p99Ms"]))
+        flags = []
+        if rps_delta < -threshold:
+            flags.append("rps")
+        if p99_delta > threshold:
+            flags.append("p99")
+        regressions += bool(flags)
+        verdict = f"REGRESION ({', '.join(flags)})" if flags else "ok"
+        ds.info(
+            f"{name}: rps {base['rps']} -> {result['rps']} ({rps_delta:+.1f}%), "
+            f"p99 {base['p99Ms']} -> {result['p99Ms']} ms ({p99_delta:+.1f}%) {verdict}"
+        )
+    return regressions
+
+
+def percent_change(before: float, after: float) -> float:
+    if before == 0:
+        return 0.0
+    return (after - before) / before * 100
@@ -14,23 +14,42 @@ Capabilities:
 from __future__ import annotations
 
 import argparse
+import asyncio
+import bisect
+import contextlib
 import datetime as dt
+import email.utils
+import gzip
 import hashlib
+import html
+import io
+import http
 import http.client
 import http.server
 import ipaddress
 import json
+import mimetypes
+import multiprocessing
 import os
+import select
 import shutil
 import signal
+import socket
 import socketserver
 import ssl
+import struct
 import subprocess
 import sys
 import threading
 import time
 import urllib.parse
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, NamedTuple
+
+from task_graph import TaskGraph, current_task, emit, run_prefixed
 
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -38,26 +57,139 @@ PY_DIR = ROOT / "python"
 CERTS_DIR = PY_DIR / "certs"
 RELEASES_DIR = PY_DIR / "releases"
 STATE_DIR = PY_DIR / "state"
+BLOBS_DIR = PY_DIR / "blobs"
 CURRENT_RELEASE_FILE = STATE_DIR / "current-release.json"
 DEPLOY_HISTORY_FILE = STATE_DIR / "deploy-history.json"
+RELEASE_STORE_LOCK_FILE = STATE_DIR / "release-store.lock"
 DIST_DIR = ROOT / "dist"
 
 DEFAULT_FRONTEND_HTTPS_PORT = 5443
 DEFAULT_FRONTEND_HTTP_REDIRECT_PORT = 5080
 DEFAULT_API_HTTPS_PORT = 4000
 
+# Vite emits content-hashed file names under assets/, so those never change in place.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+HASH_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# gc leaves unreferenced blobs (and *.tmp files) younger than this alone, in case a writer that
+# does not hold the store lock is still linking them into a release.
+BLOB_GC_GRACE_SECONDS = 600
+
+# Optional Prometheus endpoint (--metrics), answered to loopback clients only.
+METRICS_PATH = "/__deploy/metrics"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Sampling profiler: runtime toggle (loopback only; POST ?action=start|stop) and output folder.
+PROFILE_PATH = "/__deploy/profile"
+PROFILE_DIR = STATE_DIR / "profiles"
+PROFILE_ROUTES = ("tls", "static", "api", "other")
+
+# --access-log: records buffered in memory before the writer thread catches up (then dropped).
+ACCESS_LOG_BUFFER_RECORDS = 50_000
+
+# In-memory asset packs: per-release cap (--asset-pack-mb) and the largest file kept in memory.
+DEFAULT_ASSET_PACK_MB = 64
+ASSET_PACK_MAX_FILE_BYTES = 8 * 1024 * 1024
+
+# Precompressed sidecars are generated once per release and picked per request.
+PRECOMPRESSED_DIR_NAME = "precompressed"
+PRECOMPRESS_MIN_BYTES = 512
+COMPRESSIBLE_SUFFIXES = {
+    ".css",
+    ".html",
+    ".ico",
+    ".js",
+    ".json",
+    ".map",
+    ".mjs",
+    ".svg",
+    ".txt",
+    ".wasm",
+    ".webmanifest",
+    ".xml",
+}
+# Server preference when the client accepts several encodings with the same q-value.
+ENCODING_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+SECURITY_HEADERS = (
+    ("Strict-Transport-Security", "max-age=31536000"),
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+    ("Referrer-Policy", "no-referrer"),
+    ("Permissions-Policy", "camera=(), microphone=(), geolocation=()"),
+    (
+        "Content-Security-Policy",
+        "default-src 'self'; "
+        "script-src 'self'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data:; "
+        "connect-src 'self' https: wss:; "
+        "font-src 'self' data:; "
+        "object-src 'none'; base-uri 'self'; frame-ancestors 'none'",
+    ),
+)
+
+# Node's default keepAliveTimeout is 5s; stay below it so we never reuse a socket it is closing.
+UPSTREAM_IDLE_TIMEOUT_SECONDS = 4.0
+UPSTREAM_MAX_CONNECTIONS = 32
+UPSTREAM_TIMEOUT_SECONDS = 20
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+# Bodies up to this size are buffered (and can be retried); bigger or chunked ones are streamed.
+DEFAULT_PROXY_BUFFER_BYTES = 1024 * 1024
+PROXY_STREAM_CHUNK_BYTES = 64 * 1024
+# Frontend keep-alive: idle wait between requests, per-read/write limit inside a request,
+# and how many requests one connection may carry before the server closes it.
+DEFAULT_KEEPALIVE_TIMEOUT_SECONDS = 15
+DEFAULT_REQUEST_TIMEOUT_SECONDS = 60
+DEFAULT_MAX_KEEPALIVE_REQUESTS = 1000
+# The sync hub never pings, so idle WebSocket tunnels are only reaped after a generous timeout.
+DEFAULT_WS_MAX_TUNNELS = 512
+DEFAULT_WS_IDLE_TIMEOUT_SECONDS = 600
+MAX_UPGRADE_HEAD_BYTES = 64 * 1024
+LOCAL_HOSTNAMES = ("localhost", "127.0.0.1", "::1")
+
+# Watch mode: sources that trigger a redeploy, and editor/tooling noise that never should.
+# Everything `npm run build` reads, hashed by content for the build cache (plus VITE_* env).
+BUILD_INPUT_DIRS = ("src", "public")
+BUILD_INPUT_FILES = ("index.html", "package.json", "package-lock.json", "vite.config.js")
+# What vite's loadEnv reads for `vite build` (mode "production"); later files override earlier ones.
+VITE_ENV_FILES = (".env", ".env.local", ".env.production", ".env.production.local")
+
+WATCH_DIRS = ("src", "server", "public")
+WATCH_FILES = ("package.json", "package-lock.json", "vite.config.js", *VITE_ENV_FILES)
+WATCH_IGNORED_DIRS = {"__pycache__", "node_modules", ".git"}
+WATCH_IGNORED_NAMES = {"4913", ".DS_Store"}  # 4913: vim's write probe
+WATCH_IGNORED_PREFIXES = (".#",)
+WATCH_IGNORED_SUFFIXES = ("~", ".swp", ".swo", ".swx", ".tmp", ".crswap")
+# Written by the running API itself (vault shards, signing keys, backups): runtime data, not
+# sources. BACKUP_DIR (server/config.js) is added when it points inside the project.
+API_RUNTIME_DIRS = ("server/data",)
+# An edit burst (save-all, git checkout) is coalesced until it has been quiet this long.
+WATCH_DEBOUNCE_SECONDS = 0.05
+WATCH_MAX_BATCH_SECONDS = 1.0
+
 
 def info(msg: str) -> None:
-    print(f"[python-deploy] {msg}")
+    task = current_task()
+    if task is None:
+        print(f"[python-deploy] {msg}")
+    else:
+        emit(f"[python-deploy][{task}] {msg}")
 
 
 def fail(msg: str, code: int = 1) -> None:
-    print(f"[python-deploy][error] {msg}", file=sys.stderr)
+    task = current_task()
+    if task is None:
+        print(f"[python-deploy][error] {msg}", file=sys.stderr)
+    else:
+        emit(f"[python-deploy][{task}][error] {msg}", stream=sys.stderr)
     raise SystemExit(code)
 
 
 def ensure_dirs() -> None:
-    for directory in (CERTS_DIR, RELEASES_DIR, STATE_DIR):
+    for directory in (CERTS_DIR, RELEASES_DIR, STATE_DIR, BLOBS_DIR):
         directory.mkdir(parents=True, exist_ok=True)
 
 
@@ -85,12 +217,17 @@ def get_api_namespace() -> str:
 def run_command(cmd: list[str], *, env: dict[str, str] | None = None) -> None:
     resolved = resolve_command(cmd)
     info(f"Running: {' '.join(cmd)}")
+    task = current_task()
     try:
-        proc = subprocess.run(resolved, cwd=str(ROOT), env=env)
+        if task is None:
+            returncode = subprocess.run(resolved, cwd=str(ROOT), env=env).returncode
+        else:
+            # Inside a startup task: prefix the output so concurrent tasks stay readable.
+            returncode = run_prefixed(resolved, prefix=task, cwd=str(ROOT), env=env)
     except FileNotFoundError:
         fail(f"No se encontro el ejecutable: {cmd[0]}. Verifica instalacion y PATH.")
-    if proc.returncode != 0:
-        fail(f"Command failed ({proc.returncode}): {' '.join(cmd)}")
+    if returncode != 0:
+        fail(f"Command failed ({returncode}): {' '.join(cmd)}")
 
 
 def resolve_command(cmd: list[str]) -> list[str]:
@@ -122,16 +259,26 @@ def resolve_executable(name: str) -> str:
     return name
 
 
-def ensure_local_https_cert(cert_file: Path, key_file: Path) -> None:
+def local_cert_paths(key_type: str) -> tuple[Path, Path]:
+    if key_type == "ecdsa":
+        return CERTS_DIR / "localhost-ecdsa.crt", CERTS_DIR / "localhost-ecdsa.key"
+    return CERTS_DIR / "localhost.crt", CERTS_DIR / "localhost.key"
+
+
+def ensure_local_https_cert(cert_file: Path, key_file: Path, key_type: str = "rsa") -> None:
     if cert_file.exists() and key_file.exists():
         return
 
+    # ECDSA P-256 signatures are far cheaper than RSA-2048 for the server during full handshakes.
+    if key_type == "ecdsa":
+        key_args = ["-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1"]
+    else:
+        key_args = ["-newkey", "rsa:2048"]
     openssl_cmd = [
         "openssl",
         "req",
         "-x509",
-        "-newkey",
-        "rsa:2048",
+        *key_args,
         "-sha256",
         "-nodes",
         "-days",
@@ -148,7 +295,7 @@ def ensure_local_https_cert(cert_file: Path, key_file: Path) -> None:
     try:
         run_command(openssl_cmd)
     except SystemExit:
-        if create_local_https_cert_python(cert_file, key_file):
+        if create_local_https_cert_python(cert_file, key_file, key_type):
             info("Certificado local generado con fallback Python (cryptography).")
             return
         fail(
@@ -158,17 +305,20 @@ def ensure_local_https_cert(cert_file: Path, key_file: Path) -> None:
         )
 
 
-def create_local_https_cert_python(cert_file: Path, key_file: Path) -> bool:
+def create_local_https_cert_python(cert_file: Path, key_file: Path, key_type: str = "rsa") -> bool:
     try:
         from cryptography import x509
         from cryptography.hazmat.primitives import hashes, serialization
-        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives.asymmetric import ec, rsa
         from cryptography.x509.oid import NameOID
     except Exception:
         return False
 
     now = dt.datetime.now(dt.timezone.utc)
-    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if key_type == "ecdsa":
+        key = ec.generate_private_key(ec.SECP256R1())
+    else:
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
     subject = issuer = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
     cert = (
         x509.CertificateBuilder()
@@ -208,46 +358,247 @@ def sha256_file(path: Path) -> str:
     return digest.hexdigest()
 
 
-def build_frontend() -> None:
+def frontend_build_env() -> dict[str, str]:
     env = os.environ.copy()
     env["VITE_API_BASE"] = f"/api/v1/{get_api_namespace()}"
-    run_command(["npm", "run", "build"], env=env)
+    return env
+
+
+def build_frontend() -> None:
+    run_command(["npm", "run", "build"], env=frontend_build_env())
     if not DIST_DIR.exists():
         fail("No existe dist/ luego de npm run build.")
 
 
-def create_release() -> Path:
+def build_input_hash() -> str:
+    """Content hash of the build inputs: sources, lockfile, vite config and the VITE_* env.
+
+    Unlike the watcher's (mtime, size) snapshot it ignores touches and checkouts that restore
+    the same bytes, so identical inputs always map to the same release.
+    """
+    files = [ROOT / rel for rel in BUILD_INPUT_FILES]
+    for rel in BUILD_INPUT_DIRS:
+        root = ROOT / rel
+        if root.exists():
+            files.extend(path for path in root.rglob("*") if path.is_file())
+    entries = sorted(
+        (file.relative_to(ROOT).as_posix(), file)
+        for file in files
+        if not is_ignored_change(file.relative_to(ROOT).as_posix())
+    )
+    present = [(rel_path, file) for rel_path, file in entries if file.is_file()]
+    with ThreadPoolExecutor(max_workers=max(1, min(HASH_WORKERS, len(present)))) as pool:
+        digests = dict(zip((rel_path for rel_path, _ in present), pool.map(sha256_file, (f for _, f in present))))
+    # vite inlines every VITE_* variable from its env files and from the environment (which wins).
+    vite_env: dict[str, str] = {}
+    for name in VITE_ENV_FILES:
+        vite_env.update((key, value) for key, value in read_dotenv(ROOT / name).items() if key.startswith("VITE_"))
+    vite_env.update((key, value) for key, value in frontend_build_env().items() if key.startswith("VITE_"))
+    digest = hashlib.sha256()
+    for rel_path, _file in entries:
+        digest.update(f"{rel_path}\0{digests.get(rel_path, 'missing')}\n".encode("utf-8"))
+    digest.update(json.dumps(sorted(vite_env.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def find_release_for_inputs(input_hash: str) -> str | None:
+    """Newest release in the deploy history built from exactly these inputs (and still on disk)."""
+    if not DEPLOY_HISTORY_FILE.exists():
+        return None
+    try:
+        history = json.loads(DEPLOY_HISTORY_FILE.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(history, list):
+        return None
+    for entry in reversed(history):
+        if not isinstance(entry, dict) or entry.get("inputHash") != input_hash:
+            continue
+        name = str(entry.get("release"))
+        if (RELEASES_DIR / name / "integrity.json").is_file() and (RELEASES_DIR / name / "dist").is_dir():
+            return name
+    return None
+
+
+def reuse_release(name: str, input_hash: str) -> Path:
+    """Activate an existing release built from the same inputs instead of rebuilding."""
+    release_dir = RELEASES_DIR / name
+    active = None
+    if CURRENT_RELEASE_FILE.exists():
+        with contextlib.suppress(OSError, json.JSONDecodeError):
+            active = json.loads(CURRENT_RELEASE_FILE.read_text(encoding="utf-8")).get("release")
+    if active == name:
+        info(f"Build cache: entradas sin cambios ({input_hash[:12]}); la release activa {name} ya es esa build.")
+        return release_dir
+    set_current_release(name)
+    manifest = json.loads((release_dir / "integrity.json").read_text(encoding="utf-8"))
+    append_history(
+        {
+            "release": name,
+            "createdAtUtc": dt.datetime.now(dt.timezone.utc).isoformat().replace("+00:00", "Z"),
+            "files": len(manifest.get("files", [])),
+            "inputHash": input_hash,
+            "reused": True,
+        }
+    )
+    info(f"Build cache: mismas entradas ({input_hash[:12]}) que {name}; se reactiva sin reconstruir.")
+    return release_dir
+
+
+@contextlib.contextmanager
+def release_store_lock():
+    """Exclusive, cross-process lock held while a release is written or the blob store collected."""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(RELEASE_STORE_LOCK_FILE, "a+b") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after ~10 s of retries; keep waiting like flock does.
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+
+def create_release(input_hash: str | None = None) -> Path:
+    # gc must not collect blobs stored here before integrity.json references them.
+    with release_store_lock():
+        return _create_release(input_hash)
+
+
+def _create_release(input_hash: str | None) -> Path:
     now_utc = dt.datetime.now(dt.timezone.utc)
     release_name = now_utc.strftime("release-%Y%m%d-%H%M%S")
     release_dir = RELEASES_DIR / release_name
+    # Incremental rebuilds can finish within the same second.
+    suffix = 1
+    while release_dir.exists():
+        suffix += 1
+        release_dir = RELEASES_DIR / f"{now_utc.strftime('release-%Y%m%d-%H%M%S')}-{suffix}"
+    release_name = release_dir.name
     info(f"Creating release {release_name}")
-    shutil.copytree(DIST_DIR, release_dir / "dist", dirs_exist_ok=False)
-    manifest = create_integrity_manifest(release_dir / "dist")
-    (release_dir / "integrity.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    release_dir.mkdir(parents=True, exist_ok=False)
+    try:
+        manifest = create_integrity_manifest(DIST_DIR, load_active_manifest_index())
+        link_release_files(release_dir, manifest)
+        create_precompressed_variants(release_dir, manifest)
+        (release_dir / "integrity.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    except BaseException:
+        # A release without integrity.json must not be left behind for rollback to pick.
+        shutil.rmtree(release_dir, ignore_errors=True)
+        raise
     set_current_release(release_name)
-    append_history(
-        {
-            "release": release_name,
-            "createdAtUtc": now_utc.isoformat().replace("+00:00", "Z"),
-            "files": len(manifest["files"]),
-        }
-    )
+    entry: dict[str, object] = {
+        "release": release_name,
+        "createdAtUtc": now_utc.isoformat().replace("+00:00", "Z"),
+        "files": len(manifest["files"]),
+    }
+    if input_hash:
+        entry["inputHash"] = input_hash
+    append_history(entry)
     return release_dir
 
 
-def create_integrity_manifest(dist_path: Path) -> dict[str, object]:
-    files = []
+def blob_path(digest: str, suffix: str = "") -> Path:
+    return BLOBS_DIR / digest[:2] / f"{digest}{suffix}"
+
+
+def store_blob(source: Path | bytes, digest: str, suffix: str = "") -> Path:
+    """Add content to the blob store under its sha256 (no-op when already present).
+
+    Files are re-hashed while they are copied: the digest was computed earlier, and a blob
+    stored with the wrong bytes would be reused by every later release.
+    """
+    target = blob_path(digest, suffix)
+    if target.exists():
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if isinstance(source, bytes):
+        # Precompressed variants: keyed by the digest of the (already stored) uncompressed file.
+        tmp_file.write_bytes(source)
+    else:
+        copied = hashlib.sha256()
+        with source.open("rb") as src, tmp_file.open("wb") as dst:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                copied.update(chunk)
+                dst.write(chunk)
+        if copied.hexdigest() != digest:
+            tmp_file.unlink(missing_ok=True)
+            fail(f"{source} cambio mientras se creaba la release (sha256 distinto del manifiesto).")
+    os.replace(tmp_file, target)
+    return target
+
+
+def link_blob(blob: Path, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(blob, target)
+    except OSError:
+        # Hardlinks need the same filesystem (and support for them); fall back to a copy.
+        shutil.copyfile(blob, target)
+
+
+def link_release_files(release_dir: Path, manifest: dict[str, object]) -> None:
+    """Materialize release_dir/dist from the blob store, adding only content it has not seen."""
+    dist_path = release_dir / "dist"
+    added = 0
+    for entry in manifest["files"]:  # type: ignore[union-attr]
+        rel = str(entry["path"])
+        digest = str(entry["sha256"])
+        if not blob_path(digest).exists():
+            store_blob(DIST_DIR / rel, digest)
+            added += 1
+        link_blob(blob_path(digest), dist_path / rel)
+    total = len(manifest["files"])  # type: ignore[arg-type]
+    info(f"Blobs: {added} nuevos, {total - added} reutilizados")
+
+
+def create_integrity_manifest(
+    dist_path: Path, previous: dict[str, dict[str, object]] | None = None
+) -> dict[str, object]:
+    """Hash every file under dist_path, reusing `previous` digests for untouched files.
+
+    A file counts as untouched when its size and mtime match the previous entry.
+    """
+    previous = previous or {}
+    files: list[dict[str, object]] = []
+    pending: list[dict[str, object]] = []
     for file in sorted(dist_path.rglob("*")):
         if not file.is_file():
             continue
         rel = file.relative_to(dist_path).as_posix()
-        files.append(
-            {
-                "path": rel,
-                "sha256": sha256_file(file),
-                "bytes": file.stat().st_size,
-            }
-        )
+        stat = file.stat()
+        entry: dict[str, object] = {"path": rel, "sha256": None, "bytes": stat.st_size, "mtimeNs": stat.st_mtime_ns}
+        prior = previous.get(rel)
+        if prior and prior.get("bytes") == stat.st_size and prior.get("mtimeNs") == stat.st_mtime_ns:
+            entry["sha256"] = prior["sha256"]
+        else:
+            pending.append(entry)
+        files.append(entry)
+    digests = hash_files([dist_path / str(entry["path"]) for entry in pending])
+    for entry, digest in zip(pending, digests):
+        entry["sha256"] = digest
+    info(f"Manifiesto: {len(pending)} archivos hasheados, {len(files) - len(pending)} reutilizados")
     return {
         "algorithm": "sha256",
         "generatedAtUtc": dt.datetime.now(dt.timezone.utc).isoformat().replace("+00:00", "Z"),
@@ -255,12 +606,139 @@ def create_integrity_manifest(dist_path: Path) -> dict[str, object]:
     }
 
 
+def hash_files(paths: list[Path]) -> list[str]:
+    """sha256 of each path, in order. hashlib releases the GIL, so threads scale here."""
+    if len(paths) < 2:
+        return [sha256_file(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(HASH_WORKERS, len(paths))) as pool:
+        return list(pool.map(sha256_file, paths))
+
+
+def load_active_manifest_index() -> dict[str, dict[str, object]]:
+    """integrity.json entries of the active release, or {} when there is none yet."""
+    try:
+        data = json.loads(CURRENT_RELEASE_FILE.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+    name = data.get("release") if isinstance(data, dict) else None
+    if not name:
+        return {}
+    return load_release_index(RELEASES_DIR / str(name) / "dist")
+
+
+def verify_release(name: str | None = None) -> None:
+    """Re-hash a release (default: the active one) and compare it with its integrity.json."""
+    release_dir = RELEASES_DIR / name if name else get_current_release_dir().parent
+    manifest_file = release_dir / "integrity.json"
+    if not manifest_file.exists():
+        fail(f"La release no tiene integrity.json: {release_dir.name}")
+    manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+
+    expected: dict[Path, str] = {}
+    for entry in manifest.get("files", []):
+        expected[release_dir / "dist" / str(entry["path"])] = str(entry["sha256"])
+        for variant in (entry.get("encodings") or {}).values():
+            expected[release_dir / str(variant["path"])] = str(variant["sha256"])
+
+    present = [path for path in expected if path.is_file()]
+    missing = [path for path in expected if not path.is_file()]
+    digests = dict(zip(present, hash_files(present)))
+    mismatched = [path for path in present if digests[path] != expected[path]]
+    listed = set(expected)
+    # Walk every directory the manifest owns; a stray file in precompressed/ is as suspect as one
+    # in dist/.
+    extra = [
+        path
+        for owned in ("dist", PRECOMPRESSED_DIR_NAME)
+        for path in sorted((release_dir / owned).rglob("*"))
+        if path.is_file() and path not in listed
+    ]
+
+    for label, paths in (("falta", missing), ("hash distinto", mismatched), ("no listado", extra)):
+        for path in paths:
+            info(f"{label}: {path.relative_to(release_dir).as_posix()}")
+    if missing or mismatched or extra:
+        fail(f"Release {release_dir.name} no coincide con su manifiesto.")
+    info(f"Release {release_dir.name} verificada: {len(expected)} archivos OK")
+
+
+def load_zstd_compressor():
+    try:
+        from compression import zstd  # Python 3.14+
+
+        return lambda data: zstd.compress(data, level=19)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard.ZstdCompressor(level=19).compress
+
+
+def create_precompressed_variants(release_dir: Path, manifest: dict[str, object]) -> None:
+    """Write gzip/zstd sidecars for compressible files and record them in the manifest."""
+    compressors = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    zstd_compress = load_zstd_compressor()
+    if zstd_compress is not None:
+        compressors["zstd"] = zstd_compress
+    else:
+        info("zstd no disponible en este Python; solo se generan variantes gzip.")
+
+    dist_path = release_dir / "dist"
+    variants_root = release_dir / PRECOMPRESSED_DIR_NAME
+    created = 0
+    reused = 0
+    for entry in manifest["files"]:  # type: ignore[union-attr]
+        rel = str(entry["path"])
+        if Path(rel).suffix.lower() not in COMPRESSIBLE_SUFFIXES or int(entry["bytes"]) < PRECOMPRESS_MIN_BYTES:
+            continue
+        digest = str(entry["sha256"])
+        data: bytes | None = None
+        encodings: dict[str, dict[str, object]] = {}
+        for encoding, compress in compressors.items():
+            # Variants are keyed by the sha256 of the uncompressed file, so unchanged files
+            # never get recompressed.
+            suffix = ENCODING_SUFFIXES[encoding]
+            blob = blob_path(digest, suffix)
+            if blob.exists():
+                compressed = blob.read_bytes()
+                reused += 1
+            else:
+                if data is None:
+                    data = (dist_path / rel).read_bytes()
+                compressed = compress(data)
+                # Not worth a separate representation when it barely saves anything.
+                if len(compressed) >= len(data) * 0.95:
+                    continue
+                store_blob(compressed, digest, suffix)
+                created += 1
+            variant_rel = f"{PRECOMPRESSED_DIR_NAME}/{rel}{suffix}"
+            link_blob(blob, release_dir / variant_rel)
+            encodings[encoding] = {
+                "path": variant_rel,
+                "sha256": hashlib.sha256(compressed).hexdigest(),
+                "bytes": len(compressed),
+            }
+        if encodings:
+            entry["encodings"] = encodings
+    if created or reused:
+        info(
+            f"Variantes precomprimidas: {created} nuevas, {reused} reutilizadas "
+            f"en {variants_root.relative_to(release_dir).as_posix()}/"
+        )
+
+
 def set_current_release(name: str) -> None:
     payload = {
         "release": name,
         "updatedAtUtc": dt.datetime.now(dt.timezone.utc).isoformat().replace("+00:00", "Z"),
     }
-    CURRENT_RELEASE_FILE.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    # Write-then-rename so a concurrent reader never sees a half-written pointer file.
+    tmp_file = CURRENT_RELEASE_FILE.with_suffix(".json.tmp")
+    tmp_file.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    os.replace(tmp_file, CURRENT_RELEASE_FILE)
+    RELEASE_POINTER.activate(name)
 
 
 def get_current_release_dir() -> Path:
@@ -276,6 +754,374 @@ def get_current_release_dir() -> Path:
     return path
 
 
+def load_release_index(dist_path: Path) -> dict[str, dict[str, object]]:
+    """Map release-relative paths to their integrity.json entries."""
+    index: dict[str, dict[str, object]] = {}
+    try:
+        data = json.loads((dist_path.parent / "integrity.json").read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        data = {}
+    files = data.get("files", []) if isinstance(data, dict) else []
+    for entry in files:
+        if isinstance(entry, dict) and entry.get("path") and entry.get("sha256"):
+            index[str(entry["path"])] = entry
+    return index
+
+
+class ReleaseRoute(NamedTuple):
+    file_path: Path
+    sha256: str
+    cache_control: str
+    # encoding -> (precompressed file, sha256 of the compressed bytes)
+    variants: dict[str, tuple[Path, str]]
+
+
+class PackedAsset(NamedTuple):
+    body: bytes
+    # 200 response headers, as a list (asyncio engine) and pre-encoded (threading handler).
+    headers: list[tuple[str, str]]
+    header_block: bytes
+
+
+class AssetPack:
+    """Bodies and response headers of one release, read once when the release is activated.
+
+    Nothing frees a pack explicitly: the pointer and every request snapshot hold a reference,
+    so after a swap the old pack lives exactly until its last in-flight response is written.
+    """
+
+    _lock = threading.Lock()
+    live_packs = 0
+    live_bytes = 0
+
+    def __init__(self, assets: dict[Path, PackedAsset], on_disk: int) -> None:
+        self.assets = assets
+        self.on_disk = on_disk
+        self.size = sum(len(asset.body) for asset in assets.values())
+        AssetPack._account(1, self.size)
+        weakref.finalize(self, AssetPack._account, -1, -self.size)
+
+    def get(self, body_path: Path) -> PackedAsset | None:
+        return self.assets.get(body_path)
+
+    @classmethod
+    def _account(cls, packs: int, size: int) -> None:
+        with cls._lock:
+            cls.live_packs += packs
+            cls.live_bytes += size
+
+    @classmethod
+    def stats(cls) -> dict[str, object]:
+        with cls._lock:
+            return {"live": cls.live_packs, "bytes": cls.live_bytes}
+
+
+def pack_release_assets(routes: dict[str, ReleaseRoute], limit: int) -> AssetPack:
+    """Read a release into memory, smallest files first, up to `limit` bytes.
+
+    Files over ASSET_PACK_MAX_FILE_BYTES or past the cap stay on disk and are streamed as before.
+    """
+    representations: list[tuple[int, Path, Path, str, str | None, ReleaseRoute]] = []
+    for route in routes.values():
+        candidates = [(route.file_path, route.sha256, None)]
+        candidates += [(path, digest, encoding) for encoding, (path, digest) in route.variants.items()]
+        for body_path, digest, encoding in candidates:
+            try:
+                size = body_path.stat().st_size
+            except OSError:
+                continue
+            representations.append((size, body_path, route.file_path, digest, encoding, route))
+    representations.sort(key=lambda item: item[0])
+
+    assets: dict[Path, PackedAsset] = {}
+    used = on_disk = 0
+    for size, body_path, file_path, digest, encoding, route in representations:
+        if size > ASSET_PACK_MAX_FILE_BYTES or used + size > limit:
+            on_disk += 1
+            continue
+        try:
+            body = body_path.read_bytes()
+            mtime = body_path.stat().st_mtime
+        except OSError:
+            on_disk += 1
+            continue
+        headers = [("Content-Type", mimetypes.guess_type(str(file_path))[0] or "application/octet-stream")]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        headers += [
+            ("Content-Length", str(len(body))),
+            ("Last-Modified", email.utils.formatdate(mtime, usegmt=True)),
+            ("ETag", f'"{digest}"'),
+            ("Cache-Control", route.cache_control),
+        ]
+        if route.variants:
+            headers.append(("Vary", "Accept-Encoding"))
+        header_block = "".join(f"{key}: {value}\r\n" for key, value in headers).encode("latin-1")
+        assets[body_path] = PackedAsset(body, headers, header_block)
+        used += len(body)
+    return AssetPack(assets, on_disk)
+
+
+class ActiveRelease(NamedTuple):
+    name: str
+    root: Path
+    routes: dict[str, ReleaseRoute]
+    pack: AssetPack | None = None
+
+    def route_for(self, request_path: str) -> ReleaseRoute | None:
+        """Resolve a request path against the manifest, with the SPA index.html fallback."""
+        # Manifest paths are plain file names; the request path is percent-encoded.
+        rel = urllib.parse.unquote(urllib.parse.urlparse(request_path).path).lstrip("/")
+        route = self.routes.get(rel)
+        if route is None and "." not in rel.rsplit("/", 1)[-1]:
+            route = self.routes.get("index.html")
+        return route
+
+    def route_class(self, request_path: str) -> str:
+        """"spa" when route_for() answers with the index.html fallback, else "static"."""
+        rel = urllib.parse.unquote(urllib.parse.urlparse(request_path).path).lstrip("/") or "index.html"
+        return "static" if not self.routes or rel in self.routes else "spa"
+
+
+def load_active_release(name: str, pack_limit: int = 0) -> ActiveRelease:
+    """Build the routing table for a release once, so requests never touch integrity.json.
+
+    With pack_limit > 0 the release files are also preloaded into an AssetPack.
+    """
+    root = RELEASES_DIR / name / "dist"
+    routes: dict[str, ReleaseRoute] = {}
+    for rel, entry in load_release_index(root).items():
+        variants = {
+            encoding: (root.parent / str(variant["path"]), str(variant["sha256"]))
+            for encoding, variant in (entry.get("encodings") or {}).items()  # type: ignore[union-attr]
+            if encoding in ENCODING_SUFFIXES
+        }
+        routes[rel] = ReleaseRoute(root / rel, str(entry["sha256"]), cache_control_for(rel), variants)
+    return attach_asset_pack(ActiveRelease(name, root, routes), pack_limit)
+
+
+def attach_asset_pack(release: ActiveRelease, pack_limit: int) -> ActiveRelease:
+    """Copy of release with its files preloaded into an AssetPack (unchanged when pack_limit <= 0)."""
+    if pack_limit <= 0 or not release.routes:
+        return release
+    started = time.perf_counter()
+    pack = pack_release_assets(release.routes, pack_limit)
+    info(
+        f"Asset pack {release.name}: {len(pack.assets)} en memoria ({pack.size // 1024} KiB), "
+        f"{pack.on_disk} desde disco, {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    return release._replace(pack=pack)
+
+
+class ReleasePointer:
+    """Process-wide pointer to the active release.
+
+    Requests read the pointer once and keep that snapshot, so a swap never mixes two releases
+    inside one response. Edits made by another process (a CLI rollback, say) are picked up by
+    a stat of current-release.json at most once per check interval; the new release is served
+    from disk at once while its asset pack is built on a background thread and swapped in.
+    """
+
+    def __init__(self, check_interval: float = 1.0) -> None:
+        self.check_interval = check_interval
+        # Bytes of each release preloaded into memory; 0 (CLI commands) serves from disk only.
+        self.pack_limit = 0
+        # Called with the release name after every activation in this process.
+        self.listeners: list[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._active: ActiveRelease | None = None
+        self._state_mtime: int | None = None
+        self._next_check = 0.0
+
+    def current(self) -> ActiveRelease:
+        active = self._active
+        if active is not None and time.monotonic() < self._next_check:
+            return active
+        return self._refresh()
+
+    def cached(self) -> ActiveRelease | None:
+        """The active release when no re-check is due, else None; never touches the disk."""
+        active = self._active
+        if active is not None and time.monotonic() < self._next_check:
+            return active
+        return None
+
+    def activate(self, name: str) -> ActiveRelease:
+        active = load_active_release(name, self.pack_limit)
+        with self._lock:
+            self._active = active
+            self._state_mtime = self._stat_state()
+            self._next_check = time.monotonic() + self.check_interval
+        for listener in self.listeners:
+            listener(name)
+        return active
+
+    def set_pack_limit(self, limit: int) -> None:
+        """Change the asset pack budget; the active release is reloaded on the next request."""
+        with self._lock:
+            self.pack_limit = limit
+            self._active = None
+            self._next_check = 0.0
+
+    def invalidate(self) -> None:
+        """Re-check current-release.json on the next request (async-signal safe: one store)."""
+        self._next_check = 0.0
+
+    def _refresh(self) -> ActiveRelease:
+        with self._lock:
+            now = time.monotonic()
+            if self._active is not None and now < self._next_check:
+                return self._active
+            self._next_check = now + self.check_interval
+            mtime = self._stat_state()
+            if self._active is not None and mtime == self._state_mtime:
+                return self._active
+            name = get_current_release_dir().parent.name
+            if self._active is None:
+                # Startup: there is nothing else to serve yet.
+                self._active = load_active_release(name, self.pack_limit)
+            elif self._active.name != name:
+                info(f"Release activa cambiada externamente: {name}")
+                # Loading a pack can take up to --asset-pack-mb of reads; keep it off the request.
+                self._active = load_active_release(name)
+                self._load_pack_later(self._active)
+            self._state_mtime = mtime
+            return self._active
+
+    def _load_pack_later(self, release: ActiveRelease) -> None:
+        if self.pack_limit <= 0 or not release.routes:
+            return
+
+        def load() -> None:
+            packed = attach_asset_pack(release, self.pack_limit)
+            with self._lock:
+                # A newer swap (or set_pack_limit) while loading wins over this pack.
+                if self._active is release:
+                    self._active = packed
+
+        threading.Thread(target=load, name=f"asset-pack-{release.name}", daemon=True).start()
+
+    @staticmethod
+    def _stat_state() -> int | None:
+        try:
+            return CURRENT_RELEASE_FILE.stat().st_mtime_ns
+        except OSError:
+            return None
+
+
+RELEASE_POINTER = ReleasePointer()
+
+
+def resolve_release_path(root: Path, request_path: str) -> Path:
+    """Filesystem lookup for releases created before integrity manifests existed."""
+    clean = urllib.parse.unquote(urllib.parse.urlparse(request_path).path)
+    clean = clean.lstrip("/")
+    target = (root / clean).resolve()
+    if not target.is_relative_to(root.resolve()):
+        return root / "index.html"
+    if target.exists():
+        return target
+    if "." not in clean:
+        return root / "index.html"
+    return target
+
+
+def open_static_body(path: Path, first_bytes: int) -> tuple[io.BufferedReader | None, os.stat_result, bytes]:
+    """Open, stat and read the first chunk of a file in one call (one thread hop for the asyncio engine).
+
+    The handle is returned open only when the file is longer than that first chunk.
+    """
+    handle = path.open("rb")
+    try:
+        stat = os.fstat(handle.fileno())
+        first = handle.read(first_bytes) if first_bytes > 0 else b""
+    except BaseException:
+        handle.close()
+        raise
+    if first_bytes <= 0 or len(first) >= stat.st_size:
+        handle.close()
+        return None, stat, first
+    return handle, stat, first
+
+
+class StaticRepresentation(NamedTuple):
+    file_path: Path
+    body_path: Path
+    encoding: str | None
+    etag: str
+    headers: list[tuple[str, str]]
+    packed: PackedAsset | None = None
+
+
+def select_static_representation(
+    release: ActiveRelease, request_path: str, accept_encoding: str | None
+) -> StaticRepresentation | None:
+    """Pick the file (or precompressed variant) to send for a release path.
+
+    Returns None for paths missing from the release routing table.
+    """
+    route = release.route_for(request_path)
+    if route is None:
+        return None
+    encoding = choose_encoding(accept_encoding, route.variants)
+    if encoding:
+        body_path, digest = route.variants[encoding]
+    else:
+        body_path, digest = route.file_path, route.sha256
+    # The integrity manifest already has a strong validator for every representation.
+    etag = f'"{digest}"'
+    headers = [("ETag", etag), ("Cache-Control", route.cache_control)]
+    if route.variants:
+        headers.append(("Vary", "Accept-Encoding"))
+    packed = release.pack.get(body_path) if release.pack else None
+    return StaticRepresentation(route.file_path, body_path, encoding, etag, headers, packed)
+
+
+def cache_control_for(rel_path: str) -> str:
+    if rel_path.startswith("assets/"):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+def choose_encoding(accept_encoding: str | None, available: dict[str, tuple[Path, str]]) -> str | None:
+    if not accept_encoding or not available:
+        return None
+    weights: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        weights[coding] = quality
+    best: str | None = None
+    best_quality = 0.0
+    for coding in ENCODING_SUFFIXES:
+        if coding not in available:
+            continue
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    # If-None-Match uses weak comparison (RFC 9110 13.1.2).
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
 def append_history(entry: dict[str, object]) -> None:
     data = []
     if DEPLOY_HISTORY_FILE.exists():
@@ -305,30 +1151,160 @@ def rollback_release(steps_back: int = 1) -> None:
     info(f"Rollback aplicado. Release activa: {release_name}")
 
 
-def source_snapshot_hash() -> str:
-    include_dirs = ["src", "server", "public"]
-    include_files = ["package.json", "package-lock.json", "vite.config.js", ".env"]
-    digest = hashlib.sha256()
-    for rel in include_dirs:
+def gc_release_store(keep: int | None = None) -> None:
+    """Drop blobs no retained release references; with keep, prune older releases first.
+
+    The active release and the last `keep` releases of the deploy history are retained.
+    """
+    with release_store_lock():
+        _gc_release_store(keep)
+
+
+def _gc_release_store(keep: int | None) -> None:
+    if keep is not None:
+        if keep < 1:
+            fail("--keep debe ser >= 1")
+        retained: set[str] = set()
+        if CURRENT_RELEASE_FILE.exists():
+            retained.add(get_current_release_dir().parent.name)
+        history = []
+        if DEPLOY_HISTORY_FILE.exists():
+            try:
+                history = json.loads(DEPLOY_HISTORY_FILE.read_text(encoding="utf-8"))
+            except json.JSONDecodeError:
+                history = []
+        if isinstance(history, list):
+            retained.update(str(item.get("release")) for item in history[-keep:] if isinstance(item, dict))
+        for release_dir in sorted(RELEASES_DIR.iterdir()):
+            if release_dir.is_dir() and release_dir.name not in retained:
+                shutil.rmtree(release_dir)
+                info(f"Release eliminada: {release_dir.name}")
+
+    referenced: set[str] = set()
+    for manifest_file in RELEASES_DIR.glob("*/integrity.json"):
+        try:
+            manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            fail(f"Manifiesto ilegible, se cancela gc: {manifest_file}")
+        referenced.update(str(entry.get("sha256")) for entry in manifest.get("files", []))
+
+    removed = 0
+    recent = 0
+    freed = 0
+    cutoff = time.time() - BLOB_GC_GRACE_SECONDS
+    for blob in BLOBS_DIR.glob("*/*"):
+        # Precompressed variants share the digest of the file they were made from.
+        if blob.name.split(".", 1)[0] in referenced and not blob.name.endswith(".tmp"):
+            continue
+        try:
+            stat = blob.stat()
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime > cutoff:
+            recent += 1
+            continue
+        freed += stat.st_size
+        blob.unlink(missing_ok=True)
+        removed += 1
+    kept_note = f" ({recent} recientes conservados)" if recent else ""
+    info(f"gc: {removed} blobs eliminados, {freed / (1024 * 1024):.1f} MiB liberados{kept_note}")
+
+
+_api_runtime_dirs: tuple[str, ...] | None = None
+
+
+def api_runtime_dirs() -> tuple[str, ...]:
+    """Project-relative dirs the API writes at runtime (resolved once, like the API does at boot)."""
+    global _api_runtime_dirs
+    if _api_runtime_dirs is None:
+        dirs = list(API_RUNTIME_DIRS)
+        # dotenv never overrides the real environment, so os.environ wins over .env.
+        backup_dir = os.environ.get("BACKUP_DIR") or read_dotenv(ROOT / ".env").get("BACKUP_DIR")
+        if backup_dir:
+            path = Path(backup_dir)
+            # The API runs with cwd=ROOT, so relative paths are relative to the project root.
+            path = (path if path.is_absolute() else ROOT / path).resolve()
+            with contextlib.suppress(ValueError):
+                rel = path.relative_to(ROOT.resolve()).as_posix()
+                if rel != ".":
+                    dirs.append(rel)
+        _api_runtime_dirs = tuple(dirs)
+    return _api_runtime_dirs
+
+
+def is_api_runtime_path(rel_path: str) -> bool:
+    return any(rel_path == top or rel_path.startswith(f"{top}/") for top in api_runtime_dirs())
+
+
+def is_ignored_change(rel_path: str) -> bool:
+    if is_api_runtime_path(rel_path):
+        return True
+    parts = rel_path.split("/")
+    if any(part in WATCH_IGNORED_DIRS for part in parts):
+        return True
+    name = parts[-1]
+    return (
+        name in WATCH_IGNORED_NAMES
+        or name.startswith(WATCH_IGNORED_PREFIXES)
+        or name.endswith(WATCH_IGNORED_SUFFIXES)
+    )
+
+
+def prune_watched_dirs(current: str, dirnames: list[str]) -> None:
+    """os.walk() filter: skip tool dirs and the API's runtime data dirs."""
+    dirnames[:] = [
+        name
+        for name in dirnames
+        if name not in WATCH_IGNORED_DIRS
+        and not is_api_runtime_path((Path(current) / name).relative_to(ROOT).as_posix())
+    ]
+
+
+def source_snapshot() -> dict[str, tuple[int, int]]:
+    """Map watched source paths (relative to ROOT) to (mtime_ns, size)."""
+    snapshot: dict[str, tuple[int, int]] = {}
+    candidates: list[Path] = [ROOT / rel for rel in WATCH_FILES]
+    for rel in WATCH_DIRS:
         root = ROOT / rel
         if not root.exists():
             continue
-        for file in sorted(root.rglob("*")):
-            if not file.is_file():
-                continue
-            digest.update(file.relative_to(ROOT).as_posix().encode("utf-8"))
-            digest.update(str(file.stat().st_mtime_ns).encode("utf-8"))
-    for rel in include_files:
-        file = ROOT / rel
-        if not file.exists():
+        for current, dirnames, filenames in os.walk(root):
+            prune_watched_dirs(current, dirnames)
+            candidates.extend(Path(current) / name for name in filenames)
+    for file in candidates:
+        rel_path = file.relative_to(ROOT).as_posix()
+        if is_ignored_change(rel_path):
             continue
-        digest.update(file.relative_to(ROOT).as_posix().encode("utf-8"))
-        digest.update(str(file.stat().st_mtime_ns).encode("utf-8"))
-    return digest.hexdigest()
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        if not file.is_dir():
+            snapshot[rel_path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
 
 
-def maybe_build_and_deploy() -> Path:
+def maybe_build_and_deploy(use_cache: bool = True) -> Path:
+    # Hashed before building: an edit made during the build changes the next hash, so a
+    # release is never recorded under inputs newer than the ones it was built from.
+    input_hash = build_input_hash()
+    cached = find_release_for_inputs(input_hash) if use_cache else None
+    if cached:
+        return reuse_release(cached, input_hash)
     build_frontend()
+    return create_release(input_hash)
+
+
+def release_watch_build() -> Path:
+    """on_build for vite build --watch: reuse a release with identical inputs, else create one.
+
+    vite rebuilt on its own schedule, so dist/ may lag the sources hashed now; the new
+    release is therefore not recorded under an input hash.
+    """
+    input_hash = build_input_hash()
+    cached = find_release_for_inputs(input_hash)
+    if cached:
+        return reuse_release(cached, input_hash)
     return create_release()
 
 
@@ -336,178 +1312,2855 @@ class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
     daemon_threads = True
 
 
-def make_handler(api_origin: str | None):
-    class SecureHandler(http.server.SimpleHTTPRequestHandler):
-        def translate_path(self, path: str) -> str:
-            root = get_current_release_dir()
-            clean = urllib.parse.urlparse(path).path
-            clean = clean.lstrip("/")
-            target = root / clean
-            if target.exists():
-                return str(target)
-            if "." not in clean:
-                return str(root / "index.html")
-            return str(target)
+class TLSHandshakeStats:
+    """Thread-safe handshake counters plus a bounded window of recent handshake latencies."""
 
-        def end_headers(self) -> None:
-            self.send_header("Strict-Transport-Security", "max-age=31536000")
-            self.send_header("X-Content-Type-Options", "nosniff")
-            self.send_header("X-Frame-Options", "DENY")
-            self.send_header("Referrer-Policy", "no-referrer")
-            self.send_header("Permissions-Policy", "camera=(), microphone=(), geolocation=()")
-            self.send_header(
-                "Content-Security-Policy",
-                "default-src 'self'; "
-                "script-src 'self'; "
-                "style-src 'self' 'unsafe-inline'; "
-                "img-src 'self' data:; "
-                "connect-src 'self' https: wss:; "
-                "font-src 'self' data:; "
-                "object-src 'none'; base-uri 'self'; frame-ancestors 'none'",
-            )
-            super().end_headers()
+    def __init__(self, window: int = 2048) -> None:
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=window)
+        self.handshakes = 0
+        self.resumed = 0
+        self.failed = 0
 
-        def do_GET(self) -> None:  # noqa: N802
-            if api_origin and self.path.startswith("/api/"):
-                self.proxy_to_api()
-                return
-            super().do_GET()
+    def record(self, seconds: float | None, resumed: bool) -> None:
+        with self._lock:
+            self.handshakes += 1
+            if resumed:
+                self.resumed += 1
+            if seconds is not None:
+                self._latencies.append(seconds)
 
-        def do_POST(self) -> None:  # noqa: N802
-            if api_origin and self.path.startswith("/api/"):
-                self.proxy_to_api()
-                return
-            self.send_error(404, "Not found")
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failed += 1
 
-        def do_PUT(self) -> None:  # noqa: N802
-            if api_origin and self.path.startswith("/api/"):
-                self.proxy_to_api()
-                return
-            self.send_error(404, "Not found")
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            data: dict[str, object] = {
+                "handshakes": self.handshakes,
+                "resumed": self.resumed,
+                "failed": self.failed,
+                "resumptionRate": round(self.resumed / self.handshakes, 3) if self.handshakes else 0.0,
+            }
+        if latencies:
+            data["p50Ms"] = round(latencies[len(latencies) // 2] * 1000, 2)
+            data["p99Ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2)
+        return data
 
-        def do_DELETE(self) -> None:  # noqa: N802
-            if api_origin and self.path.startswith("/api/"):
-                self.proxy_to_api()
-                return
-            self.send_error(404, "Not found")
 
-        def do_PATCH(self) -> None:  # noqa: N802
-            if api_origin and self.path.startswith("/api/"):
-                self.proxy_to_api()
-                return
-            self.send_error(404, "Not found")
+def build_server_tls_context(cert_pairs: list[tuple[Path, Path]], *, session_tickets: int) -> ssl.SSLContext:
+    """Server context serving every given certificate; OpenSSL picks RSA or ECDSA per client."""
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    for cert_file, key_file in cert_pairs:
+        context.load_cert_chain(certfile=str(cert_file), keyfile=str(key_file))
+    if session_tickets > 0:
+        # Stateless resumption: returning clients skip the certificate signature entirely.
+        context.options &= ~ssl.OP_NO_TICKET
+        context.num_tickets = session_tickets
+    else:
+        context.options |= ssl.OP_NO_TICKET
+        context.num_tickets = 0
+    return context
 
-        def do_OPTIONS(self) -> None:  # noqa: N802
-            if api_origin and self.path.startswith("/api/"):
-                self.proxy_to_api()
-                return
-            super().do_OPTIONS()
 
-        def proxy_to_api(self) -> None:
-            assert api_origin is not None
-            parsed = urllib.parse.urlparse(api_origin)
-            conn_cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
-            request_path = urllib.parse.urlparse(self.path).path
-            is_sse_request = request_path.endswith("/sync/events")
+class TLSThreadingHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that runs TLS handshakes on the per-connection thread.
 
-            def safe_send_error(status: int, message: str) -> None:
-                try:
-                    self.send_error(status, message)
-                except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError) as exc:
-                    info(f"proxy_to_api: client disconnected before error response ({exc})")
+    Wrapping the listening socket would handshake inside accept(), serializing every
+    handshake on the serve_forever thread; here accept() only wraps, and the handshake
+    is timed on the worker thread.
+    """
 
-            body = None
-            length = int(self.headers.get("Content-Length", "0"))
-            if length > 0:
-                body = self.rfile.read(length)
+    handshake_timeout = 10.0
 
-            headers = {}
-            for key, value in self.headers.items():
-                lower = key.lower()
-                if lower in ("host", "connection", "content-length", "accept-encoding"):
-                    continue
-                headers[key] = value
-            headers["Host"] = parsed.netloc
-            headers["X-Forwarded-Proto"] = "https"
+    def __init__(
+        self,
+        server_address,
+        handler_class,
+        ssl_context: ssl.SSLContext,
+        tls_stats: TLSHandshakeStats,
+        listen_socket: socket.socket | None = None,
+    ) -> None:
+        self.ssl_context = ssl_context
+        self.tls_stats = tls_stats
+        # Handshake time of the connection being served on the current thread (access log).
+        self.handshakes = threading.local()
+        if listen_socket is None:
+            super().__init__(server_address, handler_class)
+            return
+        # Prefork worker: serve on a socket that is already bound and listening.
+        super().__init__(server_address, handler_class, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listen_socket
+        self.server_address = listen_socket.getsockname()
+        self.server_name = "localhost"
+        self.server_port = self.server_address[1]
+
+    def get_request(self):
+        sock, address = self.socket.accept()
+        # A socket shared by prefork workers is non-blocking (losers of the accept race must not
+        # block), and on BSDs accepted sockets inherit that flag.
+        sock.setblocking(True)
+        return self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False), address
+
+    def finish_request(self, request, client_address) -> None:
+        started = time.perf_counter()
+        profiled = PROFILER.begin("tls")
+        try:
+            request.settimeout(self.handshake_timeout)
+            request.do_handshake()
+        except (ssl.SSLError, OSError):
+            self.tls_stats.record_failure()
+            return
+        finally:
+            if profiled:
+                PROFILER.end()
+        self.handshakes.seconds = time.perf_counter() - started
+        self.tls_stats.record(self.handshakes.seconds, request.session_reused)
+        super().finish_request(request, client_address)
+
+
+class KeepAliveHandlerMixin:
+    """HTTP/1.1 persistent connections for BaseHTTPRequestHandler subclasses.
+
+    Waiting for the next request uses ``keepalive_timeout`` and ends silently; reads and
+    writes inside a request use ``request_timeout``. After ``max_keepalive_requests`` the
+    response carries ``Connection: close``.
+    """
+
+    protocol_version = "HTTP/1.1"
+    keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT_SECONDS
+    request_timeout: float = DEFAULT_REQUEST_TIMEOUT_SECONDS
+    max_keepalive_requests: int = DEFAULT_MAX_KEEPALIVE_REQUESTS
+    requests_on_connection = 0
+
+    def handle_one_request(self) -> None:
+        self.requests_on_connection += 1
+        if self.requests_on_connection > 1:
+            self.connection.settimeout(self.keepalive_timeout)
+            try:
+                # Blocks until the next request starts (or returns pipelined bytes already buffered).
+                ready = self.rfile.peek(1)
+            except OSError:
+                ready = b""
+            if not ready:
+                self.close_connection = True
+                return
+        self.connection.settimeout(self.request_timeout)
+        super().handle_one_request()
+
+    def end_headers(self) -> None:
+        if not self.close_connection and self.requests_on_connection >= self.max_keepalive_requests:
+            self.send_header("Connection", "close")
+        super().end_headers()
+
+    def has_request_body(self) -> bool:
+        headers = getattr(self, "headers", None)
+        if headers is None:
+            return False
+        return headers.get("Transfer-Encoding") is not None or headers.get("Content-Length", "0") not in ("", "0")
+
+    def send_error(self, code: int, message: str | None = None, explain: str | None = None) -> None:
+        # The stdlib always closes after an error page; a bodiless GET/HEAD that hits a 404
+        # can keep its connection, which matters for missing assets under keep-alive.
+        if code not in (404, 405) or self.command not in ("GET", "HEAD") or self.has_request_body():
+            super().send_error(code, message, explain)
+            return
+        short, long = self.responses.get(code, ("???", "???"))
+        message = short if message is None else message
+        explain = long if explain is None else explain
+        self.log_error("code %d, message %s", code, message)
+        body = (
+            self.error_message_format
+            % {
+                "code": code,
+                "message": html.escape(message, quote=False),
+                "explain": html.escape(explain, quote=False),
+            }
+        ).encode("UTF-8", "replace")
+        self.send_response(code, message)
+        self.send_header("Content-Type", self.error_content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+class UpstreamPool:
+    """Bounded, thread-safe pool of keep-alive HTTP/1.1 connections to API upstreams.
+
+    All HTTPS connections share one client TLS context. Idle connections are reused
+    newest-first and evicted once idle for too long or when the upstream closed them.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_per_upstream: int = UPSTREAM_MAX_CONNECTIONS,
+        idle_timeout: float = UPSTREAM_IDLE_TIMEOUT_SECONDS,
+        timeout: float = UPSTREAM_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_per_upstream = max_per_upstream
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle: dict[str, list[tuple[http.client.HTTPConnection, float]]] = {}
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+        self._in_use: dict[str, int] = {}
+        self._contexts: dict[bool, ssl.SSLContext] = {}
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "retries": 0, "discarded": 0, "dedicated": 0}
+
+    def tls_context(self, local: bool) -> ssl.SSLContext:
+        with self._lock:
+            context = self._contexts.get(local)
+            if context is None:
+                if local:
+                    # Allow local self-signed certs used by the secure local deploy.
+                    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                else:
+                    context = ssl.create_default_context()
+                self._contexts[local] = context
+            return context
+
+    def connect(self, origin: str, *, timeout: float | None) -> http.client.HTTPConnection:
+        parsed = urllib.parse.urlparse(origin)
+        if parsed.scheme == "https":
+            local = bool(parsed.hostname and parsed.hostname.lower() in LOCAL_HOSTNAMES)
+            return http.client.HTTPSConnection(
+                parsed.hostname, parsed.port, timeout=timeout, context=self.tls_context(local)
+            )
+        return http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=timeout)
+
+    def open_socket(self, origin: str, *, timeout: float | None) -> socket.socket:
+        """Raw (TLS-wrapped for https) socket to the upstream, used for WebSocket tunnels."""
+        parsed = urllib.parse.urlparse(origin)
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        sock = socket.create_connection((parsed.hostname, port), timeout=timeout)
+        if parsed.scheme != "https":
+            return sock
+        local = bool(parsed.hostname and parsed.hostname.lower() in LOCAL_HOSTNAMES)
+        try:
+            return self.tls_context(local).wrap_socket(sock, server_hostname=parsed.hostname)
+        except Exception:
+            sock.close()
+            raise
+
+    def open_dedicated(self, origin: str, *, timeout: float | None) -> http.client.HTTPConnection:
+        """Unpooled connection for long-lived streams (SSE) that must not hold a pool slot."""
+        self.record("dedicated")
+        return self.connect(origin, timeout=timeout)
+
+    def acquire(self, origin: str) -> tuple[http.client.HTTPConnection, bool]:
+        """Return ``(connection, reused)``; blocks while the upstream is at its connection cap."""
+        with self._lock:
+            slots = self._slots.get(origin)
+            if slots is None:
+                slots = self._slots[origin] = threading.BoundedSemaphore(self.max_per_upstream)
+        if not slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"upstream pool exhausted for {origin}")
+        stale: list[http.client.HTTPConnection] = []
+        connection = None
+        now = time.monotonic()
+        with self._lock:
+            self._in_use[origin] = self._in_use.get(origin, 0) + 1
+            idle = self._idle.get(origin, [])
+            while idle:
+                candidate, since = idle.pop()
+                if now - since <= self.idle_timeout and self._is_alive(candidate):
+                    connection = candidate
+                    break
+                stale.append(candidate)
+            self._counters["evictions"] += len(stale)
+            self._counters["hits" if connection else "misses"] += 1
+        for old in stale:
+            old.close()
+        if connection is not None:
+            return connection, True
+        return self.connect(origin, timeout=self.timeout), False
+
+    def release(self, origin: str, connection: http.client.HTTPConnection, *, reusable: bool) -> None:
+        with self._lock:
+            self._in_use[origin] = max(0, self._in_use.get(origin, 0) - 1)
+            if reusable and connection.sock is not None:
+                self._idle.setdefault(origin, []).append((connection, time.monotonic()))
+                connection = None
+            else:
+                self._counters["discarded"] += 1
+            slots = self._slots[origin]
+        if connection is not None:
+            connection.close()
+        slots.release()
+
+    def note_retry(self) -> None:
+        self.record("retries")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            data = dict(self._counters)
+            data["idle"] = sum(len(items) for items in self._idle.values())
+            data["inUse"] = sum(self._in_use.values())
+        return data
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for items in idle.values():
+            for connection, _since in items:
+                connection.close()
+
+    def forget(self, origin: str) -> None:
+        """Close idle connections to an origin that has been retired."""
+        with self._lock:
+            idle = self._idle.pop(origin, [])
+        for connection, _since in idle:
+            connection.close()
+
+    def record(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    @staticmethod
+    def _is_alive(connection: http.client.HTTPConnection) -> bool:
+        sock = connection.sock
+        if sock is None:
+            return False
+        try:
+            # An idle keep-alive socket only turns readable when the upstream closed it.
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+
+def is_pinned_api_request(path: str) -> bool:
+    """Requests that must reach the home API worker rather than the least busy one.
+
+    Only sync streams and QR challenges keep their state in one Node process's memory. Writes
+    are balanced like reads: server/store.js serializes commits to the JSON store across
+    workers, the sync hub relays events between them, and each worker takes its share of the
+    rate limit.
+    """
+    path = urllib.parse.urlparse(path).path
+    return "/sync/" in path or "/qr/" in path
+
+
+class ApiUpstreams:
+    """The API origins proxied requests go to, with in-flight counts and health per origin.
+
+    Balanced requests go to the healthy origin with the fewest outstanding requests; pinned ones
+    to the first healthy origin (the home worker). replace() swaps origins atomically: requests
+    (and SSE/WebSocket streams) that already picked an origin finish there, which is what lets a
+    retired origin drain.
+
+    Every origin that can ever become active is listed up front in `candidates`, so the state is
+    a few integer arrays. With shared=True they live in shared memory behind a process lock and
+    stay consistent across prefork frontend workers.
+    """
+
+    def __init__(self, origins: list[str], *, candidates: list[str] | None = None, shared: bool = False) -> None:
+        self._candidates = list(candidates or origins)
+        size = len(self._candidates)
+        if shared:
+            context = multiprocessing.get_context("fork")
+            self._lock = context.Lock()
+            self._active = context.RawArray("i", [self._candidates.index(origin) for origin in origins])
+            self._unhealthy = context.RawArray("b", size)
+            self._inflight = context.RawArray("q", size)
+            self._served = context.RawArray("q", size)
+        else:
+            self._lock = threading.Lock()
+            self._active = [self._candidates.index(origin) for origin in origins]
+            self._unhealthy = [0] * size
+            self._inflight = [0] * size
+            self._served = [0] * size
+        self._turn = 0
+
+    @property
+    def origins(self) -> list[str]:
+        return [self._candidates[index] for index in self._active]
+
+    def acquire(self, *, pinned: bool = False) -> str:
+        with self._lock:
+            active = list(self._active)
+            candidates = [index for index in active if not self._unhealthy[index]] or active
+            if pinned or len(candidates) == 1:
+                chosen = candidates[0]
+            else:
+                # Rotate the starting point so ties do not always land on the first worker.
+                self._turn = (self._turn + 1) % len(candidates)
+                rotated = candidates[self._turn :] + candidates[: self._turn]
+                chosen = min(rotated, key=lambda index: self._inflight[index])
+            self._inflight[chosen] += 1
+            self._served[chosen] += 1
+        return self._candidates[chosen]
+
+    def release(self, origin: str) -> None:
+        index = self._candidates.index(origin)
+        with self._lock:
+            self._inflight[index] -= 1
+
+    def replace(self, old: str, new: str) -> None:
+        old_index, new_index = self._candidates.index(old), self._candidates.index(new)
+        with self._lock:
+            self._active[list(self._active).index(old_index)] = new_index
+            self._unhealthy[new_index] = 0
+
+    def replace_all(self, origins: list[str]) -> list[str]:
+        indexes = [self._candidates.index(origin) for origin in origins]
+        with self._lock:
+            previous = [self._candidates[index] for index in self._active]
+            for slot, index in enumerate(indexes):
+                self._active[slot] = index
+                self._unhealthy[index] = 0
+        return previous
+
+    def set_healthy(self, origin: str, healthy: bool) -> None:
+        index = self._candidates.index(origin)
+        with self._lock:
+            was_unhealthy = self._unhealthy[index]
+            self._unhealthy[index] = 0 if healthy else 1
+        if not healthy and not was_unhealthy:
+            info(f"API {origin} fuera de rotacion (no saludable).")
+
+    def wait_drained(self, origin: str, timeout: float) -> bool:
+        index = self._candidates.index(origin)
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._inflight[index]:
+                    return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+
+    def stats(self) -> dict[str, str]:
+        with self._lock:
+            return {
+                self._candidates[index].rsplit(":", 1)[-1]: (
+                    f"inflight:{self._inflight[index]},served:{self._served[index]},"
+                    f"{'down' if self._unhealthy[index] else 'up'}"
+                )
+                for index in self._active
+            }
+
+
+class MalformedChunkedBody(ValueError):
+    """A ``Transfer-Encoding: chunked`` body that does not follow the chunk framing."""
+
+
+class ClientBodyError(Exception):
+    """Reading the request body from the client failed (disconnect or timeout) while proxying it."""
+
+
+def client_body(chunks):
+    """Re-raise client-side read failures as ClientBodyError so they are not blamed on the upstream."""
+    try:
+        yield from chunks
+    except OSError as exc:
+        raise ClientBodyError(str(exc) or type(exc).__name__) from exc
+
+
+def iter_fixed_body(rfile, length: int, chunk_size: int = PROXY_STREAM_CHUNK_BYTES):
+    remaining = length
+    while remaining > 0:
+        chunk = rfile.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ConnectionResetError("client closed the connection mid-body")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def iter_chunked_body(rfile, chunk_size: int = PROXY_STREAM_CHUNK_BYTES):
+    """Decode a ``Transfer-Encoding: chunked`` request body, yielding at most chunk_size bytes at a time."""
+    while True:
+        line = rfile.readline(1024)
+        if not line:
+            raise ConnectionResetError("client closed the connection mid-body")
+        if not line.endswith(b"\n"):
+            raise MalformedChunkedBody("malformed chunk size line")
+        size_text = line.split(b";", 1)[0].strip()
+        try:
+            size = int(size_text, 16)
+        except ValueError:
+            raise MalformedChunkedBody("malformed chunk size line") from None
+        if size < 0:
+            raise MalformedChunkedBody("malformed chunk size line")
+        if size == 0:
+            # Discard trailers up to the terminating blank line.
+            while True:
+                trailer = rfile.readline(8192)
+                if not trailer or trailer in (b"\r\n", b"\n"):
+                    return
+        yield from iter_fixed_body(rfile, size, chunk_size)
+        if rfile.readline(3) not in (b"\r\n", b"\n"):
+            raise MalformedChunkedBody("missing CRLF after chunk data")
+
+
+def read_upgrade_head(sock: socket.socket) -> tuple[bytes, bytes]:
+    """Read an HTTP response head byte-exactly; return ``(head, bytes_already_read_past_it)``."""
+    buffer = b""
+    while b"\r\n\r\n" not in buffer:
+        if len(buffer) > MAX_UPGRADE_HEAD_BYTES:
+            raise ValueError("upstream upgrade response head too large")
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise ConnectionResetError("upstream closed during upgrade handshake")
+        buffer += chunk
+    end = buffer.index(b"\r\n\r\n") + 4
+    return buffer[:end], buffer[end:]
+
+
+def splice_sockets(client: socket.socket, upstream: socket.socket, idle_timeout: float) -> str:
+    """Copy bytes both ways until one side closes or nothing moves for idle_timeout seconds."""
+    peers = {client: upstream, upstream: client}
+    for sock in peers:
+        sock.settimeout(idle_timeout)
+    while True:
+        # TLS sockets may hold decrypted bytes that select() cannot see.
+        ready = [sock for sock in peers if isinstance(sock, ssl.SSLSocket) and sock.pending()]
+        if not ready:
+            ready, _, _ = select.select(list(peers), [], [], idle_timeout)
+            if not ready:
+                return "idle timeout"
+        for sock in ready:
+            try:
+                data = sock.recv(PROXY_STREAM_CHUNK_BYTES)
+            except (ssl.SSLWantReadError, socket.timeout):
+                continue
+            except OSError as exc:
+                return f"recv error ({exc})"
+            if not data:
+                return "client closed" if sock is client else "upstream closed"
+            try:
+                peers[sock].sendall(data)
+            except OSError as exc:
+                return f"send error ({exc})"
+
+
+class RequestRecord:
+    """What one request did, filled in while it is handled and read once it is done."""
+
+    __slots__ = (
+        "started",
+        "duration",
+        "route",
+        "status",
+        "method",
+        "path",
+        "client",
+        "upstream_seconds",
+        "upstream_error",
+        "tls_seconds",
+        "bytes_in",
+        "bytes_out",
+    )
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.duration = 0.0
+        self.route = "other"
+        self.status = 0
+        self.method = "-"
+        self.path = "-"
+        self.client = "-"
+        self.upstream_seconds: float | None = None
+        # "ssl", "connection" or "invalid" when the upstream exchange failed (-> 502).
+        self.upstream_error: str | None = None
+        # Handshake time, on the first request of a connection only.
+        self.tls_seconds: float | None = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+class CountingSocketIO(socket.SocketIO):
+    """Raw reader under a handler's rfile that counts bytes received from the client."""
+
+    received = 0
+
+    def readinto(self, b) -> int | None:  # type: ignore[override]
+        count = super().readinto(b)
+        if count:
+            self.received += count
+        return count
+
+
+class CountingWriter(io.BufferedIOBase):
+    """Handler wfile wrapper that counts bytes sent to the client."""
+
+    def __init__(self, raw) -> None:
+        self.raw = raw
+        self.sent = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore[override]
+        self.raw.write(data)
+        size = memoryview(data).nbytes
+        self.sent += size
+        return size
+
+    def fileno(self) -> int:
+        return self.raw.fileno()
+
+
+class CountingStreamReader:
+    """asyncio StreamReader wrapper that counts bytes received from the client."""
+
+    def __init__(self, reader: asyncio.StreamReader) -> None:
+        self._reader = reader
+        self.received = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self._reader, name)
+
+    async def read(self, n: int = -1) -> bytes:
+        data = await self._reader.read(n)
+        self.received += len(data)
+        return data
+
+    async def readline(self) -> bytes:
+        data = await self._reader.readline()
+        self.received += len(data)
+        return data
+
+    async def readexactly(self, n: int) -> bytes:
+        data = await self._reader.readexactly(n)
+        self.received += len(data)
+        return data
+
+    async def readuntil(self, separator: bytes = b"\n") -> bytes:
+        data = await self._reader.readuntil(separator)
+        self.received += len(data)
+        return data
+
+
+class CountingStreamWriter:
+    """asyncio StreamWriter wrapper that counts bytes sent to the client."""
+
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self._writer = writer
+        self.sent = 0
+
+    def __getattr__(self, name: str):
+        return getattr(self._writer, name)
+
+    def write(self, data: bytes) -> None:
+        self.sent += len(data)
+        self._writer.write(data)
+
+
+class DeployMetrics:
+    """Counters behind the optional /__deploy/metrics endpoint (Prometheus text format).
+
+    Every value is a float at a fixed offset of a flat list. Request threads only ever write
+    their own list (a "shard", reached through a threading.local), so the hot path takes no
+    lock; a scrape sums the shards, folding those of finished connection threads into
+    `_retired`. With prefork workers each process also publishes its totals once a second into
+    its slot of a shared array, and a scrape adds the other workers' slots, so whichever worker
+    answers reports for all of them. Watch stage durations are rare and use a lock.
+    """
+
+    ROUTES = ("static", "spa", "api", "sse", "websocket", "other")
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    UPSTREAM_ERRORS = ("ssl", "connection", "invalid")
+    STAGES = ("build", "release", "builder restart", "api restart")
+
+    _R, _B = len(ROUTES), len(BUCKETS) + 1
+    REQUESTS = 0  # [route][status class 1xx..5xx]
+    LATENCY = REQUESTS + _R * 5  # [route][bucket], not cumulative
+    LATENCY_SUM = LATENCY + _R * _B
+    BYTES_IN = LATENCY_SUM + _R
+    BYTES_OUT = BYTES_IN + _R
+    UPSTREAM = BYTES_OUT + _R  # [bucket]
+    UPSTREAM_SUM = UPSTREAM + _B
+    BAD_GATEWAY = UPSTREAM_SUM + 1  # [cause]
+    SSE_STREAMS = BAD_GATEWAY + len(UPSTREAM_ERRORS)
+    THREADS = SSE_STREAMS + 1
+    SIZE = THREADS + 1
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._route_index = {name: index for index, name in enumerate(self.ROUTES)}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: list[tuple[threading.Thread, list[float]]] = []
+        self._retired = [0.0] * self.SIZE
+        self._slots = None
+        self._slot = -1
+        self._stage_lock = threading.Lock()
+        # [stage][ok count, failed count, seconds sum, last seconds]
+        self._stages = [0.0] * (len(self.STAGES) * 4)
+
+    def enable(self, processes: int = 1) -> None:
+        """Turn on request instrumentation; call before forking prefork workers."""
+        self.enabled = True
+        if processes > 1:
+            context = multiprocessing.get_context("fork")
+            self._slots = context.RawArray("d", processes * self.SIZE)
+            self._stages = context.RawArray("d", len(self.STAGES) * 4)
+            self._stage_lock = context.Lock()
+
+    def bind_worker(self, index: int, stop_event: threading.Event) -> None:
+        """In a prefork worker: publish this process's totals into its shared slot."""
+        if self._slots is None:
+            return
+        self._slot = index
+
+        def publish() -> None:
+            while not stop_event.wait(1.0):
+                self._publish(self.totals())
+
+        threading.Thread(target=publish, daemon=True).start()
+
+    # -- hot path: own shard only --------------------------------------------
+
+    def observe(self, record: RequestRecord) -> None:
+        shard = self._shard()
+        route = self._route_index[record.route]
+        status_class = min(max(record.status // 100, 1), 5) - 1
+        seconds = record.duration
+        shard[self.REQUESTS + route * 5 + status_class] += 1
+        shard[self.LATENCY + route * self._B + bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        shard[self.LATENCY_SUM + route] += seconds
+        shard[self.BYTES_IN + route] += record.bytes_in
+        shard[self.BYTES_OUT + route] += record.bytes_out
+        if record.upstream_seconds is not None:
+            shard[self.UPSTREAM + bisect.bisect_left(self.BUCKETS, record.upstream_seconds)] += 1
+            shard[self.UPSTREAM_SUM] += record.upstream_seconds
+        if record.upstream_error is not None and record.status == 502:
+            shard[self.BAD_GATEWAY + self.UPSTREAM_ERRORS.index(record.upstream_error)] += 1
+
+    def add_sse_stream(self, delta: int) -> None:
+        # Opened and closed on the same thread, so the summed shards give the open streams.
+        self._shard()[self.SSE_STREAMS] += delta
+
+    def _shard(self) -> list[float]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = [0.0] * self.SIZE
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+            if len(self._shards) % 64 == 0:
+                self._fold_finished()
+        self._local.shard = shard
+        return shard
+
+    # -- scrape side -----------------------------------------------------------
+
+    def observe_stage(self, name: str, seconds: float, ok: bool) -> None:
+        if name not in self.STAGES:
+            return
+        base = self.STAGES.index(name) * 4
+        with self._stage_lock:
+            self._stages[base + (0 if ok else 1)] += 1
+            self._stages[base + 2] += seconds
+            self._stages[base + 3] = seconds
+
+    def _fold_finished(self) -> None:
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                # A finished thread never writes again, so its shard can be merged safely.
+                for index, value in enumerate(shard):
+                    self._retired[index] += value
+        self._shards = live
+
+    def totals(self) -> list[float]:
+        """This process's counters (a scrape-time sum of the per-thread shards)."""
+        with self._lock:
+            self._fold_finished()
+            columns = [self._retired, *(shard for _thread, shard in self._shards)]
+            values = [sum(column) for column in zip(*columns)]
+        values[self.THREADS] = threading.active_count()
+        return values
+
+    def _publish(self, values: list[float]) -> None:
+        assert self._slots is not None
+        base = self._slot * self.SIZE
+        self._slots[base : base + self.SIZE] = values
+
+    def render(self) -> str:
+        values = self.totals()
+        if self._slots is not None and self._slot >= 0:
+            self._publish(values)
+            slots = len(self._slots) // self.SIZE
+            values = [
+                sum(self._slots[slot * self.SIZE + index] for slot in range(slots)) for index in range(self.SIZE)
+            ]
+        lines: list[str] = []
+
+        def num(value: float) -> str:
+            return str(int(value)) if float(value).is_integer() else f"{value:.6f}"
+
+        def metric(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, label: str, offset: int, total: float) -> None:
+            cumulative = 0.0
+            for bucket, bound in enumerate((*self.BUCKETS, "+Inf")):
+                cumulative += values[offset + bucket]
+                bucket_labels = f'{label},le="{bound}"' if label else f'le="{bound}"'
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {num(cumulative)}")
+            suffix = f"{{{label}}}" if label else ""
+            lines.append(f"{name}_sum{suffix} {total:.6f}")
+            lines.append(f"{name}_count{suffix} {num(cumulative)}")
+
+        metric("deploy_requests_total", "counter", "Requests answered, by route class and status class.")
+        for route, name in enumerate(self.ROUTES):
+            for status_class in range(5):
+                count = values[self.REQUESTS + route * 5 + status_class]
+                lines.append(f'deploy_requests_total{{route="{name}",code="{status_class + 1}xx"}} {num(count)}')
+        metric("deploy_request_duration_seconds", "histogram", "Time from request line to end of response.")
+        for route, name in enumerate(self.ROUTES):
+            histogram(
+                "deploy_request_duration_seconds",
+                f'route="{name}"',
+                self.LATENCY + route * self._B,
+                values[self.LATENCY_SUM + route],
+            )
+        metric("deploy_upstream_duration_seconds", "histogram", "Time until the API answered with headers.")
+        histogram("deploy_upstream_duration_seconds", "", self.UPSTREAM, values[self.UPSTREAM_SUM])
+        metric("deploy_received_bytes_total", "counter", "Bytes received from clients.")
+        for route, name in enumerate(self.ROUTES):
+            lines.append(f'deploy_received_bytes_total{{route="{name}"}} {num(values[self.BYTES_IN + route])}')
+        metric("deploy_sent_bytes_total", "counter", "Bytes sent to clients.")
+        for route, name in enumerate(self.ROUTES):
+            lines.append(f'deploy_sent_bytes_total{{route="{name}"}} {num(values[self.BYTES_OUT + route])}')
+        metric("deploy_bad_gateway_total", "counter", "502 responses, by upstream failure.")
+        for cause, name in enumerate(self.UPSTREAM_ERRORS):
+            lines.append(f'deploy_bad_gateway_total{{cause="{name}"}} {num(values[self.BAD_GATEWAY + cause])}')
+        metric("deploy_sse_streams", "gauge", "SSE streams currently relayed.")
+        lines.append(f"deploy_sse_streams {num(values[self.SSE_STREAMS])}")
+        metric("deploy_threads", "gauge", "Live threads in the serving processes.")
+        lines.append(f"deploy_threads {num(values[self.THREADS])}")
+
+        metric("deploy_active_release_info", "gauge", "The release currently served.")
+        try:
+            release = RELEASE_POINTER.current().name
+        except SystemExit:
+            release = ""
+        lines.append(f'deploy_active_release_info{{release="{release}"}} 1')
+        with self._stage_lock:
+            stages = list(self._stages)
+        metric("deploy_stage_runs_total", "counter", "Watch stages run, by result.")
+        for index, name in enumerate(self.STAGES):
+            lines.append(f'deploy_stage_runs_total{{stage="{name}",result="ok"}} {num(stages[index * 4])}')
+            lines.append(f'deploy_stage_runs_total{{stage="{name}",result="failed"}} {num(stages[index * 4 + 1])}')
+        metric("deploy_stage_duration_seconds_total", "counter", "Time spent in watch stages.")
+        for index, name in enumerate(self.STAGES):
+            lines.append(f'deploy_stage_duration_seconds_total{{stage="{name}"}} {stages[index * 4 + 2]:.6f}')
+        metric("deploy_stage_last_duration_seconds", "gauge", "Duration of the last run of each watch stage.")
+        for index, name in enumerate(self.STAGES):
+            lines.append(f'deploy_stage_last_duration_seconds{{stage="{name}"}} {stages[index * 4 + 3]:.6f}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = DeployMetrics()
+
+
+class AccessLog:
+    """Buffered JSON Lines access log (--access-log).
+
+    Request threads append the finished RequestRecord to a bounded deque and move on; a
+    background thread formats records in batches, writes them with one write() per batch and
+    rotates the file by size. A full buffer drops records (counted) instead of blocking a
+    request, and successful static hits can be sampled 1 in N. With the log on, proxy
+    diagnostics (request_info) are printed by the same thread instead of the request's.
+    """
+
+    FLUSH_INTERVAL_SECONDS = 0.5
+    BATCH_RECORDS = 512
+    MAX_NOTES = 1000
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.path: Path | None = None
+        self.max_bytes = 0
+        self.backups = 0
+        self.sample_static = 1
+        self.capacity = 0
+        self._pending: deque[tuple[float, RequestRecord]] = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._sample_turn = 0
+        self._notes: deque[str] = deque(maxlen=self.MAX_NOTES)
+        # Only the writer thread updates these.
+        self._counts = {"written": 0, "rotations": 0}
+        # Request threads count into their own [sampledOut, dropped] shard, as DeployMetrics does.
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: list[tuple[threading.Thread, list[int]]] = []
+        self._retired = [0, 0]
+
+    def configure(self, path: Path, *, max_bytes: int, backups: int, sample_static: int, capacity: int) -> None:
+        self.enabled = True
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample_static = max(1, sample_static)
+        self.capacity = capacity
+
+    def start(self, suffix: str = "") -> None:
+        """Start the writer thread in the process that serves requests (after any fork)."""
+        if not self.enabled or self.path is None:
+            return
+        if suffix:
+            self.path = self.path.with_name(f"{self.path.stem}{suffix}{self.path.suffix}")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="access-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def submit(self, record: RequestRecord) -> None:
+        if (
+            self.sample_static > 1
+            and record.route in ("static", "spa")
+            and 200 <= record.status < 400
+        ):
+            # Unsynchronized on purpose: an occasional double count only nudges the sample rate.
+            self._sample_turn += 1
+            if self._sample_turn % self.sample_static:
+                self._shard()[0] += 1
+                return
+        pending = self._pending
+        if len(pending) >= self.capacity:
+            self._shard()[1] += 1
+            return
+        pending.append((time.time(), record))
+        if len(pending) == self.BATCH_RECORDS:
+            self._wake.set()
+
+    def note(self, message: str) -> bool:
+        """Queue a diagnostic line for the writer thread; False when it is not running."""
+        if self._thread is None:
+            return False
+        self._notes.append(message)
+        return True
+
+    def stats(self) -> dict[str, object]:
+        with self._lock:
+            self._fold_finished()
+            columns = [self._retired, *(shard for _thread, shard in self._shards)]
+            sampled_out, dropped = (sum(column) for column in zip(*columns))
+        return dict(self._counts, dropped=dropped, sampledOut=sampled_out, pending=len(self._pending))
+
+    def _shard(self) -> list[int]:
+        try:
+            return self._local.shard
+        except AttributeError:
+            pass
+        shard = [0, 0]
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+            if len(self._shards) % 64 == 0:
+                self._fold_finished()
+        self._local.shard = shard
+        return shard
+
+    def _fold_finished(self) -> None:
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._retired = [total + value for total, value in zip(self._retired, shard)]
+        self._shards = live
+
+    def _run(self) -> None:
+        assert self.path is not None
+        handle = self.path.open("a", encoding="utf-8")
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(self.FLUSH_INTERVAL_SECONDS)
+                self._wake.clear()
+                handle = self._drain(handle)
+            self._drain(handle)
+        finally:
+            handle.close()
+
+    def _drain(self, handle):
+        notes = self._notes
+        while notes:
+            info(notes.popleft())
+        pending = self._pending
+        while pending:
+            lines = []
+            while pending and len(lines) < self.BATCH_RECORDS * 4:
+                logged_at, record = pending.popleft()
+                lines.append(json.dumps(access_log_entry(logged_at, record), separators=(",", ":")))
+            if self.max_bytes and handle.tell() >= self.max_bytes:
+                handle = self._rotate(handle)
+            handle.write("\n".join(lines) + "\n")
+            handle.flush()
+            self._counts["written"] += len(lines)
+        return handle
+
+    def _rotate(self, handle):
+        assert self.path is not None
+        handle.close()
+        for index in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{index}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink(missing_ok=True)
+        self._counts["rotations"] += 1
+        return self.path.open("a", encoding="utf-8")
+
+
+def access_log_entry(logged_at: float, record: RequestRecord) -> dict[str, object]:
+    def ms(seconds: float | None) -> float | None:
+        return None if seconds is None else round(seconds * 1000, 3)
+
+    return {
+        "ts": dt.datetime.fromtimestamp(logged_at, dt.timezone.utc).isoformat(timespec="milliseconds"),
+        "client": record.client,
+        "method": record.method,
+        "path": record.path,
+        "status": record.status,
+        "route": record.route,
+        "bytesIn": record.bytes_in,
+        "bytesOut": record.bytes_out,
+        "totalMs": ms(record.duration),
+        "upstreamMs": ms(record.upstream_seconds),
+        "tlsMs": ms(record.tls_seconds),
+        "upstreamError": record.upstream_error,
+    }
+
+
+ACCESS_LOG = AccessLog()
+
+
+def request_info(message: str) -> None:
+    """info() for diagnostics on the request path; with --access-log the writer thread prints it."""
+    if not (ACCESS_LOG.enabled and ACCESS_LOG.note(message)):
+        info(message)
+
+
+def request_accounting_enabled() -> bool:
+    """Whether finished requests feed the metrics endpoint or the access log."""
+    return METRICS.enabled or ACCESS_LOG.enabled
+
+
+def finish_record(record: RequestRecord) -> None:
+    record.duration = time.perf_counter() - record.started
+    if METRICS.enabled:
+        METRICS.observe(record)
+    if ACCESS_LOG.enabled:
+        ACCESS_LOG.submit(record)
+
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for request handling (--profile, SIGUSR2, /__deploy/profile).
+
+    Handler threads register themselves with begin()/end() for the requests picked by the
+    per-route 1-in-N sampling; while running, a sampler thread reads their stacks from
+    sys._current_frames() every interval and counts collapsed stacks. Requests that are not
+    picked (and every request while stopped) only pay a counter increment. With the asyncio
+    engine all requests share the event loop thread, which is sampled (as "asyncio") while
+    at least one picked request is in flight.
+    """
+
+    def __init__(self) -> None:
+        self.interval = 0.005
+        self.every = dict.fromkeys(PROFILE_ROUTES, 1)
+        self.top = 25
+        self.suffix = ""
+        self.running = False
+        self.started_at = 0.0
+        # thread ident -> [root label, requests in flight]
+        self._active: dict[int, list] = {}
+        self._turns = dict.fromkeys(PROFILE_ROUTES, 0)
+        self._stacks: dict[str, int] = {}
+        self._labels: dict[object, str] = {}
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def configure(self, *, interval_ms: float, every: dict[str, int], top: int) -> None:
+        self.interval = max(interval_ms, 0.5) / 1000
+        self.every.update(every)
+        self.top = top
+
+    def begin(self, route: str, label: str | None = None) -> bool:
+        """Register the calling thread if this request is picked; pair with end()."""
+        if not self.running:
+            return False
+        turn = self._turns[route] = self._turns[route] + 1
+        if turn % self.every[route]:
+            return False
+        entry = self._active.get(threading.get_ident())
+        if entry is None:
+            self._active[threading.get_ident()] = [label or route, 1]
+        else:
+            entry[1] += 1
+        return True
+
+    def end(self) -> None:
+        ident = threading.get_ident()
+        entry = self._active.get(ident)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._active[ident]
+
+    def start(self) -> None:
+        with self._lock:
+            if self.running:
+                return
+            self._stacks, self._samples = {}, 0
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+            self.running = True
+        info(f"Profiler iniciado (cada {self.interval * 1000:g} ms; 1 de N por ruta: {format_stats(self.every)}).")
+
+    def stop(self) -> list[Path]:
+        """Stop sampling and write the collapsed stacks and the summary; returns the files."""
+        with self._lock:
+            if not self.running:
+                return []
+            self.running = False
+            self._stop.set()
+            if self._thread is not None:
+                self._thread.join(timeout=5)
+                self._thread = None
+            self._active.clear()
+            return self._write()
+
+    def toggle(self) -> None:
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self) -> None:
+        labels = self._labels
+        stacks = self._stacks
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident, (root, _refs) in list(self._active.items()):
+                frame = frames.get(ident)
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        qualname = getattr(code, "co_qualname", code.co_name)
+                        label = labels[code] = f"{qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+                    parts.append(label)
+                    frame = frame.f_back
+                parts.append(root)
+                key = ";".join(reversed(parts))
+                stacks[key] = stacks.get(key, 0) + 1
+                self._samples += 1
+            del frames
+
+    def summary(self) -> str:
+        """Top-N functions by own samples and by samples including callees."""
+        own: dict[str, int] = {}
+        total: dict[str, int] = {}
+        roots: dict[str, int] = {}
+        for key, count in list(self._stacks.items()):
+            frames = key.split(";")
+            roots[frames[0]] = roots.get(frames[0], 0) + count
+            own[frames[-1]] = own.get(frames[-1], 0) + count
+            for frame in set(frames[1:]):
+                total[frame] = total.get(frame, 0) + count
+        samples = max(self._samples, 1)
+        lines = [
+            f"samples={self._samples} interval_ms={self.interval * 1000:g} "
+            f"seconds={time.time() - self.started_at:.1f} {format_stats(roots)}"
+        ]
+        for title, counts in (("own", own), ("total", total)):
+            lines.append(f"top {self.top} by {title} samples:")
+            for frame, count in sorted(counts.items(), key=lambda item: -item[1])[: self.top]:
+                lines.append(f"{count:8d} {100 * count / samples:6.2f}%  {frame}")
+        return "\n".join(lines) + "\n"
+
+    def _write(self) -> list[Path]:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stem = f"profile-{dt.datetime.now().strftime('%Y%m%d-%H%M%S')}{self.suffix}"
+        folded = PROFILE_DIR / f"{stem}.folded"
+        text = PROFILE_DIR / f"{stem}.txt"
+        # Collapsed-stack format ("root;caller;callee count") read by flamegraph.pl, speedscope, inferno.
+        folded.write_text("".join(f"{key} {count}\n" for key, count in self._stacks.items()), encoding="utf-8")
+        summary = self.summary()
+        text.write_text(summary, encoding="utf-8")
+        info(f"Profiler detenido: {self._samples} muestras -> {folded.name}, {text.name}")
+        for line in summary.splitlines()[: self.top + 2]:
+            info(line)
+        return [folded, text]
+
+
+PROFILER = SamplingProfiler()
+
+
+def profile_route(target: str, proxied: bool) -> str:
+    """Route class used by --profile-sample, known before the request is dispatched."""
+    if proxied and target.startswith("/api/"):
+        return "api"
+    if target.startswith("/__deploy/"):
+        return "other"
+    return "static"
+
+
+def profile_endpoint(method: str, target: str, client: str) -> tuple[int, str]:
+    """Answer /__deploy/profile: GET reports, POST ?action=start|stop toggles (loopback only)."""
+    if not is_loopback_client(client):
+        return 404, "File not found"
+    if method == "GET":
+        state = "running" if PROFILER.running else "stopped"
+        return 200, f"profiler {state}\n" + (PROFILER.summary() if PROFILER.running else "")
+    if method != "POST":
+        return 405, "Use GET or POST"
+    action = urllib.parse.parse_qs(urllib.parse.urlparse(target).query).get("action", [""])[0]
+    if action == "start":
+        PROFILER.start()
+        return 200, "profiler running\n"
+    if action == "stop":
+        files = PROFILER.stop()
+        return 200, "profiler stopped\n" + "".join(f"{path}\n" for path in files)
+    return 400, "Expected ?action=start or ?action=stop"
+
+
+def parse_profile_sample(values: list[str]) -> dict[str, int]:
+    """Turn --profile-sample values ("N" for every route or "route=N") into a per-route map."""
+    every: dict[str, int] = {}
+    for value in values:
+        route, _, count = value.rpartition("=")
+        routes = [route] if route else list(PROFILE_ROUTES)
+        if route and route not in PROFILE_ROUTES:
+            fail(f"--profile-sample: ruta desconocida {route!r} (usa {', '.join(PROFILE_ROUTES)}).")
+        try:
+            n = int(count)
+        except ValueError:
+            n = 0
+        if n < 1:
+            fail(f"--profile-sample: {value!r} no es un entero >= 1.")
+        every.update(dict.fromkeys(routes, n))
+    return every
+
+
+def is_loopback_client(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def format_stats(stats: dict[str, object]) -> str:
+    return " ".join(f"{key}={value}" for key, value in stats.items())
+
+
+def log_stats(sources: dict[str, Callable[[], dict[str, object]]]) -> None:
+    for label, collect in sources.items():
+        info(f"{label}: {format_stats(collect())}")
+
+
+def report_stats(
+    interval_seconds: int, stop_event: threading.Event, sources: dict[str, Callable[[], dict[str, object]]]
+) -> None:
+    while not stop_event.wait(interval_seconds):
+        log_stats(sources)
+
+
+def make_handler(
+    api: ApiUpstreams | None,
+    upstream_pool: UpstreamPool | None = None,
+    *,
+    proxy_buffer_bytes: int = DEFAULT_PROXY_BUFFER_BYTES,
+    ws_max_tunnels: int = DEFAULT_WS_MAX_TUNNELS,
+    ws_idle_timeout: float = DEFAULT_WS_IDLE_TIMEOUT_SECONDS,
+    keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT_SECONDS,
+    max_keepalive_requests: int = DEFAULT_MAX_KEEPALIVE_REQUESTS,
+):
+    pool = upstream_pool or UpstreamPool()
+    ws_slots = threading.BoundedSemaphore(max(1, ws_max_tunnels))
+
+    class SecureHandler(KeepAliveHandlerMixin, http.server.SimpleHTTPRequestHandler):
+        # Headers and body go out in separate writes; with Nagle on, the body of a small
+        # response waits for the client's delayed ACK (~40 ms).
+        disable_nagle_algorithm = True
+        extra_headers: list[tuple[str, str]] = []
+        record: RequestRecord | None = None
+        profiled = False
+
+        def setup(self) -> None:
+            super().setup()
+            self.keepalive_timeout = keepalive_timeout
+            self.max_keepalive_requests = max_keepalive_requests
+            if request_accounting_enabled():
+                # Count bytes below rfile's buffer and above the socket for metrics and the access log.
+                self.received = CountingSocketIO(self.connection, "rb")
+                self.rfile = io.BufferedReader(self.received)
+                self.wfile = CountingWriter(self.wfile)
+                self.bytes_mark = (0, 0)
+
+        def parse_request(self) -> bool:
+            self.record = RequestRecord(time.perf_counter())
+            if not super().parse_request():
+                return False
+            self.profiled = PROFILER.begin(profile_route(self.path, api is not None))
+            return True
+
+        def send_response(self, code: int, message: str | None = None) -> None:
+            if self.record is not None:
+                self.record.status = code
+            super().send_response(code, message)
+
+        def handle_one_request(self) -> None:
+            try:
+                super().handle_one_request()
+            finally:
+                if self.profiled:
+                    self.profiled = False
+                    PROFILER.end()
+                # An idle keep-alive connection must not pin a retired release (and its asset pack).
+                self.release = None
+                record, self.record = self.record, None
+                if record is not None and request_accounting_enabled():
+                    # Bytes since the previous request ended, including this request line.
+                    counted = (self.received.received, self.wfile.sent)
+                    record.bytes_in = counted[0] - self.bytes_mark[0]
+                    record.bytes_out = counted[1] - self.bytes_mark[1]
+                    self.bytes_mark = counted
+                    record.method = self.command or "-"
+                    record.path = self.path if self.command else "-"
+                    record.client = self.client_address[0]
+                    handshakes = getattr(self.server, "handshakes", None)
+                    if self.requests_on_connection == 1 and handshakes is not None:
+                        record.tls_seconds = getattr(handshakes, "seconds", None)
+                    finish_record(record)
+
+        def translate_path(self, path: str) -> str:
+            return str(resolve_release_path(self.release.root, path))
+
+        def send_head(self):  # type: ignore[override]
+            try:
+                # One snapshot per request: a release swap mid-request never mixes releases.
+                self.release = RELEASE_POINTER.current()
+            except SystemExit:
+                self.send_error(503, "No active release")
+                return None
+            if self.record is not None:
+                self.record.route = self.release.route_class(self.path)
+            static = select_static_representation(self.release, self.path, self.headers.get("Accept-Encoding"))
+            if static is None:
+                if self.release.routes:
+                    self.send_error(404, "File not found")
+                    return None
+                return super().send_head()
+            if etag_matches(self.headers.get("If-None-Match"), static.etag):
+                self.send_response(304)
+                self.extra_headers = static.headers
+                self.end_headers()
+                return None
+            if static.packed is not None:
+                self.send_response(200)
+                self._headers_buffer.append(static.packed.header_block)
+                self.end_headers()
+                # BytesIO shares the pack's bytes; copyfile() writes them in one call.
+                return io.BytesIO(static.packed.body)
+
+            try:
+                handle = static.body_path.open("rb")
+            except OSError:
+                self.send_error(404, "File not found")
+                return None
+            try:
+                stat = os.fstat(handle.fileno())
+                self.send_response(200)
+                self.send_header("Content-Type", self.guess_type(str(static.file_path)))
+                if static.encoding:
+                    self.send_header("Content-Encoding", static.encoding)
+                self.send_header("Content-Length", str(stat.st_size))
+                self.send_header("Last-Modified", self.date_time_string(stat.st_mtime))
+                self.extra_headers = static.headers
+                self.end_headers()
+            except Exception:
+                handle.close()
+                raise
+            return handle
+
+        def copyfile(self, source, outputfile) -> None:  # type: ignore[override]
+            if isinstance(source, io.BytesIO):
+                outputfile.write(source.getvalue())
+                return
+            super().copyfile(source, outputfile)
+
+        def end_headers(self) -> None:
+            extra, self.extra_headers = self.extra_headers, []
+            for key, value in extra:
+                self.send_header(key, value)
+            for key, value in SECURITY_HEADERS:
+                self.send_header(key, value)
+            super().end_headers()
+
+        def do_GET(self) -> None:  # noqa: N802
+            if METRICS.enabled and urllib.parse.urlparse(self.path).path == METRICS_PATH:
+                self.serve_metrics()
+                return
+            if urllib.parse.urlparse(self.path).path == PROFILE_PATH:
+                self.serve_profile()
+                return
+            if api and self.path.startswith("/api/"):
+                if self.headers.get("Upgrade", "").lower() == "websocket":
+                    self.tunnel_websocket()
+                else:
+                    self.proxy_to_api()
+                return
+            super().do_GET()
+
+        def do_POST(self) -> None:  # noqa: N802
+            if api and self.path.startswith("/api/"):
+                self.proxy_to_api()
+                return
+            if urllib.parse.urlparse(self.path).path == PROFILE_PATH:
+                self.serve_profile()
+                return
+            self.send_error(404, "Not found")
+
+        def do_PUT(self) -> None:  # noqa: N802
+            if api and self.path.startswith("/api/"):
+                self.proxy_to_api()
+                return
+            self.send_error(404, "Not found")
+
+        def do_DELETE(self) -> None:  # noqa: N802
+            if api and self.path.startswith("/api/"):
+                self.proxy_to_api()
+                return
+            self.send_error(404, "Not found")
+
+        def do_PATCH(self) -> None:  # noqa: N802
+            if api and self.path.startswith("/api/"):
+                self.proxy_to_api()
+                return
+            self.send_error(404, "Not found")
+
+        def do_OPTIONS(self) -> None:  # noqa: N802
+            if api and self.path.startswith("/api/"):
+                self.proxy_to_api()
+                return
+            self.send_error(501, "Unsupported method ('OPTIONS')")
+
+        def serve_metrics(self) -> None:
+            if not is_loopback_client(self.client_address[0]):
+                self.send_error(404, "File not found")
+                return
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", METRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def serve_profile(self) -> None:
+            if self.headers.get("Content-Length", "0") not in ("", "0"):
+                self.close_connection = True
+            status, text = profile_endpoint(self.command, self.path, self.client_address[0])
+            if status == 404:
+                self.send_error(404, "File not found")
+                return
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def note_upstream_error(self, cause: str) -> None:
+            if self.record is not None:
+                self.record.upstream_error = cause
+
+        def proxy_to_api(self) -> None:
+            assert api is not None
+            # The origin is fixed for the whole exchange; a blue/green switch only affects new requests.
+            api_origin = api.acquire(pinned=is_pinned_api_request(self.path))
+            try:
+                self.proxy_to_origin(api_origin)
+            finally:
+                api.release(api_origin)
+
+        def proxy_to_origin(self, api_origin: str) -> None:
+            parsed = urllib.parse.urlparse(api_origin)
+            request_path = urllib.parse.urlparse(self.path).path
+            is_sse_request = request_path.endswith("/sync/events")
+            record = self.record or RequestRecord(time.perf_counter())
+            record.route = "sse" if is_sse_request else "api"
+
+            def safe_send_error(status: int, message: str) -> None:
+                try:
+                    self.send_error(status, message)
+                except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError) as exc:
+                    request_info(f"proxy_to_api: client disconnected before error response ({exc})")
+
+            headers = {}
+            for key, value in self.headers.items():
+                lower = key.lower()
+                if lower in ("host", "connection", "content-length", "transfer-encoding", "accept-encoding", "expect"):
+                    continue
+                headers[key] = value
+            headers["Host"] = parsed.netloc
+            headers["X-Forwarded-Proto"] = "https"
+
+            body: bytes | object | None = None
+            encode_chunked = False
+            if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+                body = client_body(iter_chunked_body(self.rfile))
+                headers["Transfer-Encoding"] = "chunked"
+                encode_chunked = True
+            else:
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    safe_send_error(400, "Invalid Content-Length")
+                    return
+                if length > 0:
+                    headers["Content-Length"] = str(length)
+                    if length > proxy_buffer_bytes:
+                        body = client_body(iter_fixed_body(self.rfile, length))
+                    else:
+                        body = self.rfile.read(length)
+            body_streamed = body is not None and not isinstance(body, bytes)
+
+            # SSE streams stay open for hours, so they get their own connection instead of a pool slot.
+            pooled = not is_sse_request
+            # A streamed body has already been consumed from the client and cannot be replayed.
+            retryable = pooled and not body_streamed and self.command in IDEMPOTENT_METHODS
+            attempts = 2 if retryable else 1
+            connection: http.client.HTTPConnection | None = None
+            response: http.client.HTTPResponse | None = None
+            upstream_started = time.perf_counter()
+            for attempt in range(attempts):
+                reused = False
+                try:
+                    if pooled:
+                        connection, reused = pool.acquire(api_origin)
+                    else:
+                        connection = pool.open_dedicated(api_origin, timeout=None)
+                    connection.request(
+                        self.command, self.path, body=body, headers=headers, encode_chunked=encode_chunked
+                    )
+                    response = connection.getresponse()
+                    record.upstream_seconds = time.perf_counter() - upstream_started
+                    break
+                except MalformedChunkedBody as exc:
+                    request_info(f"proxy_to_api rejected request body: {exc}")
+                    if connection is not None:
+                        if pooled:
+                            pool.release(api_origin, connection, reusable=False)
+                        else:
+                            connection.close()
+                    safe_send_error(400, "Malformed chunked request body")
+                    return
+                except ClientBodyError as exc:
+                    # The client went away (or stalled) mid-body: nothing to answer, and the
+                    # upstream is not at fault.
+                    request_info(f"proxy_to_api: client disconnected while sending the request body ({exc})")
+                    if connection is not None:
+                        if pooled:
+                            pool.release(api_origin, connection, reusable=False)
+                        else:
+                            connection.close()
+                    self.close_connection = True
+                    return
+                except ssl.SSLError as exc:
+                    failure = exc
+                    message = "Bad gateway: SSL upstream error"
+                    record.upstream_error = "ssl"
+                    request_info(f"proxy_to_api SSL error: {exc}")
+                except OSError as exc:
+                    failure = exc
+                    message = "Bad gateway: upstream connection error"
+                    record.upstream_error = "connection"
+                    if not (reused and attempt + 1 < attempts):
+                        request_info(f"proxy_to_api upstream connection error: {exc}")
+                    if isinstance(exc, ConnectionRefusedError):
+                        # Take the worker out of rotation now; the supervisor's probe brings it back.
+                        api.set_healthy(api_origin, False)  # type: ignore[union-attr]
+                if connection is not None:
+                    if pooled:
+                        pool.release(api_origin, connection, reusable=False)
+                    else:
+                        connection.close()
+                    connection = None
+                if reused and attempt + 1 < attempts and not isinstance(failure, ssl.SSLError):
+                    # The pooled socket went stale between requests; try once on a fresh one.
+                    pool.note_retry()
+                    continue
+                safe_send_error(502, message)
+                return
+            assert connection is not None and response is not None
+
+            reusable = False
+            try:
+                content_type = (response.getheader("Content-Type") or "").lower()
+                response_is_sse = is_sse_request or "text/event-stream" in content_type
+
+                self.send_response(response.status, response.reason)
+                for key, value in response.getheaders():
+                    lower = key.lower()
+                    if lower in ("transfer-encoding", "connection", "content-length"):
+                        continue
+                    self.send_header(key, value)
+                if response_is_sse:
+                    # SSE must be streamed and should not include Content-Length.
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("X-Accel-Buffering", "no")
+                    chunked = self.request_version >= "HTTP/1.1"
+                    if chunked:
+                        self.send_header("Transfer-Encoding", "chunked")
+                    else:
+                        self.close_connection = True
+                    self.end_headers()
+                    self.relay_sse(response, chunked)
+                    return
+
+                reusable = self.relay_response_body(response)
+            finally:
+                if pooled:
+                    pool.release(api_origin, connection, reusable=reusable)
+                else:
+                    connection.close()
+
+        def relay_sse(self, response: http.client.HTTPResponse, chunked: bool) -> None:
+            if METRICS.enabled:
+                METRICS.add_sse_stream(1)
+            try:
+                while True:
+                    try:
+                        chunk = response.read1(16 * 1024)
+                    except (OSError, http.client.HTTPException) as exc:
+                        request_info(f"proxy_to_api SSE upstream read closed: {exc}")
+                        self.close_connection = True
+                        return
+                    if not chunk:
+                        if chunked:
+                            self.write_client(b"0\r\n\r\n")
+                        return
+                    if not self.write_client(chunk, chunked=chunked):
+                        return
+                    try:
+                        self.wfile.flush()
+                    except OSError:
+                        self.close_connection = True
+                        return
+            finally:
+                if METRICS.enabled:
+                    METRICS.add_sse_stream(-1)
+
+        def tunnel_websocket(self) -> None:
+            if not ws_slots.acquire(blocking=False):
+                request_info("websocket tunnel rejected: concurrent tunnel limit reached")
+                self.send_error(503, "Too many WebSocket tunnels")
+                return
+            assert api is not None
+            if self.record is not None:
+                self.record.route = "websocket"
+            api_origin = api.acquire(pinned=True)
+            try:
+                self.splice_websocket(api_origin)
+            finally:
+                api.release(api_origin)
+                ws_slots.release()
+
+        def splice_websocket(self, api_origin: str) -> None:
+            """Forward the upgrade handshake, then relay raw frames between client and API.
+
+            Clients must wait for the 101 before sending frames (RFC 6455), so nothing is
+            left unread in rfile when the handler switches to the raw socket.
+            """
+            parsed = urllib.parse.urlparse(api_origin)
+            self.close_connection = True
+            try:
+                upstream = pool.open_socket(api_origin, timeout=UPSTREAM_TIMEOUT_SECONDS)
+            except ssl.SSLError as exc:
+                request_info(f"websocket tunnel SSL error: {exc}")
+                self.note_upstream_error("ssl")
+                self.send_error(502, "Bad gateway: SSL upstream error")
+                return
+            except OSError as exc:
+                request_info(f"websocket tunnel upstream connection error: {exc}")
+                self.note_upstream_error("connection")
+                self.send_error(502, "Bad gateway: upstream connection error")
+                return
+            try:
+                lines = [f"{self.command} {self.path} HTTP/1.1", f"Host: {parsed.netloc}"]
+                for key, value in self.headers.items():
+                    if key.lower() in ("host", "x-forwarded-proto"):
+                        continue
+                    lines.append(f"{key}: {value}")
+                lines.append("X-Forwarded-Proto: https")
+                try:
+                    upstream.sendall(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+                    head, early_frames = read_upgrade_head(upstream)
+                except (OSError, ValueError) as exc:
+                    request_info(f"websocket tunnel handshake failed: {exc}")
+                    self.note_upstream_error("invalid" if isinstance(exc, ValueError) else "connection")
+                    self.send_error(502, "Bad gateway: upstream upgrade failed")
+                    return
+                status_line = head.split(b"\r\n", 1)[0].decode("latin-1", "replace")
+                parts = status_line.split(" ", 2)
+                status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 502
+                if self.record is not None:
+                    self.record.status = status
+                self.log_request(status)
+                try:
+                    self.wfile.write(head + early_frames)
+                    self.wfile.flush()
+                except OSError:
+                    return
+                if status != 101:
+                    return
+                reason = splice_sockets(self.connection, upstream, ws_idle_timeout)
+                request_info(f"websocket tunnel closed: {reason}")
+            finally:
+                upstream.close()
+
+        def relay_response_body(self, response: http.client.HTTPResponse) -> bool:
+            """Send the upstream body after the status/headers; return True if the upstream socket is reusable.
+
+            Bodies that fit in ``proxy_buffer_bytes`` are sent with Content-Length; larger or
+            unknown-length ones are streamed in bounded chunks so memory stays flat.
+            """
+            declared = response.getheader("Content-Length")
+            try:
+                declared_length = int(declared) if declared is not None else None
+            except ValueError:
+                declared_length = None
+            if self.command == "HEAD" or response.status in (204, 304):
+                if declared_length is not None:
+                    self.send_header("Content-Length", str(declared_length))
+                self.end_headers()
+                return not response.will_close
+
+            try:
+                if declared_length is None or declared_length <= proxy_buffer_bytes:
+                    # Unknown lengths are probed with one bounded read before deciding to stream.
+                    head = response.read(proxy_buffer_bytes + 1)
+                    if len(head) <= proxy_buffer_bytes and (declared_length is not None or response.isclosed()):
+                        self.send_header("Content-Length", str(len(head)))
+                        self.end_headers()
+                        self.write_client(head)
+                        return not response.will_close
+                else:
+                    head = b""
+            except (OSError, http.client.HTTPException) as exc:
+                request_info(f"proxy_to_api upstream read error: {exc}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return False
+
+            chunked = (
+                declared_length is None
+                and self.request_version >= "HTTP/1.1"
+                and self.protocol_version >= "HTTP/1.1"
+            )
+            if declared_length is not None:
+                self.send_header("Content-Length", str(declared_length))
+            elif chunked:
+                self.send_header("Transfer-Encoding", "chunked")
+            else:
+                # HTTP/1.0 peers get a close-delimited body.
+                self.close_connection = True
+            self.end_headers()
+            complete = False
+            try:
+                chunk = head
+                while True:
+                    if chunk and not self.write_client(chunk, chunked=chunked):
+                        return False
+                    chunk = response.read1(PROXY_STREAM_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                complete = True
+                # read1() stops at Content-Length without marking the response closed, and the
+                # pooled connection refuses its next request until it is.
+                response.close()
+            except (OSError, http.client.HTTPException) as exc:
+                request_info(f"proxy_to_api upstream stream interrupted: {exc}")
+                self.close_connection = True
+            if chunked and complete:
+                self.write_client(b"0\r\n\r\n")
+            return complete and not response.will_close
+
+        def write_client(self, data: bytes, *, chunked: bool = False) -> bool:
+            try:
+                if chunked:
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                else:
+                    self.wfile.write(data)
+            except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError):
+                self.close_connection = True
+                return False
+            return True
+
+        def log_request(self, code: int | str = "-", size: int | str = "-") -> None:
+            # With --access-log the finished request is logged off-thread instead.
+            if not ACCESS_LOG.enabled:
+                super().log_request(code, size)
+
+        def log_error(self, fmt: str, *args: object) -> None:
+            # The status of error pages is already in the access log record.
+            if not ACCESS_LOG.enabled:
+                super().log_error(fmt, *args)
+
+        def log_message(self, fmt: str, *args: object) -> None:
+            info(fmt % args)
+
+    return SecureHandler
+
+
+class AsyncUpstream(NamedTuple):
+    reader: asyncio.StreamReader
+    writer: asyncio.StreamWriter
+
+
+class AsyncFrontendServer:
+    """Single event-loop alternative to ThreadingHTTPServer (``--engine asyncio``).
+
+    Serves the active release, proxies /api/ and relays SSE/WebSocket streams with the same
+    headers and routing as make_handler, without pinning one OS thread per open connection.
+    Exposes serve_forever/shutdown/server_close so run_secure_stack can drive either engine.
+    """
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        ssl_context: ssl.SSLContext,
+        api: ApiUpstreams | None,
+        upstream_pool: UpstreamPool,
+        *,
+        proxy_buffer_bytes: int = DEFAULT_PROXY_BUFFER_BYTES,
+        ws_max_tunnels: int = DEFAULT_WS_MAX_TUNNELS,
+        ws_idle_timeout: float = DEFAULT_WS_IDLE_TIMEOUT_SECONDS,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT_SECONDS,
+        max_keepalive_requests: int = DEFAULT_MAX_KEEPALIVE_REQUESTS,
+        tls_stats: TLSHandshakeStats | None = None,
+        listen_socket: socket.socket | None = None,
+    ) -> None:
+        self.address = address
+        self.listen_socket = listen_socket
+        self.tls_stats = tls_stats
+        self.ssl_context = ssl_context
+        self.api = api
+        self.pool = upstream_pool
+        self.proxy_buffer_bytes = proxy_buffer_bytes
+        self.ws_max_tunnels = max(1, ws_max_tunnels)
+        self.ws_idle_timeout = ws_idle_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max(1, max_keepalive_requests)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: asyncio.Event | None = None
+        self._idle: dict[str, list[tuple[AsyncUpstream, float]]] = {}
+        self._slots: dict[str, asyncio.Semaphore] = {}
+        self._tunnels = 0
+        self._connections: set[asyncio.Task] = set()
+
+    def serve_forever(self) -> None:
+        asyncio.run(self._serve())
+
+    def shutdown(self) -> None:
+        loop, stop = self._loop, self._stop
+        if loop is not None and stop is not None:
+            loop.call_soon_threadsafe(stop.set)
+
+    def server_close(self) -> None:
+        pass
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if self.listen_socket is not None:
+            server = await asyncio.start_server(
+                self._handle_client,
+                sock=self.listen_socket,
+                ssl=self.ssl_context,
+                limit=MAX_UPGRADE_HEAD_BYTES,
+            )
+        else:
+            server = await asyncio.start_server(
+                self._handle_client,
+                self.address[0],
+                self.address[1],
+                ssl=self.ssl_context,
+                limit=MAX_UPGRADE_HEAD_BYTES,
+                backlog=1024,
+            )
+        async with server:
+            await self._stop.wait()
+            for task in list(self._connections):
+                task.cancel()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+        for items in self._idle.values():
+            for upstream, _since in items:
+                upstream.writer.close()
+
+    # -- client side -------------------------------------------------------
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._connections.add(task)
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object is not None and self.tls_stats is not None:
+            # asyncio finishes the handshake before calling us, so only counts are available here.
+            self.tls_stats.record(None, ssl_object.session_reused)
+        served = 0
+        accounting = request_accounting_enabled()
+        if accounting:
+            reader, writer = CountingStreamReader(reader), CountingStreamWriter(writer)  # type: ignore[assignment]
+        peer = writer.get_extra_info("peername") or ("-",)
+        bytes_mark = (0, 0)
+        try:
+            while self._stop is not None and not self._stop.is_set():
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                request = parse_request_head(head)
+                if request is None:
+                    await self._send_error(writer, None, 400, "Bad request")
+                    break
+                served += 1
+                record = RequestRecord(time.perf_counter())
+                request = request._replace(force_close=served >= self.max_keepalive_requests, record=record)
+                profiled = PROFILER.begin(profile_route(request.target, self.api is not None), "asyncio")
+                try:
+                    keep_alive = await self._dispatch(request, reader, writer)
+                finally:
+                    if profiled:
+                        PROFILER.end()
+                if accounting:
+                    counted = (reader.received, writer.sent)  # type: ignore[attr-defined]
+                    record.bytes_in = counted[0] - bytes_mark[0]
+                    record.bytes_out = counted[1] - bytes_mark[1]
+                    bytes_mark = counted
+                    record.method, record.path, record.client = request.method, request.target, str(peer[0])
+                    finish_record(record)
+                if not keep_alive:
+                    break
+        except (ConnectionError, ssl.SSLError, OSError, asyncio.CancelledError):
+            # Cancellation only happens on shutdown; end the connection quietly.
+            pass
+        finally:
+            self._connections.discard(task)  # type: ignore[arg-type]
+            writer.close()
+            with contextlib.suppress(ConnectionError, ssl.SSLError, OSError):
+                await writer.wait_closed()
+
+    async def _dispatch(
+        self, request: ParsedRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> bool:
+        """Handle one request; return True when the client connection can be reused."""
+        path = urllib.parse.urlparse(request.target).path
+        if METRICS.enabled and path == METRICS_PATH:
+            return await self._serve_metrics(request, writer)
+        if path == PROFILE_PATH:
+            return await self._serve_profile(request, writer)
+        if self.api and request.target.startswith("/api/"):
+            if request.method == "GET" and request.headers.get("Upgrade", "").lower() == "websocket":
+                await self._tunnel_websocket(request, reader, writer)
+                return False
+            return await self._proxy(request, reader, writer)
+        has_body = request.headers.get("Transfer-Encoding") is not None or request.headers.get(
+            "Content-Length", "0"
+        ) not in ("", "0")
+        if request.method in ("GET", "HEAD"):
+            return await self._serve_static(request, writer) and not has_body
+        if request.method in ("POST", "PUT", "DELETE", "PATCH"):
+            await self._send_error(writer, request, 404, "Not found")
+        else:
+            await self._send_error(writer, request, 501, f"Unsupported method ({request.method!r})")
+        return False
+
+    async def _serve_metrics(self, request: ParsedRequest, writer: asyncio.StreamWriter) -> bool:
+        peer = writer.get_extra_info("peername")
+        if request.method not in ("GET", "HEAD") or not peer or not is_loopback_client(peer[0]):
+            await self._send_error(writer, request, 404, "File not found")
+            return False
+        body = METRICS.render().encode("utf-8")
+        headers = [
+            ("Content-Type", METRICS_CONTENT_TYPE),
+            ("Content-Length", str(len(body))),
+            ("Cache-Control", "no-store"),
+        ]
+        self._write_head(writer, request, 200, headers, request.keep_alive)
+        if request.method == "GET":
+            writer.write(body)
+        await writer.drain()
+        return request.keep_alive
+
+    async def _serve_profile(self, request: ParsedRequest, writer: asyncio.StreamWriter) -> bool:
+        peer = writer.get_extra_info("peername") or ("",)
+        # Stopping writes the profile files; keep that off the event loop.
+        status, text = await asyncio.to_thread(profile_endpoint, request.method, request.target, str(peer[0]))
+        if status == 404:
+            await self._send_error(writer, request, 404, "File not found")
+            return False
+        body = text.encode("utf-8")
+        headers = [
+            ("Content-Type", "text/plain; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+            ("Cache-Control", "no-store"),
+        ]
+        keep_alive = request.keep_alive and request.headers.get("Content-Length", "0") in ("", "0")
+        self._write_head(writer, request, status, headers, keep_alive)
+        writer.write(body)
+        await writer.drain()
+        return keep_alive
+
+    async def _serve_static(self, request: ParsedRequest, writer: asyncio.StreamWriter) -> bool:
+        keep_alive = request.keep_alive
+        # Disk reads (a due re-check of current-release.json, stat, open, read) run on a worker
+        # thread; a slow disk must not stall every other connection on the loop.
+        release = RELEASE_POINTER.cached()
+        if release is None:
+            try:
+                release = await asyncio.to_thread(RELEASE_POINTER.current)
+            except SystemExit:
+                await self._send_error(writer, request, 503, "No active release")
+                return False
+        if request.record is not None:
+            request.record.route = release.route_class(request.target)
+        static = select_static_representation(release, request.target, request.headers.get("Accept-Encoding"))
+        if static is None:
+            if release.routes:
+                await self._send_error(writer, request, 404, "File not found")
+                return False
+            target = await asyncio.to_thread(resolve_release_path, release.root, request.target)
+            body_path, file_path, extra = target, target, []
+        else:
+            if etag_matches(request.headers.get("If-None-Match"), static.etag):
+                self._write_head(writer, request, 304, static.headers, keep_alive)
+                await writer.drain()
+                return keep_alive
+            if static.packed is not None:
+                body = static.packed.body if request.method == "GET" else b""
+                self._write_head(writer, request, 200, static.packed.headers, keep_alive, body=body)
+                await writer.drain()
+                return keep_alive
+            body_path, file_path, extra = static.body_path, static.file_path, list(static.headers)
+            if static.encoding:
+                extra.append(("Content-Encoding", static.encoding))
+
+        try:
+            handle, stat, first = await asyncio.to_thread(
+                open_static_body, body_path, PROXY_STREAM_CHUNK_BYTES * 4 if request.method == "GET" else 0
+            )
+        except OSError:
+            await self._send_error(writer, request, 404, "File not found")
+            return False
+        headers = [
+            ("Content-Type", mimetypes.guess_type(str(file_path))[0] or "application/octet-stream"),
+            ("Content-Length", str(stat.st_size)),
+            ("Last-Modified", email.utils.formatdate(stat.st_mtime, usegmt=True)),
+            *extra,
+        ]
+        # Head and first chunk go out in one write; small files need no further reads or sends.
+        self._write_head(writer, request, 200, headers, keep_alive, body=first)
+        if handle is not None:
+            try:
+                while True:
+                    await writer.drain()
+                    chunk = await asyncio.to_thread(handle.read, PROXY_STREAM_CHUNK_BYTES * 4)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+            finally:
+                handle.close()
+        await writer.drain()
+        return keep_alive
+
+    def _write_head(
+        self,
+        writer: asyncio.StreamWriter,
+        request: ParsedRequest,
+        status: int,
+        headers: list[tuple[str, str]],
+        keep_alive: bool,
+        reason: str | None = None,
+        body: bytes = b"",
+    ) -> None:
+        if reason is None:
+            try:
+                reason = http.HTTPStatus(status).phrase
+            except ValueError:
+                reason = ""
+        lines = [
+            f"HTTP/1.1 {status} {reason}",
+            f"Server: {http.server.SimpleHTTPRequestHandler.server_version} {http.server.SimpleHTTPRequestHandler.sys_version}",
+            f"Date: {email.utils.formatdate(usegmt=True)}",
+        ]
+        lines.extend(f"{key}: {value}" for key, value in headers)
+        if not keep_alive:
+            lines.append("Connection: close")
+        lines.extend(f"{key}: {value}" for key, value in SECURITY_HEADERS)
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        if request.record is not None:
+            request.record.status = status
+        if not ACCESS_LOG.enabled:
+            info(f'"{request.request_line}" {status} -')
+
+    async def _send_error(
+        self, writer: asyncio.StreamWriter, request: ParsedRequest | None, status: int, message: str
+    ) -> None:
+        """Same page as BaseHTTPRequestHandler.send_error; always closes the connection afterwards."""
+        phrase = http.HTTPStatus(status).phrase
+        body = (
+            http.server.DEFAULT_ERROR_MESSAGE
+            % {"code": status, "message": html.escape(phrase), "explain": html.escape(message)}
+        ).encode("utf-8", "replace")
+        if request is None:
+            request = ParsedRequest("", "", "HTTP/1.0", http.client.HTTPMessage(), "-")
+        if not ACCESS_LOG.enabled:
+            info(f"code {status}, message {message}")
+        self._write_head(
+            writer,
+            request,
+            status,
+            [("Content-Type", http.server.DEFAULT_ERROR_CONTENT_TYPE), ("Content-Length", str(len(body)))],
+            keep_alive=False,
+            reason=message,
+        )
+        writer.write(body)
+        await writer.drain()
+
+    # -- API proxy ----------------------------------------------------------
+
+    async def _proxy(self, request: ParsedRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        assert self.api is not None
+        origin = self.api.acquire(pinned=is_pinned_api_request(request.target))
+        try:
+            return await self._proxy_to(origin, request, reader, writer)
+        finally:
+            self.api.release(origin)
+
+    async def _proxy_to(
+        self, origin: str, request: ParsedRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> bool:
+        parsed = urllib.parse.urlparse(origin)
+        is_sse_request = urllib.parse.urlparse(request.target).path.endswith("/sync/events")
+        record = request.record or RequestRecord(time.perf_counter())
+        record.route = "sse" if is_sse_request else "api"
+
+        headers: list[tuple[str, str]] = []
+        for key, value in request.headers.items():
+            if key.lower() in (
+                "host",
+                "connection",
+                "content-length",
+                "transfer-encoding",
+                "accept-encoding",
+                "expect",
+            ):
+                continue
+            headers.append((key, value))
+        headers.append(("Host", parsed.netloc))
+        headers.append(("X-Forwarded-Proto", "https"))
+        if request.headers.get("Expect", "").lower() == "100-continue" and request.version >= "HTTP/1.1":
+            # Answer 100-continue here; the upstream only ever sees a complete request.
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+
+        body: bytes | None = None
+        body_stream = None
+        if "chunked" in request.headers.get("Transfer-Encoding", "").lower():
+            body_stream = aclient_body(aiter_chunked_body(reader))
+            headers.append(("Transfer-Encoding", "chunked"))
+        else:
+            try:
+                length = int(request.headers.get("Content-Length", "0"))
+            except ValueError:
+                length = -1
+            if length < 0:
+                await self._send_error(writer, request, 400, "Invalid Content-Length")
+                return False
+            if length > 0:
+                headers.append(("Content-Length", str(length)))
+                # Only a retry needs the whole body in memory, and non-idempotent requests are
+                # never retried: past one chunk they stream, overlapping the upload with the upstream.
+                if length > self.proxy_buffer_bytes or (
+                    length > PROXY_STREAM_CHUNK_BYTES and request.method not in IDEMPOTENT_METHODS
+                ):
+                    body_stream = aclient_body(aiter_fixed_body(reader, length))
+                else:
+                    body = await reader.readexactly(length)
+        head = "\r\n".join(
+            [f"{request.method} {request.target} HTTP/1.1", *(f"{key}: {value}" for key, value in headers)]
+        ).encode("latin-1") + b"\r\n\r\n"
+
+        pooled = not is_sse_request
+        attempts = 2 if pooled and body_stream is None and request.method in IDEMPOTENT_METHODS else 1
+        upstream: AsyncUpstream | None = None
+        upstream_started = time.perf_counter()
+        for attempt in range(attempts):
+            reused = False
+            try:
+                upstream, reused = await self._acquire(origin, pooled=pooled)
+                # A buffered body leaves with its head in one send.
+                upstream.writer.write(head + body if body is not None else head)
+                if body_stream is not None:
+                    chunked = "Transfer-Encoding" in dict(headers)
+                    async for chunk in body_stream:
+                        upstream.writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                        await upstream.writer.drain()
+                    if chunked:
+                        upstream.writer.write(b"0\r\n\r\n")
+                await upstream.writer.drain()
+                while True:
+                    response_head = await asyncio.wait_for(
+                        upstream.reader.readuntil(b"\r\n\r\n"), UPSTREAM_TIMEOUT_SECONDS
+                    )
+                    # Skip interim 1xx responses (e.g. 100 Continue) like http.client does.
+                    if not response_head.startswith((b"HTTP/1.1 1", b"HTTP/1.0 1")):
+                        break
+                record.upstream_seconds = time.perf_counter() - upstream_started
+                break
+            except MalformedChunkedBody as exc:
+                request_info(f"proxy_to_api rejected request body: {exc}")
+                self._discard(origin, upstream, pooled)
+                await self._send_error(writer, request, 400, "Malformed chunked request body")
+                return False
+            except ClientBodyError as exc:
+                # The client went away (or stalled) mid-body: nothing to answer, and the
+                # upstream is not at fault.
+                request_info(f"proxy_to_api: client disconnected while sending the request body ({exc})")
+                self._discard(origin, upstream, pooled)
+                return False
+            except ssl.SSLError as exc:
+                request_info(f"proxy_to_api SSL error: {exc}")
+                self._discard(origin, upstream, pooled)
+                record.upstream_error = "ssl"
+                await self._send_error(writer, request, 502, "Bad gateway: SSL upstream error")
+                return False
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError) as exc:
+                self._discard(origin, upstream, pooled)
+                upstream = None
+                if reused and attempt + 1 < attempts:
+                    # The pooled socket went stale between requests; try once on a fresh one.
+                    self.pool.note_retry()
+                    continue
+                request_info(f"proxy_to_api upstream connection error: {exc!r}")
+                if isinstance(exc, ConnectionRefusedError):
+                    # Take the worker out of rotation now; the supervisor's probe brings it back.
+                    self.api.set_healthy(origin, False)  # type: ignore[union-attr]
+                record.upstream_error = "connection"
+                await self._send_error(writer, request, 502, "Bad gateway: upstream connection error")
+                return False
+        assert upstream is not None
+
+        reusable = False
+        try:
+            status_line, _, header_blob = response_head.partition(b"\r\n")
+            parts = status_line.decode("latin-1").split(" ", 2)
+            status = int(parts[1])
+            reason = parts[2] if len(parts) > 2 else ""
+            upstream_headers = parse_header_lines(header_blob)
+            if upstream_headers is None:
+                raise ValueError("malformed response header")
+            content_type = (upstream_headers.get("Content-Type") or "").lower()
+            response_is_sse = is_sse_request or "text/event-stream" in content_type
+            upstream_will_close = parts[0] == "HTTP/1.0" or "close" in upstream_headers.get("Connection", "").lower()
+
+            out_headers = [
+                (key, value)
+                for key, value in upstream_headers.items()
+                if key.lower() not in ("transfer-encoding", "connection", "content-length", "keep-alive")
+            ]
+            if response_is_sse:
+                # SSE must be streamed and should not include Content-Length.
+                out_headers.append(("Cache-Control", "no-cache"))
+                out_headers.append(("X-Accel-Buffering", "no"))
+
+            no_body = request.method == "HEAD" or status in (204, 304) or 100 <= status < 200
+            if no_body:
+                body_iter = None
+            elif "chunked" in upstream_headers.get("Transfer-Encoding", "").lower():
+                body_iter = aiter_chunked_body(upstream.reader, idle_timeout=None if response_is_sse else UPSTREAM_TIMEOUT_SECONDS)
+            elif upstream_headers.get("Content-Length") is not None:
+                body_iter = aiter_fixed_body(
+                    upstream.reader, int(upstream_headers["Content-Length"]), idle_timeout=UPSTREAM_TIMEOUT_SECONDS
+                )
+            else:
+                upstream_will_close = True
+                body_iter = aiter_until_eof(upstream.reader, idle_timeout=None if response_is_sse else UPSTREAM_TIMEOUT_SECONDS)
+
+            keep_alive = request.keep_alive
+            declared = upstream_headers.get("Content-Length")
+            client_chunked = False
+            if declared is not None:
+                out_headers.append(("Content-Length", declared))
+            elif body_iter is not None:
+                if request.version >= "HTTP/1.1":
+                    client_chunked = True
+                    out_headers.append(("Transfer-Encoding", "chunked"))
+                else:
+                    keep_alive = False
+            payload = b""
+            if body_iter is not None and not response_is_sse and declared is not None:
+                length = int(declared)
+                if length <= self.proxy_buffer_bytes:
+                    # Small responses are read whole and sent with their head in one write.
+                    body_iter = None
+                    try:
+                        payload = await asyncio.wait_for(
+                            upstream.reader.readexactly(length), UPSTREAM_TIMEOUT_SECONDS
+                        )
+                    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+                        request_info(f"proxy_to_api upstream stream interrupted: {exc!r}")
+                        record.upstream_error = "connection"
+                        await self._send_error(writer, request, 502, "Bad gateway: upstream connection error")
+                        return False
+            self._write_head(writer, request, status, out_headers, keep_alive, reason=reason, body=payload)
+            await writer.drain()
+            if body_iter is None:
+                reusable = not upstream_will_close
+                return keep_alive
+            async def relay() -> None:
+                async for chunk in body_iter:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if client_chunked else chunk)
+                    await writer.drain()
+
+            try:
+                if response_is_sse:
+                    if METRICS.enabled:
+                        METRICS.add_sse_stream(1)
+                    # SSE clients never send after the request, so EOF on the reader means they left;
+                    # notice it now rather than at the next heartbeat write.
+                    relay_task = asyncio.create_task(relay())
+                    client_gone = asyncio.create_task(reader.read(1))
+                    for task in (relay_task, client_gone):
+                        # Mark outcomes as retrieved even when this coroutine is cancelled mid-wait.
+                        task.add_done_callback(lambda done_task: done_task.cancelled() or done_task.exception())
+                    try:
+                        done, _ = await asyncio.wait(
+                            {relay_task, client_gone}, return_when=asyncio.FIRST_COMPLETED
+                        )
+                    finally:
+                        relay_task.cancel()
+                        client_gone.cancel()
+                        if METRICS.enabled:
+                            METRICS.add_sse_stream(-1)
+                    if relay_task not in done:
+                        return False
+                    relay_task.result()
+                else:
+                    await relay()
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+                if response_is_sse:
+                    request_info(f"proxy_to_api SSE upstream read closed: {exc!r}")
+                else:
+                    request_info(f"proxy_to_api upstream stream interrupted: {exc!r}")
+                return False
+            if client_chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            reusable = not upstream_will_close and not response_is_sse
+            return keep_alive
+        except (ValueError, IndexError) as exc:
+            request_info(f"proxy_to_api invalid upstream response: {exc}")
+            record.upstream_error = "invalid"
+            await self._send_error(writer, request, 502, "Bad gateway: invalid upstream response")
+            return False
+        finally:
+            if reusable and pooled:
+                self._release(origin, upstream)
+            else:
+                self._discard(origin, upstream, pooled)
+
+    async def _acquire(self, origin: str, *, pooled: bool) -> tuple[AsyncUpstream, bool]:
+        if not pooled:
+            self.pool.record("dedicated")
+            return await self._connect(origin), False
+        slots = self._slots.get(origin)
+        if slots is None:
+            slots = self._slots[origin] = asyncio.Semaphore(self.pool.max_per_upstream)
+        await asyncio.wait_for(slots.acquire(), UPSTREAM_TIMEOUT_SECONDS)
+        idle = self._idle.get(origin, [])
+        now = time.monotonic()
+        while idle:
+            upstream, since = idle.pop()
+            if now - since <= self.pool.idle_timeout and not upstream.reader.at_eof():
+                self.pool.record("hits")
+                return upstream, True
+            self.pool.record("evictions")
+            upstream.writer.close()
+        self.pool.record("misses")
+        try:
+            return await self._connect(origin), False
+        except BaseException:
+            slots.release()
+            raise
+
+    async def _connect(self, origin: str) -> AsyncUpstream:
+        parsed = urllib.parse.urlparse(origin)
+        context = None
+        if parsed.scheme == "https":
+            context = self.pool.tls_context(bool(parsed.hostname and parsed.hostname.lower() in LOCAL_HOSTNAMES))
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                parsed.hostname,
+                port,
+                ssl=context,
+                server_hostname=parsed.hostname if context else None,
+                limit=MAX_UPGRADE_HEAD_BYTES,
+            ),
+            UPSTREAM_TIMEOUT_SECONDS,
+        )
+        return AsyncUpstream(reader, writer)
+
+    def _release(self, origin: str, upstream: AsyncUpstream) -> None:
+        self._idle.setdefault(origin, []).append((upstream, time.monotonic()))
+        self._slots[origin].release()
+
+    def _discard(self, origin: str, upstream: AsyncUpstream | None, pooled: bool) -> None:
+        if upstream is None:
+            return
+        upstream.writer.close()
+        if pooled:
+            self.pool.record("discarded")
+            self._slots[origin].release()
+
+    # -- WebSocket ------------------------------------------------------------
+
+    async def _tunnel_websocket(
+        self, request: ParsedRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        assert self.api is not None
+        if self._tunnels >= self.ws_max_tunnels:
+            request_info("websocket tunnel rejected: concurrent tunnel limit reached")
+            await self._send_error(writer, request, 503, "Too many WebSocket tunnels")
+            return
+        self._tunnels += 1
+        if request.record is not None:
+            request.record.route = "websocket"
+        origin = self.api.acquire(pinned=True)
+        upstream: AsyncUpstream | None = None
+        try:
+            try:
+                upstream = await self._connect(origin)
+                parsed = urllib.parse.urlparse(origin)
+                lines = [f"{request.method} {request.target} HTTP/1.1", f"Host: {parsed.netloc}"]
+                lines.extend(
+                    f"{key}: {value}"
+                    for key, value in request.headers.items()
+                    if key.lower() not in ("host", "x-forwarded-proto")
+                )
+                lines.append("X-Forwarded-Proto: https")
+                upstream.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+                await upstream.writer.drain()
+                head = await asyncio.wait_for(upstream.reader.readuntil(b"\r\n\r\n"), UPSTREAM_TIMEOUT_SECONDS)
+            except ssl.SSLError as exc:
+                request_info(f"websocket tunnel SSL error: {exc}")
+                if request.record is not None:
+                    request.record.upstream_error = "ssl"
+                await self._send_error(writer, request, 502, "Bad gateway: SSL upstream error")
+                return
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError) as exc:
+                request_info(f"websocket tunnel handshake failed: {exc!r}")
+                if request.record is not None:
+                    request.record.upstream_error = "connection"
+                await self._send_error(writer, request, 502, "Bad gateway: upstream upgrade failed")
+                return
+            status_parts = head.split(b"\r\n", 1)[0].split(b" ", 2)
+            status = int(status_parts[1]) if len(status_parts) > 1 and status_parts[1].isdigit() else 502
+            if request.record is not None:
+                request.record.status = status
+            if not ACCESS_LOG.enabled:
+                info(f'"{request.request_line}" {status} -')
+            writer.write(head)
+            await writer.drain()
+            if status != 101:
+                return
+            reason = await splice_streams(reader, writer, upstream.reader, upstream.writer, self.ws_idle_timeout)
+            request_info(f"websocket tunnel closed: {reason}")
+        finally:
+            self._tunnels -= 1
+            self.api.release(origin)
+            if upstream is not None:
+                upstream.writer.close()
+
+
+class ParsedRequest(NamedTuple):
+    method: str
+    target: str
+    version: str
+    headers: http.client.HTTPMessage
+    request_line: str
+    force_close: bool = False
+    record: RequestRecord | None = None
 
-            connection_kwargs: dict[str, object] = {"timeout": None if is_sse_request else 20}
-            if (
-                conn_cls is http.client.HTTPSConnection
-                and parsed.hostname
-                and parsed.hostname.lower() in ("localhost", "127.0.0.1", "::1")
-            ):
-                # Allow local self-signed certs used by the secure local deploy.
-                local_ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-                local_ctx.check_hostname = False
-                local_ctx.verify_mode = ssl.CERT_NONE
-                connection_kwargs["context"] = local_ctx
-            connection = conn_cls(parsed.hostname, parsed.port, **connection_kwargs)
-            try:
-                path = self.path
-                try:
-                    connection.request(self.command, path, body=body, headers=headers)
-                    response = connection.getresponse()
-                except ssl.SSLError as exc:
-                    info(f"proxy_to_api SSL error: {exc}")
-                    safe_send_error(502, "Bad gateway: SSL upstream error")
-                    return
-                except OSError as exc:
-                    info(f"proxy_to_api upstream connection error: {exc}")
-                    safe_send_error(502, "Bad gateway: upstream connection error")
-                    return
+    @property
+    def keep_alive(self) -> bool:
+        if self.force_close:
+            return False
+        connection = self.headers.get("Connection", "").lower()
+        if self.version >= "HTTP/1.1":
+            return "close" not in connection
+        return "keep-alive" in connection
 
-                content_type = (response.getheader("Content-Type") or "").lower()
-                response_is_sse = is_sse_request or "text/event-stream" in content_type
 
-                self.send_response(response.status, response.reason)
-                for key, value in response.getheaders():
-                    lower = key.lower()
-                    if lower in ("transfer-encoding", "connection", "content-length"):
-                        continue
-                    self.send_header(key, value)
-                if response_is_sse:
-                    # SSE must be streamed and should not include Content-Length.
-                    self.send_header("Cache-Control", "no-cache")
-                    self.send_header("X-Accel-Buffering", "no")
-                    self.end_headers()
-                    while True:
-                        try:
-                            chunk = response.read(16 * 1024)
-                        except OSError as exc:
-                            info(f"proxy_to_api SSE upstream read closed: {exc}")
-                            break
-                        if not chunk:
-                            break
-                        try:
-                            self.wfile.write(chunk)
-                            self.wfile.flush()
-                        except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError):
-                            break
+def parse_request_head(head: bytes) -> ParsedRequest | None:
+    request_line, _, header_blob = head.partition(b"\r\n")
+    try:
+        text = request_line.decode("latin-1")
+        method, target, version = text.split(" ")
+    except ValueError:
+        return None
+    if not version.startswith("HTTP/1.") or not target.startswith("/"):
+        return None
+    headers = parse_header_lines(header_blob)
+    if headers is None:
+        return None
+    return ParsedRequest(method, target, version, headers, text)
+
+
+def parse_header_lines(blob: bytes) -> http.client.HTTPMessage | None:
+    """Header fields of a request or response head, without its start line.
+
+    A fraction of email.parser's cost on the asyncio engine's per-request path. Returns None for
+    obsolete line folding and malformed field names, which RFC 9112 says to reject.
+    """
+    headers = http.client.HTTPMessage()
+    for line in blob.decode("latin-1").split("\n"):
+        line = line.removesuffix("\r")
+        if not line:
+            continue
+        name, colon, value = line.partition(":")
+        if not colon or not name or " " in name or "\t" in name:
+            return None
+        headers[name] = value.strip(" \t")
+    return headers
+
+
+async def aiter_fixed_body(
+    reader: asyncio.StreamReader, length: int, *, idle_timeout: float | None = None
+):
+    remaining = length
+    while remaining > 0:
+        # read() returns at most what the reader has buffered, which its limit already bounds; taking
+        # all of it means fewer, larger writes on the other side.
+        chunk = await asyncio.wait_for(reader.read(remaining), idle_timeout)
+        if not chunk:
+            raise ConnectionResetError("peer closed the connection mid-body")
+        remaining -= len(chunk)
+        yield chunk
+
+
+async def aiter_chunked_body(reader: asyncio.StreamReader, *, idle_timeout: float | None = None):
+    """Async twin of iter_chunked_body."""
+    while True:
+        line = await asyncio.wait_for(reader.readline(), idle_timeout)
+        if not line:
+            raise ConnectionResetError("peer closed the connection mid-body")
+        if not line.endswith(b"\n"):
+            raise MalformedChunkedBody("malformed chunk size line")
+        try:
+            size = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise MalformedChunkedBody("malformed chunk size line") from None
+        if size < 0:
+            raise MalformedChunkedBody("malformed chunk size line")
+        if size == 0:
+            while True:
+                trailer = await asyncio.wait_for(reader.readline(), idle_timeout)
+                if not trailer or trailer in (b"\r\n", b"\n"):
                     return
+        if size <= PROXY_STREAM_CHUNK_BYTES:
+            # Small chunks (every SSE event) arrive with their line ending in one read.
+            data = await asyncio.wait_for(reader.readexactly(size + 1), idle_timeout)
+            ending = data[size:]
+            if ending == b"\r":
+                ending = await asyncio.wait_for(reader.readexactly(1), idle_timeout)
+            if ending != b"\n":
+                raise MalformedChunkedBody("missing CRLF after chunk data")
+            yield data[:size]
+            continue
+        async for chunk in aiter_fixed_body(reader, size, idle_timeout=idle_timeout):
+            yield chunk
+        if await asyncio.wait_for(reader.readline(), idle_timeout) not in (b"\r\n", b"\n"):
+            raise MalformedChunkedBody("missing CRLF after chunk data")
 
-                payload = response.read()
-                self.send_header("Content-Length", str(len(payload)))
-                self.end_headers()
-                if payload:
-                    try:
-                        self.wfile.write(payload)
-                    except (BrokenPipeError, ConnectionAbortedError, ConnectionResetError, OSError):
-                        pass
-            finally:
-                connection.close()
 
-        def log_message(self, fmt: str, *args: object) -> None:
-            info(fmt % args)
+async def aclient_body(chunks):
+    """Async twin of client_body."""
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError) as exc:
+        raise ClientBodyError(repr(exc)) from exc
 
-    return SecureHandler
+
+async def aiter_until_eof(reader: asyncio.StreamReader, *, idle_timeout: float | None = None):
+    while True:
+        chunk = await asyncio.wait_for(reader.read(PROXY_STREAM_CHUNK_BYTES), idle_timeout)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def splice_streams(
+    client_reader: asyncio.StreamReader,
+    client_writer: asyncio.StreamWriter,
+    upstream_reader: asyncio.StreamReader,
+    upstream_writer: asyncio.StreamWriter,
+    idle_timeout: float,
+) -> str:
+    """Async twin of splice_sockets: relay until one side closes or both go quiet."""
+    last_activity = time.monotonic()
+
+    async def pump(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, side: str) -> str:
+        nonlocal last_activity
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(PROXY_STREAM_CHUNK_BYTES), idle_timeout)
+            except asyncio.TimeoutError:
+                if time.monotonic() - last_activity >= idle_timeout:
+                    return "idle timeout"
+                continue
+            except OSError as exc:
+                return f"recv error ({exc})"
+            if not data:
+                return f"{side} closed"
+            last_activity = time.monotonic()
+            try:
+                writer.write(data)
+                await writer.drain()
+            except OSError as exc:
+                return f"send error ({exc})"
+
+    tasks = [
+        asyncio.create_task(pump(client_reader, upstream_writer, "client")),
+        asyncio.create_task(pump(upstream_reader, client_writer, "upstream")),
+    ]
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    return next(iter(done)).result()
+
+
+def create_listen_socket(address: tuple[str, int], *, reuse_port: bool, listen: bool = True) -> socket.socket:
+    # An explicit IPPROTO_TCP (as getaddrinfo gives asyncio) is what makes asyncio set TCP_NODELAY
+    # on accepted connections.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        if listen:
+            sock.listen(1024)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+class PreforkFrontend:
+    """--workers N: forked frontend processes sharing the HTTPS port.
+
+    On Linux every worker listens on its own SO_REUSEPORT socket, so the kernel spreads
+    connections and there is no accept thundering herd; elsewhere they accept from one inherited
+    socket. The parent keeps watch mode, release activation and the API, relays SIGTERM, and
+    pokes workers with SIGUSR1 whenever it activates a release. Exposes the same
+    serve_forever/shutdown/server_close trio as the single-process servers.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        address: tuple[str, int],
+        make_server: Callable[[socket.socket], tuple[ThreadingHTTPServer | AsyncFrontendServer, dict[str, Callable[[], dict[str, object]]]]],
+        *,
+        stats_interval: int = 0,
+        profile: bool = False,
+    ) -> None:
+        if not hasattr(os, "fork"):
+            fail("--workers requiere un sistema con fork() (Linux/macOS).")
+        self.pids: list[int] = []
+        self._stopping = threading.Event()
+        context = multiprocessing.get_context("fork")
+        self._ready = context.Event()
+        reuse_port = sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+        if reuse_port:
+            # SO_REUSEPORT would let us join another server already on the port; a plain bind
+            # first makes that fail loudly instead.
+            create_listen_socket(address, reuse_port=False, listen=False).close()
+        # With SO_REUSEPORT the parent only holds a bound, non-listening socket: it claims the
+        # port (and fails fast if it is taken) without ever being handed connections.
+        parent_socket = create_listen_socket(address, reuse_port=reuse_port, listen=not reuse_port)
+        if not reuse_port:
+            parent_socket.setblocking(False)
+        sys.stdout.flush()
+        for index in range(count):
+            pid = os.fork()
+            if pid == 0:
+                self._run_worker(
+                    index, address, None if reuse_port else parent_socket, make_server, stats_interval, profile
+                )
+            self.pids.append(pid)
+        self._parent_socket = parent_socket
+        RELEASE_POINTER.listeners.append(self._notify_release)
+
+    def release(self) -> None:
+        """Let workers start serving (called once the API is ready)."""
+        self._ready.set()
+
+    def serve_forever(self) -> None:
+        while self.pids and not self._stopping.wait(0.5):
+            self._reap(block=False)
+        self._parent_socket.close()
+
+    def shutdown(self) -> None:
+        self._stopping.set()
+        self._signal_workers(signal.SIGTERM)
+
+    def server_close(self) -> None:
+        self._signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + 10
+        while self.pids and time.monotonic() < deadline:
+            self._reap(block=False)
+            time.sleep(0.1)
+        self._signal_workers(signal.SIGKILL)
+        while self.pids:
+            self._reap(block=True)
+
+    def _notify_release(self, _name: str) -> None:
+        self._signal_workers(signal.SIGUSR1)
+
+    def toggle_profiler(self) -> None:
+        # Each worker samples its own threads and writes its own profile files.
+        self._signal_workers(signal.SIGUSR2)
+
+    def _signal_workers(self, signum: int) -> None:
+        for pid in self.pids:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signum)
+
+    def _reap(self, *, block: bool) -> None:
+        for pid in list(self.pids):
+            try:
+                done, status = os.waitpid(pid, 0 if block else os.WNOHANG)
+            except ChildProcessError:
+                done, status = pid, 0
+            if done == 0:
+                continue
+            self.pids.remove(pid)
+            if not self._stopping.is_set():
+                info(f"Frontend worker {pid} termino inesperadamente (status {status}); quedan {len(self.pids)}.")
+
+    @staticmethod
+    def _supervise(
+        parent_pid: int,
+        requests: dict[str, bool],
+        stop_event: threading.Event,
+        server: ThreadingHTTPServer | AsyncFrontendServer,
+    ) -> None:
+        """Act on the flags set by the worker's signal handlers, and stop once orphaned."""
+        while not stop_event.wait(0.2):
+            if requests.pop("profile", False):
+                PROFILER.toggle()
+            # If the parent is killed outright (SIGKILL) nobody relays SIGTERM.
+            if requests.get("stop") or os.getppid() != parent_pid:
+                stop_event.set()
+                server.shutdown()
+                return
+
+    def _run_worker(
+        self,
+        index: int,
+        address: tuple[str, int],
+        shared_socket: socket.socket | None,
+        make_server: Callable[[socket.socket], tuple[ThreadingHTTPServer | AsyncFrontendServer, dict[str, Callable[[], dict[str, object]]]]],
+        stats_interval: int,
+        profile: bool,
+    ) -> None:
+        """Body of a forked worker; never returns."""
+        code = 0
+        parent_pid = os.getppid()
+        try:
+            # Ctrl+C reaches the whole process group; only the parent decides when workers stop.
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGUSR1, lambda *_: RELEASE_POINTER.invalidate())
+            # Handlers only set flags: they run on the main thread, which may be inside
+            # Thread.start() for a new connection (or in an earlier handler: the parent sends
+            # SIGTERM twice), so taking any lock or starting a thread here can deadlock.
+            requests: dict[str, bool] = {}
+            signal.signal(signal.SIGUSR2, lambda *_: requests.__setitem__("profile", True))
+            PROFILER.suffix = f"-worker{index}"
+            listen_socket = shared_socket or create_listen_socket(address, reuse_port=True)
+            self._ready.wait()
+            server, sources = make_server(listen_socket)
+            sources = {f"worker{index} {name}": source for name, source in sources.items()}
+            # Until here SIGTERM keeps its default action: there is nothing to shut down cleanly.
+            signal.signal(signal.SIGTERM, lambda *_: requests.__setitem__("stop", True))
+            stop_event = threading.Event()
+            METRICS.bind_worker(index, stop_event)
+            # One file per worker: concurrent rotation of a shared file is not safe across processes.
+            ACCESS_LOG.start(suffix=f"-worker{index}")
+            threading.Thread(
+                target=self._supervise, args=(parent_pid, requests, stop_event, server), daemon=True
+            ).start()
+            if stats_interval > 0:
+                threading.Thread(target=report_stats, args=(stats_interval, stop_event, sources), daemon=True).start()
+            if profile:
+                PROFILER.start()
+            # Load the release and its asset pack now, not on the first request.
+            RELEASE_POINTER.current()
+            server.serve_forever()
+            server.server_close()
+            log_stats(sources)
+            ACCESS_LOG.stop()
+            PROFILER.stop()
+        except BaseException as exc:  # noqa: BLE001 - a worker must never fall back into the parent's code
+            if not isinstance(exc, SystemExit) or exc.code:
+                info(f"Frontend worker {index} fallo: {exc!r}")
+                code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
 
 
 def start_http_redirect_thread(http_port: int, https_port: int) -> threading.Thread:
-    class RedirectHandler(http.server.BaseHTTPRequestHandler):
+    class RedirectHandler(KeepAliveHandlerMixin, http.server.BaseHTTPRequestHandler):
         def do_GET(self) -> None:  # noqa: N802
             location = f"https://localhost:{https_port}{self.path}"
             self.send_response(308)
             self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            if self.has_request_body():
+                # The body is never read, so the connection cannot carry another request.
+                self.send_header("Connection", "close")
             self.end_headers()
 
         def do_POST(self) -> None:  # noqa: N802
@@ -536,9 +4189,12 @@ def start_node_api_https(
     key_file: Path,
     frontend_origin: str,
     use_https: bool,
+    worker_count: int = 1,
 ) -> subprocess.Popen[str]:
     env = os.environ.copy()
     env["PORT"] = str(api_port)
+    # With several workers the API shares sync events through server/data and splits its rate limit.
+    env["API_WORKER_COUNT"] = str(worker_count)
     env["CORS_ORIGIN"] = frontend_origin
     env["APP_BASE_URL"] = frontend_origin
     if use_https:
@@ -556,99 +4212,823 @@ def start_node_api_https(
         fail("No se encontro Node.js en PATH (node).")
 
 
-def watch_for_updates(interval_seconds: int, stop_event: threading.Event) -> None:
-    info("Watch mode enabled. Waiting for source changes...")
-    last_hash = source_snapshot_hash()
-    while not stop_event.is_set():
-        time.sleep(max(1, interval_seconds))
-        current_hash = source_snapshot_hash()
-        if current_hash == last_hash:
-            continue
-        info("Changes detected. Rebuilding and deploying new release...")
+class ApiSupervisor:
+    """Runs the Node API workers: /healthz readiness, crash restarts with backoff, blue/green deploys.
+
+    Worker i alternates between ports api_port + i and api_port + workers + i. A restart starts
+    the replacement on the other port, waits until /healthz answers, switches the proxy's
+    upstream and only then drains and stops the old process, so deploys never cut the proxy off
+    from a live API. Unhealthy workers leave the rotation until they answer again or get replaced.
+    """
+
+    CRASH_POLL_SECONDS = 0.25
+    HEALTH_INTERVAL_SECONDS = 2.0
+    HEALTH_FAILURES_BEFORE_RESTART = 3
+    STARTUP_TIMEOUT_SECONDS = 30.0
+    DRAIN_TIMEOUT_SECONDS = 30.0
+    MIN_RESTART_DELAY_SECONDS = 0.5
+    MAX_RESTART_DELAY_SECONDS = 30.0
+
+    def __init__(
+        self,
+        upstream_pool: UpstreamPool,
+        *,
+        api_port: int,
+        use_https: bool,
+        workers: int = 1,
+        shared_upstreams: bool = False,
+        **options: object,
+    ) -> None:
+        self.pool = upstream_pool
+        self.workers = max(1, workers)
+        self.base_port = api_port
+        self.scheme = "https" if use_https else "http"
+        self.options = dict(options, use_https=use_https)
+        self._ports = [api_port + slot for slot in range(self.workers)]
+        self.upstreams = ApiUpstreams(
+            [self.origin_for(port) for port in self._ports],
+            candidates=[self.origin_for(api_port + offset) for offset in range(2 * self.workers)],
+            shared=shared_upstreams,
+        )
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self._procs: list[subprocess.Popen[str] | None] = [None] * self.workers
+        self._retiring: list[subprocess.Popen[str]] = []
+        self._stop = threading.Event()
+        self._monitor_thread = threading.Thread(target=self._monitor, name="api-supervisor", daemon=True)
+
+    def origin_for(self, port: int) -> str:
+        return f"{self.scheme}://localhost:{port}"
+
+    def alternate_port(self, slot: int, port: int) -> int:
+        blue = self.base_port + slot
+        return blue + self.workers if port == blue else blue
+
+    def start(self) -> None:
+        """Spawn every worker and block until each answers /healthz (no background threads)."""
+        for slot, port in enumerate(self._ports):
+            # Worker 0 first: on a fresh checkout it creates the signing keys the others then load.
+            proc = self._spawn(port)
+            if not self._wait_ready(proc, port):
+                self._terminate(proc)
+                self.stop()
+                fail(f"La API no respondio en {self.origin_for(port)}/healthz.")
+            with self._lock:
+                self._procs[slot] = proc
+
+    def start_monitor(self) -> None:
+        """Crash and health supervision; started after any prefork fork."""
+        self._monitor_thread.start()
+
+    def restart(self) -> None:
+        """Blue/green restart of every worker; on failure the current ones keep serving."""
+        with self._restart_lock:
+            with self._lock:
+                old_procs, old_ports = list(self._procs), list(self._ports)
+            new_ports = [self.alternate_port(slot, port) for slot, port in enumerate(old_ports)]
+            new_procs = [self._spawn(port) for port in new_ports]
+            ready = [self._wait_ready(proc, port) for proc, port in zip(new_procs, new_ports)]
+            if not all(ready):
+                for proc in new_procs:
+                    self._terminate(proc)
+                fail("La nueva API no respondio en /healthz; se mantiene la anterior.")
+            with self._lock:
+                self._procs, self._ports = list(new_procs), new_ports
+                self._retiring.extend(proc for proc in old_procs if proc is not None)
+            old_origins = self.upstreams.replace_all([self.origin_for(port) for port in new_ports])
+            info(f"API activa: {', '.join(self.upstreams.origins)}")
+        for proc, origin in zip(old_procs, old_origins):
+            if proc is not None:
+                threading.Thread(target=self._retire, args=(proc, origin), daemon=True).start()
+
+    def restart_worker(self, slot: int) -> None:
+        """Replace one worker (crashed or unhealthy) without touching the others."""
+        with self._restart_lock:
+            with self._lock:
+                old_proc, old_port = self._procs[slot], self._ports[slot]
+            new_port = self.alternate_port(slot, old_port)
+            proc = self._spawn(new_port)
+            if not self._wait_ready(proc, new_port):
+                self._terminate(proc)
+                fail(f"El worker {slot} de la API no respondio en {self.origin_for(new_port)}/healthz.")
+            with self._lock:
+                self._procs[slot], self._ports[slot] = proc, new_port
+                if old_proc is not None:
+                    self._retiring.append(old_proc)
+            old_origin = self.origin_for(old_port)
+            self.upstreams.replace(old_origin, self.origin_for(new_port))
+            info(f"API worker {slot} activo: {self.origin_for(new_port)}")
+        if old_proc is not None:
+            threading.Thread(target=self._retire, args=(old_proc, old_origin), daemon=True).start()
+
+    def terminate(self) -> None:
+        """Ask every API process to exit without waiting for them."""
+        self._stop.set()
+        for proc in [*self._procs, *self._retiring]:
+            if proc and proc.poll() is None:
+                proc.terminate()
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            procs = [*self._procs, *self._retiring]
+        for proc in procs:
+            if proc is not None:
+                self._terminate(proc)
+
+    def is_healthy(self, port: int) -> bool:
+        connection = self.pool.connect(self.origin_for(port), timeout=2)
         try:
-            maybe_build_and_deploy()
-            info("Update applied successfully.")
-            last_hash = current_hash
-        except SystemExit:
-            info("Update failed. Keeping previous release active.")
+            connection.request("GET", "/healthz")
+            response = connection.getresponse()
+            response.read()
+            return response.status == 200
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            connection.close()
+
+    def _spawn(self, port: int) -> subprocess.Popen[str]:
+        return start_node_api_https(api_port=port, worker_count=self.workers, **self.options)  # type: ignore[arg-type]
+
+    def _wait_ready(self, proc: subprocess.Popen[str], port: int) -> bool:
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT_SECONDS
+        while time.monotonic() < deadline and not self._stop.is_set():
+            if proc.poll() is not None:
+                return False
+            if self.is_healthy(port):
+                return True
+            time.sleep(0.2)
+        return False
+
+    def _retire(self, proc: subprocess.Popen[str], origin: str) -> None:
+        if not self.upstreams.wait_drained(origin, self.DRAIN_TIMEOUT_SECONDS):
+            info(f"API {origin}: streams still open after {self.DRAIN_TIMEOUT_SECONDS:.0f}s; closing them.")
+        self._terminate(proc)
+        self.pool.forget(origin)
+        with self._lock:
+            if proc in self._retiring:
+                self._retiring.remove(proc)
+
+    @staticmethod
+    def _terminate(proc: subprocess.Popen[str]) -> None:
+        if proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def _monitor(self) -> None:
+        failures = [0] * self.workers
+        delays = [self.MIN_RESTART_DELAY_SECONDS] * self.workers
+        restart_at: list[float | None] = [None] * self.workers
+        next_probe = time.monotonic() + self.HEALTH_INTERVAL_SECONDS
+        # Exit status is cheap to poll often; /healthz probes run every HEALTH_INTERVAL_SECONDS.
+        while not self._stop.wait(self.CRASH_POLL_SECONDS):
+            probe = time.monotonic() >= next_probe
+            if probe:
+                next_probe = time.monotonic() + self.HEALTH_INTERVAL_SECONDS
+            for slot in range(self.workers):
+                with self._lock:
+                    proc, port = self._procs[slot], self._ports[slot]
+                if proc is None:
+                    continue
+                origin = self.origin_for(port)
+                if restart_at[slot] is None:
+                    code = proc.poll()
+                    if code is not None:
+                        self.upstreams.set_healthy(origin, False)
+                        info(f"API worker {slot} termino inesperadamente (code {code}); reinicio en {delays[slot]:.1f}s.")
+                    elif probe:
+                        healthy = self.is_healthy(port)
+                        self.upstreams.set_healthy(origin, healthy)
+                        failures[slot] = 0 if healthy else failures[slot] + 1
+                        if healthy:
+                            delays[slot] = self.MIN_RESTART_DELAY_SECONDS
+                        if failures[slot] < self.HEALTH_FAILURES_BEFORE_RESTART:
+                            continue
+                        info(f"API worker {slot} no responde a /healthz; reinicio en {delays[slot]:.1f}s.")
+                    else:
+                        continue
+                    restart_at[slot] = time.monotonic() + delays[slot]
+                if time.monotonic() < restart_at[slot]:  # type: ignore[operator]
+                    continue
+                restart_at[slot] = None
+                failures[slot] = 0
+                delays[slot] = min(delays[slot] * 2, self.MAX_RESTART_DELAY_SECONDS)
+                try:
+                    self.restart_worker(slot)
+                except SystemExit:
+                    info(f"Reinicio del worker {slot} fallido; se reintentara.")
+
+
+class PollingWatcher:
+    """Fallback watcher: diff a stat() snapshot of the sources every interval."""
+
+    kind = "polling"
+
+    def __init__(self, interval_seconds: int) -> None:
+        self.interval_seconds = max(1, interval_seconds)
+        self._snapshot = source_snapshot()
+
+    def wait_for_changes(self, stop_event: threading.Event) -> set[str]:
+        while not stop_event.wait(self.interval_seconds):
+            current = source_snapshot()
+            changed = {
+                rel for rel in current.keys() | self._snapshot.keys() if current.get(rel) != self._snapshot.get(rel)
+            }
+            self._snapshot = current
+            if changed:
+                return changed
+        return set()
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify watcher (via ctypes): no idle cost and events within milliseconds."""
+
+    kind = "inotify"
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    # IN_MODIFY fires on every write(); IN_CLOSE_WRITE is one event per save.
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self) -> None:
+        import ctypes
+        import ctypes.util
+
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        self._dirs: dict[int, Path] = {}
+        try:
+            # ROOT itself only for the top-level config files and for watched dirs appearing later.
+            self._add_watch(ROOT)
+            for rel in WATCH_DIRS:
+                if (ROOT / rel).is_dir():
+                    self._add_tree(ROOT / rel)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, directory: Path) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch {directory}: {os.strerror(errno)}")
+        self._dirs[wd] = directory
+
+    def _add_tree(self, top: Path) -> None:
+        for current, dirnames, _ in os.walk(top):
+            # Pruned dirs (including the API's runtime data) are never subscribed to.
+            prune_watched_dirs(current, dirnames)
+            self._add_watch(Path(current))
+
+    def _read(self, timeout: float) -> set[str]:
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed: set[str] = set()
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            start = offset + self.EVENT_HEADER.size
+            name = data[start : start + length].split(b"\0", 1)[0]
+            offset = start + length
+            if mask & self.IN_Q_OVERFLOW:
+                # The kernel dropped events; report the watched roots so the caller still redeploys.
+                changed.update(WATCH_DIRS)
+                continue
+            if mask & self.IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+            rel_path = path.relative_to(ROOT).as_posix()
+            is_new_dir = bool(mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO))
+            if directory == ROOT:
+                if rel_path in WATCH_FILES:
+                    changed.add(rel_path)
+                elif rel_path in WATCH_DIRS and is_new_dir:
+                    self._watch_new_dir(path)
+                    changed.add(rel_path)
+                continue
+            if is_ignored_change(rel_path):
+                continue
+            if is_new_dir:
+                self._watch_new_dir(path)
+            changed.add(rel_path)
+        return changed
+
+    def _watch_new_dir(self, path: Path) -> None:
+        try:
+            self._add_tree(path)
+        except OSError as exc:
+            info(f"No se pudo vigilar {path}: {exc}")
+
+    def wait_for_changes(self, stop_event: threading.Event) -> set[str]:
+        changed: set[str] = set()
+        while not changed and not stop_event.is_set():
+            changed = self._read(0.5)
+        deadline = time.monotonic() + WATCH_MAX_BATCH_SECONDS
+        while changed and time.monotonic() < deadline:
+            more = self._read(WATCH_DEBOUNCE_SECONDS)
+            if not more:
+                break
+            changed |= more
+        return changed
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PersistentFrontendBuilder:
+    """Keep one `vite build --watch` process alive and release every build it finishes.
+
+    Vite rebuilds incrementally from its in-memory module graph, so an edit costs the rebuild
+    only, not Node startup plus config load plus a full build. A dead process is restarted with
+    exponential backoff.
+    """
+
+    BUILD_DONE_MARKER = "built in"
+    MAX_RESTART_DELAY_SECONDS = 30.0
+
+    def __init__(self, on_build: Callable[[], object]) -> None:
+        self.on_build = on_build
+        self._proc: subprocess.Popen[str] | None = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._restart_requested = False
+        self._thread = threading.Thread(target=self._run, name="vite-watch", daemon=True)
+
+    def start(self) -> None:
+        vite_bin = ROOT / "node_modules" / "vite" / "bin" / "vite.js"
+        if not vite_bin.exists():
+            fail("No se encontro node_modules/vite. Ejecuta npm install.")
+        self._thread.start()
+
+    def restart(self) -> None:
+        """Restart the build process, e.g. after package.json or .env changed."""
+        with self._lock:
+            self._restart_requested = True
+            proc = self._proc
+        if proc and proc.poll() is None:
+            proc.terminate()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        with self._lock:
+            proc = self._proc
+        if proc and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        self._thread.join(timeout=5)
+
+    def _spawn(self) -> subprocess.Popen[str]:
+        # Run vite.js with node directly: an npm wrapper would leave vite orphaned on terminate().
+        cmd = resolve_command(["node", str(ROOT / "node_modules" / "vite" / "bin" / "vite.js"), "build", "--watch"])
+        info("Running: vite build --watch")
+        return subprocess.Popen(
+            cmd,
+            cwd=str(ROOT),
+            env=frontend_build_env(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stopping.is_set():
+            try:
+                proc = self._spawn()
+            except (FileNotFoundError, SystemExit):
+                info("No se pudo iniciar vite build --watch (node no encontrado).")
+                return
+            with self._lock:
+                self._proc = proc
+                self._restart_requested = False
+            built = False
+            for line in proc.stdout or ():
+                line = line.rstrip()
+                if line:
+                    print(f"[vite] {line}", flush=True)
+                if self.BUILD_DONE_MARKER in line:
+                    built = True
+                    self._release_build()
+            code = proc.wait()
+            with self._lock:
+                restart_requested = self._restart_requested
+            if self._stopping.is_set():
+                return
+            if restart_requested:
+                info("Reiniciando vite build --watch...")
+                delay = 1.0
+                continue
+            delay = 1.0 if built else min(delay * 2, self.MAX_RESTART_DELAY_SECONDS)
+            info(f"vite build --watch termino (code {code}); reinicio en {delay:.0f}s.")
+            self._stopping.wait(delay)
+
+    def _release_build(self) -> None:
+        started = time.perf_counter()
+        try:
+            self.on_build()
+        except (OSError, SystemExit) as exc:
+            METRICS.observe_stage("release", time.perf_counter() - started, ok=False)
+            # dist/ may already be mid-rewrite by the next rebuild; that build will release itself.
+            info(f"No se pudo crear la release de este build: {exc}")
+            return
+        METRICS.observe_stage("release", time.perf_counter() - started, ok=True)
+        info(f"Release creada en {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+
+def create_source_watcher(interval_seconds: int) -> InotifyWatcher | PollingWatcher:
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as exc:
+            info(f"inotify no disponible ({exc}); se usa polling.")
+    return PollingWatcher(interval_seconds)
+
+
+def describe_changes(changed: set[str], limit: int = 5) -> str:
+    paths = sorted(changed)
+    listed = ", ".join(paths[:limit])
+    if len(paths) > limit:
+        listed += f" (+{len(paths) - limit} mas)"
+    return listed
+
+
+def classify_changes(changed: set[str]) -> set[str]:
+    """Map changed paths to the deploy stages they affect: "frontend" and/or "api".
+
+    The API's own runtime writes (server/data, BACKUP_DIR) map to no stage: restarting the API
+    for them would make every vault write or backup trigger another restart.
+    """
+    stages: set[str] = set()
+    for path in changed:
+        if is_api_runtime_path(path):
+            continue
+        top = path.split("/", 1)[0]
+        if top == "server":
+            stages.add("api")
+        elif path in ("package.json", "package-lock.json", ".env"):
+            # Dependencies and env (API namespace, ports) feed both the bundle and the API.
+            stages.update(("frontend", "api"))
+        else:
+            stages.add("frontend")
+    return stages
+
+
+def run_stage(name: str, action: Callable[[], object]) -> bool:
+    started = time.perf_counter()
+    try:
+        action()
+    except SystemExit:
+        METRICS.observe_stage(name, time.perf_counter() - started, ok=False)
+        info(f"[{name}] fallo tras {time.perf_counter() - started:.2f}s")
+        return False
+    METRICS.observe_stage(name, time.perf_counter() - started, ok=True)
+    info(f"[{name}] {time.perf_counter() - started:.2f}s")
+    return True
+
+
+def watch_for_updates(
+    interval_seconds: int,
+    stop_event: threading.Event,
+    builder: PersistentFrontendBuilder | None = None,
+    api: ApiSupervisor | None = None,
+) -> None:
+    watcher = create_source_watcher(interval_seconds)
+    info(f"Watch mode enabled ({watcher.kind}). Waiting for source changes...")
+    try:
+        while not stop_event.is_set():
+            changed = watcher.wait_for_changes(stop_event)
+            if not changed:
+                continue
+            stages = classify_changes(changed)
+            if not stages:
+                continue
+            info(f"Changes detected: {describe_changes(changed)} -> {', '.join(sorted(stages))}")
+            started = time.perf_counter()
+            ok = True
+            if "frontend" in stages:
+                if builder is None:
+                    input_hash = build_input_hash()
+                    cached = find_release_for_inputs(input_hash)
+                    if cached:
+                        # A touch or a revert: same bytes as an existing release, no vite build.
+                        ok = run_stage("release", lambda: reuse_release(cached, input_hash))
+                    else:
+                        ok = run_stage("build", build_frontend) and run_stage(
+                            "release", lambda: create_release(input_hash)
+                        )
+                elif any(path in WATCH_FILES or path.startswith("public") for path in changed):
+                    # vite follows src/ through its module graph; it only needs a restart
+                    # when its config, env or copied public/ files change.
+                    run_stage("builder restart", builder.restart)
+                else:
+                    info("[build] delegado a vite build --watch")
+            if "api" in stages:
+                if api is None:
+                    info("[api] la API no la inicio este proceso; no se reinicia.")
+                else:
+                    ok = run_stage("api restart", api.restart) and ok
+            if ok:
+                info(f"Update applied successfully in {time.perf_counter() - started:.2f}s.")
+            else:
+                info("Update failed. Keeping the previous version active.")
+    finally:
+        watcher.close()
+
+
+def handle_signal_requests(
+    requests: dict[str, bool],
+    stop_event: threading.Event,
+    toggle_profiler: Callable[[], object],
+    server: ThreadingHTTPServer | AsyncFrontendServer | PreforkFrontend,
+    api: ApiSupervisor | None,
+) -> None:
+    """Act on the flags set by the parent's signal handlers until the stack stops."""
+    while not stop_event.wait(0.2):
+        if requests.pop("profile", False):
+            toggle_profiler()
+        if requests.get("stop"):
+            stop_event.set()
+            # serve_forever runs on the main thread, so shutdown() must be requested from this one.
+            server.shutdown()
+            if api:
+                api.terminate()
+            return
 
 
 def run_secure_stack(args: argparse.Namespace) -> None:
     ensure_dirs()
+    if args.workers < 1:
+        fail("--workers debe ser 1 o mayor.")
+    # Fail before the slow startup tasks if the HTTPS port is already taken.
+    try:
+        create_listen_socket(("0.0.0.0", args.frontend_https_port), reuse_port=False, listen=False).close()
+    except OSError as exc:
+        fail(f"No se puede usar el puerto HTTPS {args.frontend_https_port}: {exc}")
+
+    # Startup task graph: certificates, the first build and the Node API boot concurrently; the API
+    # only waits for the certificate it serves.
+    startup = TaskGraph()
+    key_types = ["rsa", "ecdsa"] if args.cert_type == "both" else [args.cert_type]
+    cert_pairs = [local_cert_paths(key_type) for key_type in key_types]
+    for key_type, (pair_cert, pair_key) in zip(key_types, cert_pairs):
+        startup.add(f"cert-{key_type}", lambda c=pair_cert, k=pair_key, t=key_type: ensure_local_https_cert(c, k, t))
+    # The Node API gets the preferred certificate (ECDSA whenever it is enabled).
+    cert_file, key_file = cert_pairs[-1]
 
-    cert_file = CERTS_DIR / "localhost.crt"
-    key_file = CERTS_DIR / "localhost.key"
-    ensure_local_https_cert(cert_file, key_file)
+    def build() -> None:
+        maybe_build_and_deploy(use_cache=not args.no_build_cache)
 
     if args.build_first:
-        maybe_build_and_deploy()
+        startup.add("build", build)
     elif not CURRENT_RELEASE_FILE.exists():
         info("No active release detected. Building first release...")
-        maybe_build_and_deploy()
+        startup.add("build", build)
+
+    RELEASE_POINTER.set_pack_limit(max(0, args.asset_pack_mb) * 1024 * 1024)
+    if args.metrics:
+        # Before any fork: prefork workers publish their counters into shared memory.
+        METRICS.enable(processes=args.workers)
+    PROFILER.configure(
+        interval_ms=args.profile_interval_ms,
+        every=parse_profile_sample(args.profile_sample),
+        top=args.profile_top,
+    )
+    if args.access_log:
+        ACCESS_LOG.configure(
+            Path(args.access_log).resolve(),
+            max_bytes=args.access_log_max_mb * 1024 * 1024,
+            backups=args.access_log_backups,
+            sample_static=args.access_log_sample,
+            capacity=ACCESS_LOG_BUFFER_RECORDS,
+        )
 
     frontend_origin = f"https://localhost:{args.frontend_https_port}"
     api_scheme = "https" if args.api_https else "http"
     api_origin = f"{api_scheme}://localhost:{args.api_port}" if args.with_api else args.api_origin
 
-    node_proc: subprocess.Popen[str] | None = None
+    upstream_pool = UpstreamPool()
+    api: ApiSupervisor | None = None
+    api_upstreams: ApiUpstreams | None = None
     if args.with_api:
-        node_proc = start_node_api_https(
+        api = ApiSupervisor(
+            upstream_pool,
             api_port=args.api_port,
+            use_https=args.api_https,
+            workers=args.api_workers,
+            shared_upstreams=args.workers > 1,
             cert_file=cert_file,
             key_file=key_file,
             frontend_origin=frontend_origin,
-            use_https=args.api_https,
         )
-        time.sleep(1.2)
+        api_upstreams = api.upstreams
+        startup.add("api", api.start, after=[f"cert-{key_types[-1]}"])
+    elif api_origin:
+        api_upstreams = ApiUpstreams([api_origin])
+
+    try:
+        startup.run()
+    except BaseException:
+        if api:
+            api.stop()
+        raise
+    finally:
+        if startup.started:
+            info("Tiempos de arranque:")
+            for line in startup.report():
+                info(line)
+
+    # Built before any fork so prefork workers share session-ticket keys: a ticket issued by one
+    # worker resumes on any other.
+    context = build_server_tls_context(cert_pairs, session_tickets=args.tls_session_tickets)
+
+    def make_server(
+        listen_socket: socket.socket | None = None,
+    ) -> tuple[ThreadingHTTPServer | AsyncFrontendServer, dict[str, Callable[[], dict[str, object]]]]:
+        # Prefork workers get their own upstream pool: pooled sockets must not be shared across processes.
+        pool = upstream_pool if listen_socket is None else UpstreamPool()
+        tls_stats = TLSHandshakeStats()
+        server: ThreadingHTTPServer | AsyncFrontendServer
+        if args.engine == "asyncio":
+            server = AsyncFrontendServer(
+                ("0.0.0.0", args.frontend_https_port),
+                context,
+                api_upstreams,
+                pool,
+                proxy_buffer_bytes=args.proxy_buffer_bytes,
+                ws_max_tunnels=args.ws_max_tunnels,
+                ws_idle_timeout=args.ws_idle_timeout,
+                keepalive_timeout=args.keepalive_timeout,
+                max_keepalive_requests=args.max_keepalive_requests,
+                tls_stats=tls_stats,
+                listen_socket=listen_socket,
+            )
+        else:
+            handler = make_handler(
+                api_upstreams,
+                pool,
+                proxy_buffer_bytes=args.proxy_buffer_bytes,
+                ws_max_tunnels=args.ws_max_tunnels,
+                ws_idle_timeout=args.ws_idle_timeout,
+                keepalive_timeout=args.keepalive_timeout,
+                max_keepalive_requests=args.max_keepalive_requests,
+            )
+            server = TLSThreadingHTTPServer(
+                ("0.0.0.0", args.frontend_https_port), handler, context, tls_stats, listen_socket
+            )
+        sources: dict[str, Callable[[], dict[str, object]]] = {
+            "tls handshakes": tls_stats.stats,
+            "tls session cache": context.session_stats,
+            "asset packs": AssetPack.stats,
+        }
+        if ACCESS_LOG.enabled:
+            sources["access log"] = ACCESS_LOG.stats
+        if api_upstreams:
+            sources["upstream pool"] = pool.stats
+        return server, sources
+
+    server: ThreadingHTTPServer | AsyncFrontendServer | PreforkFrontend
+    stats_sources: dict[str, Callable[[], dict[str, object]]] = {}
+    try:
+        if args.workers > 1:
+            # Fork before any helper thread exists (the startup tasks have all finished, the API
+            # monitor starts below); workers wait for release() before serving.
+            server = PreforkFrontend(
+                args.workers,
+                ("0.0.0.0", args.frontend_https_port),
+                make_server,
+                stats_interval=args.stats_interval,
+                profile=args.profile,
+            )
+            # Only the workers serve files; the parent keeps the routing table without a pack.
+            RELEASE_POINTER.set_pack_limit(0)
+        else:
+            server, stats_sources = make_server()
+    except BaseException:
+        # The port was free a moment ago; do not leave the API running without its frontend.
+        if api:
+            api.stop()
+        raise
+    if not isinstance(server, PreforkFrontend):
+        ACCESS_LOG.start()
+        if args.profile:
+            PROFILER.start()
+
+    if api:
+        # api.start() (a startup task) already waited for /healthz, so the proxy never forwards
+        # to an API still booting.
+        api.start_monitor()
+        stats_sources["api workers"] = api.upstreams.stats
+    if isinstance(server, PreforkFrontend):
+        server.release()
 
     if args.enable_http_redirect:
         start_http_redirect_thread(args.frontend_http_port, args.frontend_https_port)
 
-    handler = make_handler(api_origin)
-    server = ThreadingHTTPServer(("0.0.0.0", args.frontend_https_port), handler)
-    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
-    context.load_cert_chain(certfile=str(cert_file), keyfile=str(key_file))
-    server.socket = context.wrap_socket(server.socket, server_side=True)
-
     stop_event = threading.Event()
     watch_thread = None
+    builder: PersistentFrontendBuilder | None = None
     if args.watch:
+        if args.watch_builder == "persistent":
+            builder = PersistentFrontendBuilder(on_build=release_watch_build)
+            builder.start()
         watch_thread = threading.Thread(
             target=watch_for_updates,
-            args=(args.watch_interval, stop_event),
+            args=(args.watch_interval, stop_event, builder, api),
             daemon=True,
         )
         watch_thread.start()
+    if args.stats_interval > 0 and stats_sources:
+        threading.Thread(
+            target=report_stats,
+            args=(args.stats_interval, stop_event, stats_sources),
+            daemon=True,
+        ).start()
+
+    # Handlers only set flags (see PreforkFrontend._run_worker): serve_forever runs on this main
+    # thread and may be inside Thread.start() for a new connection when a signal arrives.
+    signal_requests: dict[str, bool] = {}
+    toggle_profiler = server.toggle_profiler if isinstance(server, PreforkFrontend) else PROFILER.toggle
+    threading.Thread(
+        target=handle_signal_requests,
+        args=(signal_requests, stop_event, toggle_profiler, server, api),
+        daemon=True,
+    ).start()
 
     def shutdown(*_sig: object) -> None:
-        stop_event.set()
-        server.shutdown()
-        if node_proc and node_proc.poll() is None:
-            node_proc.terminate()
+        # Also safe on a repeated Ctrl+C: the flag is simply set again.
+        signal_requests["stop"] = True
 
     signal.signal(signal.SIGINT, shutdown)
     signal.signal(signal.SIGTERM, shutdown)
+    if hasattr(signal, "SIGUSR2"):
+        # kill -USR2 <pid> starts/stops the profiler (and writes its files when stopping).
+        signal.signal(signal.SIGUSR2, lambda *_: signal_requests.__setitem__("profile", True))
 
-    info(f"Frontend HTTPS: {frontend_origin}")
+    workers_note = f", workers: {args.workers}" if args.workers > 1 else ""
+    info(f"Frontend HTTPS: {frontend_origin} (engine: {args.engine}{workers_note})")
     if args.enable_http_redirect:
         info(f"Frontend HTTP redirect: http://localhost:{args.frontend_http_port}")
-    if api_origin:
-        info(f"API origin/proxy: {api_origin}")
+    if api_upstreams:
+        info(f"API origin/proxy: {', '.join(api_upstreams.origins)}")
     info("Press Ctrl+C to stop.")
 
+    if not isinstance(server, PreforkFrontend):
+        # Load the release and its asset pack now, not on the first request.
+        RELEASE_POINTER.current()
     try:
         server.serve_forever()
     finally:
         stop_event.set()
         if watch_thread:
             watch_thread.join(timeout=2)
+        if builder:
+            builder.stop()
         server.server_close()
-        if node_proc and node_proc.poll() is None:
-            node_proc.terminate()
-            try:
-                node_proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                node_proc.kill()
+        if stats_sources:
+            log_stats(stats_sources)
+        ACCESS_LOG.stop()
+        PROFILER.stop()
+        upstream_pool.close()
+        if api:
+            api.stop()
 
 
 def parse_args() -> argparse.Namespace:
@@ -657,11 +5037,52 @@ def parse_args() -> argparse.Namespace:
     )
     sub = parser.add_subparsers(dest="command", required=True)
 
-    sub.add_parser("build", help="Build frontend and create a new release.")
+    build = sub.add_parser("build", help="Build frontend and create a new release.")
+    build.add_argument(
+        "--no-build-cache",
+        action="store_true",
+        help="Always run the build, even if a release was built from identical inputs.",
+    )
 
     rollback = sub.add_parser("rollback", help="Rollback current release.")
     rollback.add_argument("--steps", type=int, default=1, help="How many releases back (default: 1).")
 
+    verify = sub.add_parser("verify", help="Re-hash a release and check it against integrity.json.")
+    verify.add_argument("--release", default=None, help="Release name (default: the active release).")
+
+    gc = sub.add_parser("gc", help="Delete blobs no retained release references.")
+    gc.add_argument(
+        "--keep",
+        type=int,
+        default=None,
+        help="Also delete releases other than the active one and the last N deployed.",
+    )
+
+    bench = sub.add_parser("bench", help="Benchmark static, SPA, proxy and SSE paths against a stand-in API.")
+    bench.add_argument("--duration", type=float, default=5.0, help="Seconds per scenario (default: 5).")
+    bench.add_argument("--concurrency", type=int, default=16, help="Concurrent keep-alive clients (default: 16).")
+    bench.add_argument("--scenarios", default="", help="Comma-separated subset of scenarios (default: all).")
+    bench.add_argument(
+        "--post-sizes",
+        default="1024,65536,1048576",
+        help="Body sizes in bytes for the proxied POST scenarios (default: 1 KiB, 64 KiB, 1 MiB).",
+    )
+    bench.add_argument("--sse-clients", type=int, default=50, help="SSE subscribers for the fan-out scenario.")
+    bench.add_argument("--sse-interval-ms", type=int, default=50, help="Stand-in API event interval.")
+    bench.add_argument("--engine", choices=("threading", "asyncio"), default="threading", help="Engine under test.")
+    bench.add_argument("--workers", type=int, default=1, help="Frontend processes under test.")
+    bench.add_argument(
+        "--asset-pack-mb", type=int, default=DEFAULT_ASSET_PACK_MB, help="Asset pack size under test."
+    )
+    bench.add_argument("--output", default=None, help="JSON results file (default: python/state/bench/).")
+    bench.add_argument("--compare", default=None, help="Baseline JSON to compare against.")
+    bench.add_argument(
+        "--threshold",
+        type=float,
+        default=10.0,
+        help="Percent drop in rps or rise in p99 that counts as a regression (default: 10).",
+    )
+
     serve = sub.add_parser("serve", help="Serve current release over HTTPS.")
     add_serve_options(serve)
     serve.set_defaults(build_first=False)
@@ -675,6 +5096,61 @@ def parse_args() -> argparse.Namespace:
 
 def add_serve_options(parser: argparse.ArgumentParser) -> None:
     parser.add_argument("--with-api", action="store_true", help="Start Node API server automatically.")
+    parser.add_argument(
+        "--no-build-cache",
+        action="store_true",
+        help="Rebuild on startup even if a release was built from identical inputs.",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("threading", "asyncio"),
+        default="threading",
+        help="Frontend serving engine: one thread per connection, or a single asyncio event loop.",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help=f"Serve Prometheus metrics at {METRICS_PATH} (loopback clients only).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Sample request-handling stacks from startup (toggle at runtime with SIGUSR2 or POST {PROFILE_PATH}?action=start|stop).",
+    )
+    parser.add_argument("--profile-interval-ms", type=float, default=5.0, help="Profiler sampling interval.")
+    parser.add_argument(
+        "--profile-sample",
+        action="append",
+        default=[],
+        metavar="[ROUTE=]N",
+        help=f"Profile only 1 in N requests, for all routes or one of: {', '.join(PROFILE_ROUTES)} (repeatable).",
+    )
+    parser.add_argument("--profile-top", type=int, default=25, help="Functions listed in the profile summary.")
+    parser.add_argument(
+        "--access-log",
+        default=None,
+        help="Write requests as JSON Lines to this file (off the request threads) instead of stdout.",
+    )
+    parser.add_argument("--access-log-max-mb", type=int, default=50, help="Rotate the access log at this size.")
+    parser.add_argument("--access-log-backups", type=int, default=5, help="Rotated access logs to keep.")
+    parser.add_argument(
+        "--access-log-sample",
+        type=int,
+        default=1,
+        help="Log only 1 in N successful static/SPA hits (errors and API requests are always logged).",
+    )
+    parser.add_argument(
+        "--asset-pack-mb",
+        type=int,
+        default=DEFAULT_ASSET_PACK_MB,
+        help="Preload each active release into memory up to this many MiB (0 serves from disk).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Frontend server processes sharing the HTTPS port (prefork; needs fork()).",
+    )
     parser.add_argument(
         "--api-https",
         action="store_true",
@@ -686,6 +5162,12 @@ def add_serve_options(parser: argparse.ArgumentParser) -> None:
         help="External API origin to proxy /api (example: https://localhost:4000).",
     )
     parser.add_argument("--api-port", type=int, default=DEFAULT_API_HTTPS_PORT, help="Node API port.")
+    parser.add_argument(
+        "--api-workers",
+        type=int,
+        default=1,
+        help="Node API processes on consecutive ports from --api-port, balanced by the proxy.",
+    )
     parser.add_argument("--frontend-https-port", type=int, default=DEFAULT_FRONTEND_HTTPS_PORT, help="Frontend HTTPS port.")
     parser.add_argument(
         "--enable-http-redirect",
@@ -694,7 +5176,62 @@ def add_serve_options(parser: argparse.ArgumentParser) -> None:
     )
     parser.add_argument("--frontend-http-port", type=int, default=DEFAULT_FRONTEND_HTTP_REDIRECT_PORT, help="Frontend HTTP redirect port.")
     parser.add_argument("--watch", action="store_true", help="Auto rebuild + deploy when source changes.")
-    parser.add_argument("--watch-interval", type=int, default=3, help="Watch poll interval in seconds.")
+    parser.add_argument("--watch-interval", type=int, default=3, help="Watch poll interval in seconds (only used when inotify is unavailable).")
+    parser.add_argument(
+        "--watch-builder",
+        choices=("cold", "persistent"),
+        default="cold",
+        help="Watch mode build strategy: a fresh 'npm run build' per change, or one long-lived "
+        "'vite build --watch' whose finished builds are released directly.",
+    )
+    parser.add_argument(
+        "--proxy-buffer-bytes",
+        type=int,
+        default=DEFAULT_PROXY_BUFFER_BYTES,
+        help="Max request/response body buffered per proxied request; larger bodies are streamed.",
+    )
+    parser.add_argument(
+        "--cert-type",
+        choices=("rsa", "ecdsa", "both"),
+        default="rsa",
+        help="Local certificate key type; 'both' serves RSA and ECDSA side by side.",
+    )
+    parser.add_argument(
+        "--tls-session-tickets",
+        type=int,
+        default=2,
+        help="TLS 1.3 session tickets issued per full handshake (0 disables ticket resumption).",
+    )
+    parser.add_argument(
+        "--keepalive-timeout",
+        type=float,
+        default=DEFAULT_KEEPALIVE_TIMEOUT_SECONDS,
+        help="Seconds an idle keep-alive connection may wait for its next request.",
+    )
+    parser.add_argument(
+        "--max-keepalive-requests",
+        type=int,
+        default=DEFAULT_MAX_KEEPALIVE_REQUESTS,
+        help="Requests served on one connection before it is closed.",
+    )
+    parser.add_argument(
+        "--ws-max-tunnels",
+        type=int,
+        default=DEFAULT_WS_MAX_TUNNELS,
+        help="Max concurrent WebSocket tunnels to the API (extra upgrades get 503).",
+    )
+    parser.add_argument(
+        "--ws-idle-timeout",
+        type=float,
+        default=DEFAULT_WS_IDLE_TIMEOUT_SECONDS,
+        help="Close a WebSocket tunnel after this many seconds without traffic.",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=int,
+        default=0,
+        help="Log TLS handshake and upstream pool stats every N seconds (0 = only on shutdown).",
+    )
 
 
 def main() -> None:
@@ -702,7 +5239,7 @@ def main() -> None:
     ensure_dirs()
 
     if args.command == "build":
-        maybe_build_and_deploy()
+        maybe_build_and_deploy(use_cache=not args.no_build_cache)
         info(f"Release activa: {get_current_release_dir().parent.name}")
         return
 
@@ -710,6 +5247,20 @@ def main() -> None:
         rollback_release(args.steps)
         return
 
+    if args.command == "verify":
+        verify_release(args.release)
+        return
+
+    if args.command == "gc":
+        gc_release_store(args.keep)
+        return
+
+    if args.command == "bench":
+        from deploy_bench import run_benchmarks
+
+        run_benchmarks(args)
+        return
+
     if args.command in ("serve", "full"):
         if not args.with_api and not args.api_origin:
             info("No API server configured. Se servira solo frontend estatico.")
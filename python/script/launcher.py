@@ -2,11 +2,13 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
+import json
 import os
+import platform
 import shutil
 import subprocess
 import sys
-import time
 from pathlib import Path
 
 
@@ -14,14 +16,25 @@ ROOT = Path(__file__).resolve().parents[2]
 PY_DIR = ROOT / "python"
 BOOTSTRAP = PY_DIR / "bootstrap_venv.py"
 DEPLOY = PY_DIR / "deploy_secure.py"
+PACKAGE_JSON = ROOT / "package.json"
+PACKAGE_LOCK = ROOT / "package-lock.json"
+NODE_MODULES = ROOT / "node_modules"
+# Lives inside node_modules so deleting it also discards the stamp.
+NPM_STAMP = NODE_MODULES / ".launcher-stamp.json"
+
+sys.path.insert(0, str(PY_DIR))
+from task_graph import TaskGraph, current_task, emit, run_prefixed  # noqa: E402
 
 
 def info(message: str) -> None:
-    print(f"[python-script] {message}")
+    task = current_task()
+    emit(f"[python-script][{task}] {message}" if task else f"[python-script] {message}")
 
 
 def fail(message: str, code: int = 1) -> None:
-    print(f"[python-script][error] {message}", file=sys.stderr)
+    task = current_task()
+    prefix = f"[python-script][{task}][error]" if task else "[python-script][error]"
+    emit(f"{prefix} {message}", stream=sys.stderr)
     raise SystemExit(code)
 
 
@@ -31,40 +44,88 @@ def venv_python() -> Path:
     return PY_DIR / ".venv" / "bin" / "python"
 
 
-def run_with_spinner(command: list[str], title: str, env: dict[str, str] | None = None) -> None:
-    spinner = "|/-\\"
+def run_step(command: list[str], title: str, env: dict[str, str] | None = None) -> None:
+    """Run a setup command; its output is prefixed with the task name (tasks run concurrently)."""
+    info(title)
     try:
-        proc = subprocess.Popen(command, cwd=str(ROOT), env=env)
+        returncode = run_prefixed(command, prefix=current_task() or "setup", cwd=str(ROOT), env=env)
     except FileNotFoundError:
         fail(f"No se encontro el ejecutable: {command[0]}. Verifica que este instalado y en PATH.")
-    idx = 0
-    while proc.poll() is None:
-        symbol = spinner[idx % len(spinner)]
-        print(f"\r[{symbol}] {title}", end="", flush=True)
-        idx += 1
-        time.sleep(0.12)
-    print("\r", end="", flush=True)
-    if proc.returncode != 0:
-        fail(f"Command failed ({proc.returncode}): {' '.join(command)}")
-    print(f"[ok] {title}")
-
-
-def ensure_venv() -> None:
+    if returncode != 0:
+        fail(f"Command failed ({returncode}): {' '.join(command)}")
+    info(f"[ok] {title}")
+
+
+def ensure_venv(force: bool) -> None:
     if not BOOTSTRAP.exists():
         fail(f"Missing bootstrap file: {BOOTSTRAP}")
-    run_with_spinner([sys.executable, str(BOOTSTRAP)], "Configurando entorno virtual (.venv)")
+    # bootstrap_venv.py keeps its own stamp and skips pip when nothing changed.
+    command = [sys.executable, str(BOOTSTRAP)] + (["--force"] if force else [])
+    # Unbuffered, so its own lines stay in order with the pip output it relays.
+    run_step(command, "Configurando entorno virtual (.venv)", env={**os.environ, "PYTHONUNBUFFERED": "1"})
     if not venv_python().exists():
         fail(f"No se encontro Python de .venv: {venv_python()}")
 
 
-def npm_install() -> None:
+def file_digest(path: Path) -> str | None:
+    if not path.exists():
+        return None
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def tool_versions(commands: dict[str, list[str]]) -> dict[str, str | None]:
+    # Started together: npm --version alone costs a Node.js startup (~0.2 s).
+    procs = {}
+    for name, command in commands.items():
+        try:
+            procs[name] = subprocess.Popen(
+                command, cwd=str(ROOT), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            )
+        except OSError:
+            procs[name] = None
+    versions: dict[str, str | None] = {}
+    for name, proc in procs.items():
+        output = proc.communicate()[0] if proc else ""
+        versions[name] = output.strip() if proc and proc.returncode == 0 else None
+    return versions
+
+
+def npm_fingerprint(npm_path: str) -> dict[str, object]:
+    """Inputs that decide what npm install puts into node_modules."""
+    node_path = shutil.which("node")
+    versions = tool_versions({"node": [node_path or "node", "--version"], "npm": [npm_path, "--version"]})
+    return {
+        **versions,
+        "platform": f"{sys.platform}-{platform.machine()}",
+        "packageJson": file_digest(PACKAGE_JSON),
+        "packageLock": file_digest(PACKAGE_LOCK),
+    }
+
+
+def read_npm_stamp() -> dict[str, object]:
+    try:
+        stamp = json.loads(NPM_STAMP.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return stamp if isinstance(stamp, dict) else {}
+
+
+def npm_install(force: bool) -> None:
     npm_exec = "npm.cmd" if os.name == "nt" else "npm"
     npm_path = shutil.which(npm_exec)
     if not npm_path:
         fail(
             f"No se encontro {npm_exec} en PATH. Instala Node.js y reabre la terminal para actualizar PATH."
         )
-    run_with_spinner([npm_path, "install"], "Instalando dependencias npm")
+    current = npm_fingerprint(npm_path)
+    if not force and NODE_MODULES.is_dir() and read_npm_stamp() == current:
+        lock = str(current["packageLock"] or "none")[:12]
+        info(f"Sin cambios en package-lock.json ({lock}), node {current['node']}, npm {current['npm']}: se omite npm install")
+        return
+    run_step([npm_path, "install"], "Instalando dependencias npm")
+    # npm install may rewrite package-lock.json; stamp what is on disk now.
+    current.update(packageJson=file_digest(PACKAGE_JSON), packageLock=file_digest(PACKAGE_LOCK))
+    NPM_STAMP.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
 
 
 def deploy_secure(mode: str, extra: list[str]) -> None:
@@ -97,17 +158,34 @@ def deploy_secure(mode: str, extra: list[str]) -> None:
         fail(f"deploy_secure.py finalizo con codigo {result.returncode}", result.returncode)
 
 
+def prepare(force: bool) -> None:
+    """Setup task graph: .venv and node_modules are independent, so they run concurrently."""
+    graph = TaskGraph()
+    graph.add("venv", lambda: ensure_venv(force))
+    graph.add("npm", lambda: npm_install(force))
+    try:
+        graph.run()
+    finally:
+        info("Tiempos de preparacion:")
+        for line in graph.report():
+            info(line)
+
+
 def parse_args() -> argparse.Namespace:
-    parser = argparse.ArgumentParser(description="Python script launcher with automatic setup and animations.")
+    parser = argparse.ArgumentParser(description="Python script launcher with automatic setup and concurrent tasks.")
     parser.add_argument("mode", choices=["setup", "run", "full"], help="Execution profile")
+    parser.add_argument(
+        "--force-setup",
+        action="store_true",
+        help="Run pip and npm install even if their inputs did not change since the last setup.",
+    )
     parser.add_argument("extra", nargs="*", help="Extra args passed to deploy_secure.py")
     return parser.parse_args()
 
 
 def main() -> None:
     args = parse_args()
-    ensure_venv()
-    npm_install()
+    prepare(args.force_setup)
     deploy_secure(args.mode, args.extra)
 
 
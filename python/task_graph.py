@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Small dependency-graph task runner shared by ``script/launcher.py`` and ``deploy_secure.py``.
+
+Tasks declare the tasks they run after; every task whose dependencies are done starts at once
+on its own thread. Commands started with ``run_prefixed`` stream their output line by line as
+``[task] line`` so concurrent tasks stay readable. After ``run()``, ``report()`` lists each task's
+timing and marks the critical path (the chain of tasks that decided the total time).
+"""
+
+from __future__ import annotations
+
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable
+
+_CURRENT = threading.local()
+_OUTPUT_LOCK = threading.Lock()
+
+
+def current_task() -> str | None:
+    """Name of the task running on this thread, if any."""
+    return getattr(_CURRENT, "name", None)
+
+
+def emit(line: str, *, stream=None) -> None:
+    """Print one whole line; concurrent tasks never interleave within a line."""
+    target = stream or sys.stdout
+    with _OUTPUT_LOCK:
+        target.write(line + "\n")
+        target.flush()
+
+
+def run_prefixed(command: list[str], *, prefix: str, cwd: str, env: dict[str, str] | None = None) -> int:
+    """Run a command, echoing stdout and stderr as ``[prefix] line``; returns the exit code."""
+    proc = subprocess.Popen(
+        command,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    assert proc.stdout is not None
+    for line in proc.stdout:
+        # npm and pip redraw progress with carriage returns; keep the last state of the line.
+        emit(f"[{prefix}] {line.rstrip().rsplit(chr(13), 1)[-1]}")
+    return proc.wait()
+
+
+class Task:
+    __slots__ = ("name", "action", "after", "started", "finished", "error")
+
+    def __init__(self, name: str, action: Callable[[], object], after: tuple[str, ...]) -> None:
+        self.name = name
+        self.action = action
+        self.after = after
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.error: BaseException | None = None
+
+
+class TaskGraph:
+    """Runs tasks as soon as their dependencies finish; the first failure stops new tasks."""
+
+    def __init__(self) -> None:
+        self.tasks: dict[str, Task] = {}
+        self.started = 0.0
+        self.finished = 0.0
+        self._done = threading.Condition()
+
+    def add(self, name: str, action: Callable[[], object], *, after: tuple[str, ...] | list[str] = ()) -> None:
+        if name in self.tasks:
+            raise ValueError(f"duplicate task {name!r}")
+        missing = [dep for dep in after if dep not in self.tasks]
+        if missing:
+            # Dependencies must be added first, which also rules out cycles.
+            raise ValueError(f"task {name!r} depends on unknown tasks: {', '.join(missing)}")
+        self.tasks[name] = Task(name, action, tuple(after))
+
+    def run(self) -> None:
+        """Run every task; re-raises the first failure once the running tasks have finished."""
+        self.started = time.perf_counter()
+        pending = dict(self.tasks)
+        running: list[threading.Thread] = []
+        failure: BaseException | None = None
+        with self._done:
+            while pending or any(thread.is_alive() for thread in running):
+                if failure is None:
+                    for task in list(pending.values()):
+                        if all(self.tasks[dep].finished is not None for dep in task.after):
+                            del pending[task.name]
+                            task.started = time.perf_counter()
+                            thread = threading.Thread(target=self._run_task, args=(task,), name=f"task-{task.name}")
+                            thread.daemon = True
+                            running.append(thread)
+                            thread.start()
+                elif not any(thread.is_alive() for thread in running):
+                    break
+                # A timeout keeps Ctrl+C responsive on the main thread.
+                self._done.wait(0.5)
+                for task in self.tasks.values():
+                    if task.error is not None and failure is None:
+                        failure = task.error
+        for thread in running:
+            thread.join()
+        self.finished = time.perf_counter()
+        if failure is not None:
+            raise failure
+
+    def _run_task(self, task: Task) -> None:
+        _CURRENT.name = task.name
+        try:
+            task.action()
+            task.finished = time.perf_counter()
+        except BaseException as exc:  # noqa: BLE001 - SystemExit from fail() must reach run()
+            task.error = exc
+        finally:
+            _CURRENT.name = None
+            with self._done:
+                self._done.notify_all()
+
+    def critical_path(self) -> list[Task]:
+        """Last task to finish, then (backwards) the dependency that released each one."""
+        done = [task for task in self.tasks.values() if task.finished is not None]
+        if not done:
+            return []
+        path = [max(done, key=lambda task: task.finished or 0.0)]
+        while path[-1].after:
+            path.append(max((self.tasks[dep] for dep in path[-1].after), key=lambda task: task.finished or 0.0))
+        return path[::-1]
+
+    def report(self) -> list[str]:
+        """Timing lines per task (start/end relative to run()), critical path marked with '*'."""
+        critical = {task.name for task in self.critical_path()}
+        width = max((len(name) for name in self.tasks), default=0)
+        lines = []
+        for task in sorted(self.tasks.values(), key=lambda task: task.started or float("inf")):
+            if task.started is None:
+                lines.append(f"  {task.name:<{width}}  no ejecutada")
+                continue
+            end = task.finished or self.finished
+            mark = "*" if task.name in critical else " "
+            state = "" if task.finished is not None else "  (fallo)"
+            lines.append(
+                f"{mark} {task.name:<{width}}  {end - task.started:6.2f}s"
+                f"  [{task.started - self.started:6.2f}s -> {end - self.started:6.2f}s]{state}"
+            )
+        path = " -> ".join(task.name for task in self.critical_path()) or "-"
+        lines.append(f"  total {self.finished - self.started:.2f}s; ruta critica (*): {path}")
+        return lines
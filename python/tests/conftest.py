@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+PY_DIR = Path(__file__).resolve().parents[1]
+if str(PY_DIR) not in sys.path:
+    sys.path.insert(0, str(PY_DIR))
+
+import deploy_secure  # noqa: E402
+
+
+@pytest.fixture
+def deploy_root(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Point every path deploy_secure writes to at tmp_path, with a fresh release pointer."""
+    py_dir = tmp_path / "python"
+    state_dir = py_dir / "state"
+    paths = {
+        "ROOT": tmp_path,
+        "PY_DIR": py_dir,
+        "CERTS_DIR": py_dir / "certs",
+        "RELEASES_DIR": py_dir / "releases",
+        "STATE_DIR": state_dir,
+        "BLOBS_DIR": py_dir / "blobs",
+        "CURRENT_RELEASE_FILE": state_dir / "current-release.json",
+        "DEPLOY_HISTORY_FILE": state_dir / "deploy-history.json",
+        "RELEASE_STORE_LOCK_FILE": state_dir / "release-store.lock",
+        "DIST_DIR": tmp_path / "dist",
+        "PROFILE_DIR": state_dir / "profiles",
+    }
+    for name, value in paths.items():
+        monkeypatch.setattr(deploy_secure, name, value)
+    monkeypatch.setattr(deploy_secure, "RELEASE_POINTER", deploy_secure.ReleasePointer())
+    monkeypatch.setattr(deploy_secure, "_api_runtime_dirs", None)
+    for key in [key for key in os.environ if key.startswith("VITE_")]:
+        monkeypatch.delenv(key)
+    deploy_secure.ensure_dirs()
+    return tmp_path
+
+
+def write_dist(root: Path, files: dict[str, bytes]) -> None:
+    """Replace root/dist with exactly these files."""
+    dist = root / "dist"
+    if dist.exists():
+        for path in sorted(dist.rglob("*"), reverse=True):
+            path.unlink() if path.is_file() else path.rmdir()
+    for rel, data in files.items():
+        target = dist / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+
+
+@pytest.fixture
+def make_release(deploy_root: Path):
+    """Build a release from the given dist/ contents and return its directory."""
+
+    def build(files: dict[str, bytes], input_hash: str | None = None) -> Path:
+        write_dist(deploy_root, files)
+        return deploy_secure.create_release(input_hash)
+
+    return build
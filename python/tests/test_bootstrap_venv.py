@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import bootstrap_venv
+
+
+@pytest.fixture
+def venv(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """A fake .venv whose pip calls are recorded; `results` decides which ones fail."""
+    venv_dir = tmp_path / ".venv"
+    python = venv_dir / "bin" / "python"
+    python.parent.mkdir(parents=True)
+    python.write_text("", encoding="utf-8")
+    (venv_dir / "pyvenv.cfg").write_text("", encoding="utf-8")
+    monkeypatch.setattr(bootstrap_venv, "VENV_DIR", venv_dir)
+    monkeypatch.setattr(bootstrap_venv, "REQ_FILE", tmp_path / "requirements.txt")
+    monkeypatch.setattr(bootstrap_venv, "STAMP_FILE", venv_dir / "bootstrap-stamp.json")
+    monkeypatch.setattr(bootstrap_venv, "venv_python", lambda: python)
+    monkeypatch.setattr(
+        bootstrap_venv.subprocess, "run", lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 0)
+    )
+
+    class Pip:
+        calls: list[str] = []
+        results = {"upgrade": True, "requirements": True}
+
+        @classmethod
+        def run_optional(cls, cmd: list[str]) -> bool:
+            kind = "requirements" if "-r" in cmd else "upgrade"
+            cls.calls.append(kind)
+            return cls.results[kind]
+
+    monkeypatch.setattr(bootstrap_venv, "run_optional", Pip.run_optional)
+    return Pip
+
+
+def run_main(monkeypatch: pytest.MonkeyPatch, *argv: str) -> None:
+    monkeypatch.setattr("sys.argv", ["bootstrap_venv.py", *argv])
+    bootstrap_venv.main()
+
+
+def test_failed_upgrade_does_not_decide_the_result(venv) -> None:
+    venv.results["upgrade"] = False
+    assert bootstrap_venv.install_requirements() is True
+    assert venv.calls == ["upgrade"]
+
+    bootstrap_venv.REQ_FILE.write_text("# comments only\n\n", encoding="utf-8")
+    assert bootstrap_venv.install_requirements() is True
+
+    bootstrap_venv.REQ_FILE.write_text("zstandard\n", encoding="utf-8")
+    assert bootstrap_venv.install_requirements() is True
+    assert venv.calls[-1] == "requirements"
+
+
+def test_failed_requirements_install_is_reported(venv) -> None:
+    bootstrap_venv.REQ_FILE.write_text("zstandard\n", encoding="utf-8")
+    venv.results["requirements"] = False
+    assert bootstrap_venv.install_requirements() is False
+
+
+def test_stamp_skips_pip_until_requirements_change(venv, monkeypatch: pytest.MonkeyPatch) -> None:
+    bootstrap_venv.REQ_FILE.write_text("zstandard\n", encoding="utf-8")
+    run_main(monkeypatch)
+    assert venv.calls == ["upgrade", "requirements"]
+    assert bootstrap_venv.read_stamp() == bootstrap_venv.fingerprint()
+
+    run_main(monkeypatch)
+    assert venv.calls == ["upgrade", "requirements"]
+
+    bootstrap_venv.REQ_FILE.write_text("zstandard>=0.22\n", encoding="utf-8")
+    run_main(monkeypatch)
+    assert venv.calls.count("requirements") == 2
+
+    run_main(monkeypatch, "--force")
+    assert venv.calls.count("requirements") == 3
+
+
+def test_failed_install_leaves_no_stamp(venv, monkeypatch: pytest.MonkeyPatch) -> None:
+    bootstrap_venv.REQ_FILE.write_text("zstandard\n", encoding="utf-8")
+    venv.results["requirements"] = False
+    run_main(monkeypatch)
+    assert not bootstrap_venv.STAMP_FILE.exists()
+
+    venv.results["requirements"] = True
+    run_main(monkeypatch)
+    assert venv.calls.count("requirements") == 2
+    assert bootstrap_venv.STAMP_FILE.exists()
+
+
+def test_unreadable_stamp_counts_as_missing(venv) -> None:
+    bootstrap_venv.STAMP_FILE.write_text("{not json", encoding="utf-8")
+    assert bootstrap_venv.read_stamp() == {}
+    bootstrap_venv.STAMP_FILE.write_text("[]", encoding="utf-8")
+    assert bootstrap_venv.read_stamp() == {}
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import io
+
+import pytest
+
+import deploy_secure
+from deploy_secure import MalformedChunkedBody
+
+WELL_FORMED = [
+    pytest.param(b"5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n", b"hello world", id="crlf"),
+    pytest.param(b"5\nhello\n0\n\n", b"hello", id="bare-lf"),
+    pytest.param(b"5;name=value\r\nhello\r\n0\r\n\r\n", b"hello", id="extension"),
+    pytest.param(b"5\r\nhello\r\n0\r\nX-Checksum: 1\r\nX-More: 2\r\n\r\n", b"hello", id="trailers"),
+    pytest.param(b"A\r\n0123456789\r\n0\r\n\r\n", b"0123456789", id="hex-size"),
+    pytest.param(b"0\r\n\r\n", b"", id="empty"),
+]
+
+MALFORMED = [
+    pytest.param(b"zz\r\nhello\r\n0\r\n\r\n", id="non-hex-size"),
+    pytest.param(b"-5\r\nhello\r\n0\r\n\r\n", id="negative-size"),
+    pytest.param(b"5\r\nhelloXX0\r\n\r\n", id="missing-crlf-after-data"),
+    pytest.param(b"5\r\nhello\r0\r\n\r\n", id="cr-without-lf"),
+]
+
+
+def decode(raw: bytes, chunk_size: int = deploy_secure.PROXY_STREAM_CHUNK_BYTES) -> list[bytes]:
+    return list(deploy_secure.iter_chunked_body(io.BufferedReader(io.BytesIO(raw)), chunk_size))
+
+
+def adecode(raw: bytes) -> list[bytes]:
+    async def run() -> list[bytes]:
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return [chunk async for chunk in deploy_secure.aiter_chunked_body(reader)]
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(("raw", "expected"), WELL_FORMED)
+def test_chunked_body_decodes(raw: bytes, expected: bytes) -> None:
+    assert b"".join(decode(raw)) == expected
+    assert b"".join(adecode(raw)) == expected
+
+
+@pytest.mark.parametrize("raw", MALFORMED)
+def test_chunked_body_rejects_bad_framing(raw: bytes) -> None:
+    with pytest.raises(MalformedChunkedBody):
+        decode(raw)
+    with pytest.raises(MalformedChunkedBody):
+        adecode(raw)
+
+
+def test_chunked_body_stops_at_the_terminating_chunk() -> None:
+    reader = io.BufferedReader(io.BytesIO(b"3\r\nabc\r\n0\r\n\r\nGET /next HTTP/1.1\r\n"))
+    assert list(deploy_secure.iter_chunked_body(reader)) == [b"abc"]
+    assert reader.read() == b"GET /next HTTP/1.1\r\n"
+
+
+def test_chunked_body_splits_large_chunks() -> None:
+    data = bytes(range(256)) * 40
+    raw = f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n"
+    chunks = decode(raw, chunk_size=1000)
+    assert max(map(len, chunks)) == 1000
+    assert b"".join(chunks) == data
+
+
+def test_chunked_body_larger_than_the_stream_chunk_async() -> None:
+    data = b"x" * (deploy_secure.PROXY_STREAM_CHUNK_BYTES + 10)
+    raw = f"{len(data):x}\r\n".encode() + data + b"\r\n0\r\n\r\n"
+    assert b"".join(adecode(raw)) == data
+
+
+def test_truncated_chunked_body_is_a_disconnect() -> None:
+    with pytest.raises(ConnectionResetError):
+        decode(b"5\r\nhel")
+    with pytest.raises(ConnectionResetError):
+        decode(b"5\r\nhello\r\n")
+    with pytest.raises((ConnectionResetError, asyncio.IncompleteReadError)):
+        adecode(b"5\r\nhel")
+
+
+def test_fixed_body_reports_early_close() -> None:
+    reader = io.BufferedReader(io.BytesIO(b"abc"))
+    with pytest.raises(ConnectionResetError):
+        list(deploy_secure.iter_fixed_body(reader, 5))
+
+
+def test_client_body_blames_the_client_for_read_errors() -> None:
+    def broken():
+        yield b"first"
+        raise TimeoutError("timed out")
+
+    body = deploy_secure.client_body(broken())
+    assert next(body) == b"first"
+    with pytest.raises(deploy_secure.ClientBodyError):
+        next(body)
+
+
+def test_parse_request_head() -> None:
+    request = deploy_secure.parse_request_head(
+        b"POST /api/v1/items?x=1 HTTP/1.1\r\nHost: example\r\nContent-Length:  12 \r\nX-Empty:\r\n\r\n"
+    )
+    assert request is not None
+    assert (request.method, request.target, request.version) == ("POST", "/api/v1/items?x=1", "HTTP/1.1")
+    assert request.headers["content-length"] == "12"
+    assert request.headers["X-Empty"] == ""
+    assert request.keep_alive
+
+
+@pytest.mark.parametrize(
+    ("version", "connection", "keep_alive"),
+    [
+        ("HTTP/1.1", None, True),
+        ("HTTP/1.1", "close", False),
+        ("HTTP/1.0", None, False),
+        ("HTTP/1.0", "keep-alive", True),
+    ],
+)
+def test_parsed_request_keep_alive(version: str, connection: str | None, keep_alive: bool) -> None:
+    head = f"GET / {version}\r\nHost: example\r\n"
+    if connection:
+        head += f"Connection: {connection}\r\n"
+    request = deploy_secure.parse_request_head((head + "\r\n").encode())
+    assert request is not None
+    assert request.keep_alive is keep_alive
+    assert request._replace(force_close=True).keep_alive is False
+
+
+@pytest.mark.parametrize(
+    "head",
+    [
+        pytest.param(b"GET /\r\n\r\n", id="no-version"),
+        pytest.param(b"GET / HTTP/2\r\n\r\n", id="unsupported-version"),
+        pytest.param(b"GET http://example/ HTTP/1.1\r\n\r\n", id="absolute-form"),
+        pytest.param(b"GET / HTTP/1.1\r\nX-Folded: a\r\n  b\r\n\r\n", id="obs-fold"),
+        pytest.param(b"GET / HTTP/1.1\r\nBad Name: a\r\n\r\n", id="space-in-name"),
+        pytest.param(b"GET / HTTP/1.1\r\nHost : a\r\n\r\n", id="space-before-colon"),
+        pytest.param(b"GET / HTTP/1.1\r\nno-colon\r\n\r\n", id="no-colon"),
+        pytest.param(b"GET / HTTP/1.1\r\n: value\r\n\r\n", id="empty-name"),
+    ],
+)
+def test_parse_request_head_rejects_malformed_heads(head: bytes) -> None:
+    assert deploy_secure.parse_request_head(head) is None
+
+
+def test_parse_header_lines_keeps_repeated_fields() -> None:
+    headers = deploy_secure.parse_header_lines(b"Set-Cookie: a=1\r\nSet-Cookie: b=2\nVary: Accept\r\n")
+    assert headers is not None
+    assert headers.get_all("Set-Cookie") == ["a=1", "b=2"]
+    assert headers["vary"] == "Accept"
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import http.client
+import http.server
+import threading
+import time
+
+import pytest
+
+import deploy_secure
+
+CHUNKED_REPLY = [b"first,", b"second,", b"third"]
+
+
+class StandinApi(http.server.BaseHTTPRequestHandler):
+    """Echoes request bodies and answers /api/chunked with a chunked response."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == "/api/chunked":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for part in CHUNKED_REPLY:
+                self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.reply(200, self.path.encode())
+
+    def do_POST(self) -> None:  # noqa: N802
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            framing = "chunked"
+            body = b"".join(deploy_secure.iter_chunked_body(self.rfile))
+        else:
+            framing = "length"
+            body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        self.reply(200, body, [("X-Request-Framing", framing)])
+
+    do_PUT = do_POST
+
+    def reply(self, status: int, body: bytes, headers: list[tuple[str, str]] = ()) -> None:
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandinServer(deploy_secure.ThreadingHTTPServer):
+    def handle_error(self, request, client_address) -> None:
+        # The frontend drops upstream connections mid-body on purpose (rejected chunked bodies).
+        pass
+
+
+def serve_in_thread(server) -> threading.Thread:
+    # Joined by server_close(), so handler threads never log into the next test's output.
+    server.daemon_threads = False
+    if isinstance(server, deploy_secure.ThreadingHTTPServer):
+        # shutdown() waits for the next poll; the default 0.5 s adds up over many tests.
+        target = lambda: server.serve_forever(poll_interval=0.05)  # noqa: E731
+    else:
+        target = server.serve_forever
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+@pytest.fixture
+def upstream_origin():
+    server = StandinServer(("127.0.0.1", 0), StandinApi)
+    serve_in_thread(server)
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["threading", "asyncio"])
+def frontend(
+    request,
+    make_release,
+    upstream_origin: str,
+    clients: list[http.client.HTTPConnection],
+    monkeypatch: pytest.MonkeyPatch,
+):
+    """Port of a frontend (either engine) serving a small release and proxying /api/ to the stand-in."""
+    make_release({"index.html": b"<html>app</html>", "assets/app.js": b"console.log(1)\n"})
+    # The asyncio engine logs a request after writing its response, which can land after the test.
+    monkeypatch.setattr(deploy_secure, "info", lambda msg: None)
+    api = deploy_secure.ApiUpstreams([upstream_origin])
+    pool = deploy_secure.UpstreamPool()
+    if request.param == "threading":
+        server = deploy_secure.ThreadingHTTPServer(
+            ("127.0.0.1", 0), deploy_secure.make_handler(api, pool, proxy_buffer_bytes=1024)
+        )
+        thread = serve_in_thread(server)
+        port = server.server_address[1]
+    else:
+        sock = deploy_secure.create_listen_socket(("127.0.0.1", 0), reuse_port=False)
+        port = sock.getsockname()[1]
+        server = deploy_secure.AsyncFrontendServer(
+            ("127.0.0.1", port), None, api, pool, proxy_buffer_bytes=1024, listen_socket=sock
+        )
+        thread = serve_in_thread(server)
+        deadline = time.monotonic() + 5
+        while server._loop is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+    yield request.param, port
+    for client in clients:
+        client.close()
+    server.shutdown()
+    thread.join(5)
+    server.server_close()
+    pool.close()
+
+
+@pytest.fixture
+def clients() -> list[http.client.HTTPConnection]:
+    return []
+
+
+@pytest.fixture
+def connect(clients: list[http.client.HTTPConnection]):
+    def open_connection(port: int) -> http.client.HTTPConnection:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        clients.append(connection)
+        return connection
+
+    return open_connection
+
+
+@pytest.mark.parametrize("size", [10, 1024, 200 * 1024], ids=["small", "at-buffer-limit", "streamed"])
+def test_fixed_length_body_is_relayed(frontend, connect, size: int) -> None:
+    _engine, port = frontend
+    body = bytes(range(256)) * (size // 256) + b"x" * (size % 256)
+    connection = connect(port)
+    connection.request("POST", "/api/echo", body=body)
+    response = connection.getresponse()
+
+    assert response.status == 200
+    assert response.getheader("X-Request-Framing") == "length"
+    assert response.read() == body
+
+
+def test_chunked_request_body_is_relayed(frontend, connect) -> None:
+    _engine, port = frontend
+    parts = [b"alpha-", b"b" * 100_000, b"-omega"]
+    connection = connect(port)
+    connection.request("POST", "/api/echo", body=iter(parts), encode_chunked=True)
+    response = connection.getresponse()
+
+    assert response.status == 200
+    assert response.getheader("X-Request-Framing") == "chunked"
+    assert response.read() == b"".join(parts)
+
+    # The connection is still usable once the terminating chunk was consumed.
+    connection.request("GET", "/api/after")
+    assert connection.getresponse().read() == b"/api/after"
+
+
+def test_chunked_response_is_relayed(frontend, connect) -> None:
+    _engine, port = frontend
+    connection = connect(port)
+    connection.request("GET", "/api/chunked")
+    response = connection.getresponse()
+
+    assert response.status == 200
+    assert response.read() == b"".join(CHUNKED_REPLY)
+    assert not response.will_close
+
+
+def test_malformed_chunked_request_body_is_rejected(frontend, connect) -> None:
+    _engine, port = frontend
+    connection = connect(port)
+    connection.putrequest("POST", "/api/echo")
+    connection.putheader("Transfer-Encoding", "chunked")
+    connection.endheaders()
+    connection.send(b"zz\r\nnot hex\r\n0\r\n\r\n")
+    response = connection.getresponse()
+
+    assert response.status == 400
+    assert response.will_close
+
+
+def test_static_files_are_served_over_keep_alive(frontend, connect) -> None:
+    _engine, port = frontend
+    connection = connect(port)
+    connection.request("GET", "/assets/app.js")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.read() == b"console.log(1)\n"
+    assert not response.will_close
+
+    connection.request("GET", "/some/spa/route")
+    response = connection.getresponse()
+    assert response.read() == b"<html>app</html>"
+
+
+def test_keep_alive_survives_a_missing_asset(frontend, connect) -> None:
+    engine, port = frontend
+    if engine == "asyncio":
+        pytest.skip("the asyncio engine closes after every error response")
+    connection = connect(port)
+    connection.request("GET", "/assets/missing.js")
+    response = connection.getresponse()
+    response.read()
+    assert response.status == 404
+    assert not response.will_close
+
+    connection.request("GET", "/assets/app.js")
+    response = connection.getresponse()
+    assert response.status == 200
+    assert response.read() == b"console.log(1)\n"
+
+
+@pytest.mark.parametrize(
+    ("method", "path", "headers", "body"),
+    [
+        pytest.param("POST", "/not-api", {"Content-Length": "4"}, b"data", id="404-with-body"),
+        pytest.param("POST", "/api/echo", {"Content-Length": "nope"}, b"", id="400-bad-length"),
+    ],
+)
+def test_error_responses_close_when_the_body_cannot_be_trusted(
+    frontend, connect, method: str, path: str, headers: dict[str, str], body: bytes
+) -> None:
+    _engine, port = frontend
+    connection = connect(port)
+    connection.putrequest(method, path)
+    for key, value in headers.items():
+        connection.putheader(key, value)
+    connection.endheaders(body)
+    response = connection.getresponse()
+    response.read()
+
+    assert response.status in (400, 404)
+    assert response.will_close
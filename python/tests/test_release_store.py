@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+
+import deploy_secure
+
+BUNDLE = b"export const answer = 42;\n" * 64  # compressible and above PRECOMPRESS_MIN_BYTES
+
+
+def blobs() -> list[Path]:
+    return sorted(path for path in deploy_secure.BLOBS_DIR.glob("*/*") if path.is_file())
+
+
+def active_release() -> str:
+    return json.loads(deploy_secure.CURRENT_RELEASE_FILE.read_text(encoding="utf-8"))["release"]
+
+
+def age_blobs(seconds: float) -> None:
+    old = time.time() - seconds
+    for blob in deploy_secure.BLOBS_DIR.glob("*/*"):
+        os.utime(blob, (old, old))
+
+
+def test_identical_files_share_one_blob(make_release) -> None:
+    first = make_release({"index.html": b"<html>v1</html>", "assets/app.js": BUNDLE})
+    second = make_release({"index.html": b"<html>v2!</html>", "assets/app.js": BUNDLE})
+
+    assert first != second
+    assert (first / "dist/assets/app.js").stat().st_ino == (second / "dist/assets/app.js").stat().st_ino
+    # index.html twice, app.js once, plus app.js's gzip variant (and zstd when available).
+    variants = [blob for blob in blobs() if blob.suffix in (".gz", ".zst")]
+    assert len(blobs()) - len(variants) == 3
+    assert active_release() == second.name
+
+
+def test_precompressed_variants_are_listed_in_the_manifest(make_release) -> None:
+    release = make_release({"index.html": b"<html></html>", "assets/app.js": BUNDLE})
+
+    manifest = json.loads((release / "integrity.json").read_text(encoding="utf-8"))
+    entries = {entry["path"]: entry for entry in manifest["files"]}
+    gzip_variant = entries["assets/app.js"]["encodings"]["gzip"]
+    assert gzip_variant["path"] == "precompressed/assets/app.js.gz"
+    assert (release / gzip_variant["path"]).is_file()
+    assert "encodings" not in entries["index.html"]
+
+
+def test_store_blob_rejects_bytes_that_do_not_match_the_digest(deploy_root: Path) -> None:
+    source = deploy_root / "changed.js"
+    source.write_bytes(b"new contents")
+    digest = hashlib.sha256(b"old contents").hexdigest()
+
+    with pytest.raises(SystemExit):
+        deploy_secure.store_blob(source, digest)
+
+    assert blobs() == []
+    assert not list(deploy_secure.BLOBS_DIR.rglob("*.tmp"))
+
+
+def test_failed_release_leaves_nothing_for_rollback(make_release, monkeypatch: pytest.MonkeyPatch) -> None:
+    make_release({"index.html": b"<html>v1</html>"})
+    before = sorted(path.name for path in deploy_secure.RELEASES_DIR.iterdir())
+
+    def boom(release_dir: Path, manifest: dict[str, object]) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(deploy_secure, "create_precompressed_variants", boom)
+    with pytest.raises(OSError):
+        make_release({"index.html": b"<html>v2!</html>"})
+
+    assert sorted(path.name for path in deploy_secure.RELEASES_DIR.iterdir()) == before
+
+
+def test_gc_prunes_old_releases_and_their_blobs(make_release) -> None:
+    make_release({"index.html": b"<html>v1</html>", "assets/app.js": BUNDLE})
+    make_release({"index.html": b"<html>v2!</html>", "assets/app.js": BUNDLE})
+    latest = make_release({"index.html": b"<html>v3!!</html>", "assets/app.js": BUNDLE})
+    age_blobs(2 * deploy_secure.BLOB_GC_GRACE_SECONDS)
+
+    deploy_secure.gc_release_store(keep=1)
+
+    assert [path.name for path in deploy_secure.RELEASES_DIR.iterdir()] == [latest.name]
+    variants = [blob for blob in blobs() if blob.suffix in (".gz", ".zst")]
+    assert len(blobs()) - len(variants) == 2
+    deploy_secure.verify_release()
+
+
+def test_gc_keeps_unreferenced_blobs_inside_the_grace_period(make_release) -> None:
+    make_release({"index.html": b"<html>v1</html>"})
+    orphan = deploy_secure.store_blob(b"written by a build still in progress", "ab" * 32)
+
+    deploy_secure.gc_release_store()
+    assert orphan.exists()
+
+    age_blobs(2 * deploy_secure.BLOB_GC_GRACE_SECONDS)
+    deploy_secure.gc_release_store()
+    assert not orphan.exists()
+    deploy_secure.verify_release()
+
+
+def test_gc_rejects_keep_below_one(make_release) -> None:
+    make_release({"index.html": b"<html></html>"})
+    with pytest.raises(SystemExit):
+        deploy_secure.gc_release_store(keep=0)
+
+
+def test_verify_passes_for_an_untouched_release(make_release, capsys: pytest.CaptureFixture[str]) -> None:
+    release = make_release({"index.html": b"<html></html>", "assets/app.js": BUNDLE})
+
+    deploy_secure.verify_release(release.name)
+
+    assert f"Release {release.name} verificada" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    ("tamper", "label"),
+    [
+        (lambda release: (release / "dist/index.html").unlink(), "falta: dist/index.html"),
+        (lambda release: (release / "dist/extra.js").write_bytes(b"injected"), "no listado: dist/extra.js"),
+        (
+            lambda release: (release / "precompressed/assets/evil.js.gz").write_bytes(b"injected"),
+            "no listado: precompressed/assets/evil.js.gz",
+        ),
+    ],
+    ids=["missing", "extra-in-dist", "extra-in-precompressed"],
+)
+def test_verify_reports_files_that_differ_from_the_manifest(
+    make_release, capsys: pytest.CaptureFixture[str], tamper, label: str
+) -> None:
+    release = make_release({"index.html": b"<html></html>", "assets/app.js": BUNDLE})
+    tamper(release)
+
+    with pytest.raises(SystemExit):
+        deploy_secure.verify_release(release.name)
+
+    assert label in capsys.readouterr().out
+
+
+def test_verify_reports_changed_bytes(make_release, capsys: pytest.CaptureFixture[str]) -> None:
+    release = make_release({"index.html": b"<html></html>", "assets/app.js": BUNDLE})
+    # Hardlinks share the blob; replace the file instead of writing through it.
+    target = release / "dist/assets/app.js"
+    target.unlink()
+    target.write_bytes(BUNDLE.replace(b"42", b"43"))
+
+    with pytest.raises(SystemExit):
+        deploy_secure.verify_release()
+
+    assert "hash distinto: dist/assets/app.js" in capsys.readouterr().out
+
+
+def test_rollback_activates_the_previous_release(make_release) -> None:
+    first = make_release({"index.html": b"<html>v1</html>"})
+    second = make_release({"index.html": b"<html>v2!</html>"})
+    assert deploy_secure.RELEASE_POINTER.current().name == second.name
+
+    deploy_secure.rollback_release()
+
+    assert active_release() == first.name
+    assert deploy_secure.RELEASE_POINTER.current().name == first.name
+    assert (deploy_secure.get_current_release_dir() / "index.html").read_bytes() == b"<html>v1</html>"
+
+
+def test_rollback_without_enough_history_fails(make_release) -> None:
+    only = make_release({"index.html": b"<html></html>"})
+
+    with pytest.raises(SystemExit):
+        deploy_secure.rollback_release(1)
+    with pytest.raises(SystemExit):
+        deploy_secure.rollback_release(0)
+    assert active_release() == only.name
+
+
+def test_verify_and_rollback_commands(
+    make_release, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    first = make_release({"index.html": b"<html>v1</html>"})
+    make_release({"index.html": b"<html>v2!</html>"})
+
+    monkeypatch.setattr("sys.argv", ["deploy_secure.py", "rollback", "--steps", "1"])
+    deploy_secure.main()
+    monkeypatch.setattr("sys.argv", ["deploy_secure.py", "verify"])
+    deploy_secure.main()
+
+    out = capsys.readouterr().out
+    assert f"Release activa: {first.name}" in out
+    assert f"Release {first.name} verificada" in out
+
+
+def test_input_hash_tracks_content_and_vite_env(deploy_root: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    (deploy_root / "src").mkdir()
+    main = deploy_root / "src" / "main.js"
+    main.write_text("console.log(1)\n", encoding="utf-8")
+    (deploy_root / "package.json").write_text("{}\n", encoding="utf-8")
+    baseline = deploy_secure.build_input_hash()
+
+    # Touching a file without changing its bytes keeps the hash.
+    os.utime(main, (time.time() + 60, time.time() + 60))
+    assert deploy_secure.build_input_hash() == baseline
+    # Editor leftovers are not build inputs.
+    (deploy_root / "src" / "main.js.swp").write_bytes(b"swap")
+    assert deploy_secure.build_input_hash() == baseline
+
+    main.write_text("console.log(2)\n", encoding="utf-8")
+    changed = deploy_secure.build_input_hash()
+    assert changed != baseline
+
+    monkeypatch.setenv("VITE_FLAG", "on")
+    assert deploy_secure.build_input_hash() != changed
+    monkeypatch.delenv("VITE_FLAG")
+    (deploy_root / ".env.production").write_text("VITE_FLAG=on\nSECRET=ignored\n", encoding="utf-8")
+    with_env_file = deploy_secure.build_input_hash()
+    assert with_env_file != changed
+    (deploy_root / ".env.production").write_text("VITE_FLAG=on\nSECRET=other\n", encoding="utf-8")
+    assert deploy_secure.build_input_hash() == with_env_file
+
+
+def test_find_release_for_inputs_skips_releases_no_longer_on_disk(make_release) -> None:
+    first = make_release({"index.html": b"<html>v1</html>"}, input_hash="a" * 64)
+    second = make_release({"index.html": b"<html>v2!</html>"}, input_hash="b" * 64)
+
+    assert deploy_secure.find_release_for_inputs("a" * 64) == first.name
+    assert deploy_secure.find_release_for_inputs("b" * 64) == second.name
+    assert deploy_secure.find_release_for_inputs("c" * 64) is None
+
+    shutil.rmtree(second)
+    assert deploy_secure.find_release_for_inputs("b" * 64) is None
+
+
+def test_reuse_release_reactivates_without_rebuilding(make_release) -> None:
+    first = make_release({"index.html": b"<html>v1</html>"}, input_hash="a" * 64)
+    make_release({"index.html": b"<html>v2!</html>"}, input_hash="b" * 64)
+
+    assert deploy_secure.reuse_release(first.name, "a" * 64) == first
+    assert active_release() == first.name
+    history = json.loads(deploy_secure.DEPLOY_HISTORY_FILE.read_text(encoding="utf-8"))
+    assert history[-1] == {**history[-1], "release": first.name, "inputHash": "a" * 64, "reused": True}
+    assert len(list(deploy_secure.RELEASES_DIR.iterdir())) == 2
+
@@ -63,6 +63,8 @@ const forceHttps = String(process.env.FORCE_HTTPS || "false").toLowerCase() ===
 const httpsPublicOrigin = process.env.HTTPS_PUBLIC_ORIGIN || "";
 const httpRedirectEnabled = String(process.env.HTTP_REDIRECT_ENABLED || "false").toLowerCase() === "true";
 const httpRedirectPort = Number(process.env.HTTP_REDIRECT_PORT || 4080);
+// Set by python/deploy_secure.py --api-workers: how many API processes share server/data.
+const apiWorkerCount = Math.max(1, Number(process.env.API_WORKER_COUNT || 1) || 1);
 
 if (httpsEnabled && (!httpsKeyPath || !httpsCertPath)) {
   throw new Error("HTTPS_ENABLED=true requires HTTPS_KEY_PATH and HTTPS_CERT_PATH.");
@@ -103,5 +105,6 @@ export const config = {
   forceHttps,
   httpsPublicOrigin,
   httpRedirectEnabled,
-  httpRedirectPort
+  httpRedirectPort,
+  apiWorkerCount
 };
@@ -0,0 +1,71 @@
+import { open, readFile, stat, unlink } from "node:fs/promises";
+
+const RETRY_MIN_MS = 5;
+const RETRY_MAX_MS = 25;
+// A holder that crashed (or was killed) mid-write never unlinks its lock file. Its pid is
+// checked first; the age limit covers a pid that was reused since.
+const STALE_LOCK_MS = 30 * 1000;
+
+const localQueues = new Map();
+
+// Runs fn while holding an exclusive lock shared by every API worker process (one lock file per
+// path). Calls in the same process queue up first, so only one of them polls the file.
+export function withFileLock(path, fn) {
+  const previous = localQueues.get(path) || Promise.resolve();
+  const run = previous.then(() => withProcessLock(path, fn));
+  const tail = run.catch(() => {});
+  localQueues.set(path, tail);
+  tail.then(() => {
+    if (localQueues.get(path) === tail) localQueues.delete(path);
+  });
+  return run;
+}
+
+async function withProcessLock(path, fn) {
+  const handle = await acquire(path);
+  try {
+    return await fn();
+  } finally {
+    await handle.close().catch(() => {});
+    await unlink(path).catch(() => {});
+  }
+}
+
+async function acquire(path) {
+  for (;;) {
+    try {
+      const handle = await open(path, "wx");
+      await handle.writeFile(String(process.pid));
+      return handle;
+    } catch (error) {
+      if (error?.code !== "EEXIST") throw error;
+    }
+    await removeIfStale(path);
+    await sleep(RETRY_MIN_MS + Math.random() * (RETRY_MAX_MS - RETRY_MIN_MS));
+  }
+}
+
+async function removeIfStale(path) {
+  try {
+    const info = await stat(path);
+    const holder = Number(await readFile(path, "utf8"));
+    if (Date.now() - info.mtimeMs > STALE_LOCK_MS || (holder > 0 && !isAlive(holder))) {
+      await unlink(path);
+    }
+  } catch {
+    // Released (or removed by another waiter) in the meantime.
+  }
+}
+
+function isAlive(pid) {
+  try {
+    process.kill(pid, 0);
+    return true;
+  } catch (error) {
+    return error?.code === "EPERM";
+  }
+}
+
+function sleep(ms) {
+  return new Promise((resolve) => setTimeout(resolve, ms));
+}
@@ -5,6 +5,7 @@ import rateLimit from "express-rate-limit";
 import fs from "node:fs";
 import http from "node:http";
 import https from "node:https";
+import { fileURLToPath } from "node:url";
 import { config } from "./config.js";
 import {
   addAuditLog,
@@ -51,7 +52,10 @@ import { isRotationDue } from "./auto-rotation.js";
 
 const app = express();
 const api = express.Router();
-const syncHub = createSyncHub();
+const syncHub = createSyncHub({
+  journalPath:
+    config.apiWorkerCount > 1 ? fileURLToPath(new URL("./data/sync-journal.json", import.meta.url)) : null
+});
 const backupService = createBackupService({
   config,
   readStore,
@@ -90,7 +94,8 @@ if (config.forceHttps) {
 
 const limiter = rateLimit({
   windowMs: 15 * 60 * 1000,
-  max: 180,
+  // Each API worker counts on its own and requests are spread across them.
+  max: Math.ceil(180 / config.apiWorkerCount),
   standardHeaders: true,
   legacyHeaders: false
 });
@@ -1,3 +1,4 @@
+import { AsyncLocalStorage } from "node:async_hooks";
 import { access, mkdir, readFile, rename, writeFile } from "node:fs/promises";
 import { dirname, join } from "node:path";
 import { fileURLToPath } from "node:url";
@@ -8,6 +9,7 @@ import { createHybridSharePackage } from "./hybrid-share.js";
 import { checkPasswordBreach } from "./breach-detection.js";
 import { config } from "./config.js";
 import { classifyEntryType } from "./entry-classification.js";
+import { withFileLock } from "./file-lock.js";
 import {
   buildRotationPolicy,
   buildSshRotationNotes,
@@ -22,6 +24,10 @@ const SHARD_DIR = fileURLToPath(new URL("./data/shards", import.meta.url));
 const METADATA_FILE_PATH = join(SHARD_DIR, "metadata.json");
 const ENTRIES_FILE_PATH = join(SHARD_DIR, "entries.json");
 const CRYPTO_FILE_PATH = join(SHARD_DIR, "crypto.json");
+const WRITE_LOCK_PATH = join(SHARD_DIR, ".write.lock");
+const STORE_REVISION = Symbol("storeRevision");
+// Set while an operation runs holding the write lock (see retryOnConflict).
+const writeLockHeld = new AsyncLocalStorage();
 const MAX_HISTORY_ENTRIES = 50;
 
 async function ensureStore() {
@@ -67,12 +73,55 @@ async function ensureStore() {
 
 export async function readStore() {
   await ensureStore();
-  return readCombinedFromShards();
+  // Metadata is written last, so a revision read first never claims newer shards than it has.
+  const metadata = await readMetadataSafe();
+  const db = await readCombinedFromShards();
+  Object.defineProperty(db, STORE_REVISION, { value: storeRevision(metadata), writable: true });
+  return db;
 }
 
 export async function writeStore(data) {
   await ensureStore();
-  await writeShardsFromStore(normalizeStore(data), await readMetadataSafe());
+  const commit = async () => {
+    const metadata = await readMetadataSafe();
+    const expected = data?.[STORE_REVISION];
+    if (expected !== undefined && expected !== storeRevision(metadata)) {
+      throw new StoreConflictError();
+    }
+    const written = await writeShardsFromStore(normalizeStore(data), metadata);
+    if (expected !== undefined) {
+      data[STORE_REVISION] = written.revision;
+    }
+  };
+  await (writeLockHeld.getStore() ? commit() : withFileLock(WRITE_LOCK_PATH, commit));
+}
+
+export class StoreConflictError extends Error {
+  constructor() {
+    super("The store changed since it was read.");
+    this.name = "StoreConflictError";
+  }
+}
+
+// Store operations read, modify and write the whole store, and several API worker processes
+// run them at once. A write only commits if nobody else committed since its read, so the
+// crypto work of concurrent operations runs in parallel. After a conflict the operation runs
+// again holding the write lock for its whole duration, which cannot conflict.
+function retryOnConflict(operation) {
+  return async (...args) => {
+    if (!writeLockHeld.getStore()) {
+      try {
+        return await operation(...args);
+      } catch (error) {
+        if (!(error instanceof StoreConflictError)) throw error;
+      }
+    }
+    return withFileLock(WRITE_LOCK_PATH, () => writeLockHeld.run(true, () => operation(...args)));
+  };
+}
+
+function storeRevision(metadata) {
+  return Number(metadata?.revision) || 0;
 }
 
 async function readCombinedFromShards() {
@@ -145,9 +194,11 @@ async function writeShardsFromStore(store, previousMetadata) {
 
   await Promise.all([
     atomicWriteJson(ENTRIES_FILE_PATH, entriesShard),
-    atomicWriteJson(CRYPTO_FILE_PATH, cryptoShard),
-    atomicWriteJson(METADATA_FILE_PATH, metadataShard)
+    atomicWriteJson(CRYPTO_FILE_PATH, cryptoShard)
   ]);
+  // Last: its revision tells readers (and writeStore) which shards they have.
+  await atomicWriteJson(METADATA_FILE_PATH, metadataShard);
+  return metadataShard;
 }
 
 function buildMetadata(entriesShard, cryptoShard, previousMetadata) {
@@ -158,6 +209,7 @@ function buildMetadata(entriesShard, cryptoShard, previousMetadata) {
     shardMode: "metadata-crypto-entries",
     createdAt: prev.createdAt || now,
     updatedAt: now,
+    revision: storeRevision(prev) + 1,
     stats: {
       credentialsEntries: Array.isArray(entriesShard.credentials) ? entriesShard.credentials.length : 0,
       credentialsCrypto: Array.isArray(cryptoShard.credentials) ? cryptoShard.credentials.length : 0,
@@ -215,7 +267,7 @@ async function atomicWriteJson(path, value) {
   await rename(tmp, path);
 }
 
-export async function listCredentials(query = "") {
+export const listCredentials = retryOnConflict(async function listCredentials(query = "") {
   const db = await readStore();
   let changed = false;
 
@@ -237,9 +289,9 @@ export async function listCredentials(query = "") {
       (item.notes || "").toLowerCase().includes(q)
     );
   });
-}
+});
 
-export async function createCredential(payload) {
+export const createCredential = retryOnConflict(async function createCredential(payload) {
   const db = await readStore();
   const now = new Date().toISOString();
   const id = randomUUID();
@@ -290,9 +342,9 @@ export async function createCredential(payload) {
   db.credentials.unshift(item);
   await writeStore(db);
   return materializeCredential(item);
-}
+});
 
-export async function updateCredential(id, payload) {
+export const updateCredential = retryOnConflict(async function updateCredential(id, payload) {
   const db = await readStore();
   const index = db.credentials.findIndex((item) => item.id === id);
   if (index === -1) return null;
@@ -390,7 +442,7 @@ export async function updateCredential(id, payload) {
   };
   await writeStore(db);
   return materializeCredential(db.credentials[index]);
-}
+});
 
 export async function getCredentialHistory(credentialId) {
   const db = await readStore();
@@ -435,7 +487,7 @@ export async function getCredentialHistory(credentialId) {
   };
 }
 
-export async function updateCredentialRotationPolicy(id, payload = {}) {
+export const updateCredentialRotationPolicy = retryOnConflict(async function updateCredentialRotationPolicy(id, payload = {}) {
   const db = await readStore();
   const index = db.credentials.findIndex((item) => item.id === id);
   if (index === -1) return null;
@@ -477,9 +529,9 @@ export async function updateCredentialRotationPolicy(id, payload = {}) {
   }
 
   return materializeCredential(db.credentials[index]);
-}
+});
 
-export async function rotateCredentialSecret(credentialId, reason = "manual") {
+export const rotateCredentialSecret = retryOnConflict(async function rotateCredentialSecret(credentialId, reason = "manual") {
   const db = await readStore();
   const index = db.credentials.findIndex((item) => item.id === credentialId);
   if (index === -1) return null;
@@ -566,7 +618,7 @@ export async function rotateCredentialSecret(credentialId, reason = "manual") {
       metadata: material.metadata || {}
     }
   };
-}
+});
 
 export async function rotateDueCredentials(limit = 25) {
   const db = await readStore();
@@ -596,22 +648,22 @@ export async function rotateDueCredentials(limit = 25) {
   };
 }
 
-export async function deleteCredential(id) {
+export const deleteCredential = retryOnConflict(async function deleteCredential(id) {
   const db = await readStore();
   const before = db.credentials.length;
   db.credentials = db.credentials.filter((item) => item.id !== id);
   if (db.credentials.length === before) return false;
   await writeStore(db);
   return true;
-}
+});
 
-export async function clearCredentials() {
+export const clearCredentials = retryOnConflict(async function clearCredentials() {
   const db = await readStore();
   db.credentials = [];
   await writeStore(db);
-}
+});
 
-export async function generateHoneyCredentials(count = 3) {
+export const generateHoneyCredentials = retryOnConflict(async function generateHoneyCredentials(count = 3) {
   const safeCount = Math.max(1, Math.min(20, Number(count) || 3));
   const db = await readStore();
   const now = new Date().toISOString();
@@ -662,9 +714,9 @@ export async function generateHoneyCredentials(count = 3) {
 
   await writeStore(db);
   return created;
-}
+});
 
-export async function registerHoneyCredentialAccess(credentialId, action, meta = {}) {
+export const registerHoneyCredentialAccess = retryOnConflict(async function registerHoneyCredentialAccess(credentialId, action, meta = {}) {
   const db = await readStore();
   const index = db.credentials.findIndex((item) => item.id === credentialId);
   if (index === -1) return null;
@@ -696,9 +748,9 @@ export async function registerHoneyCredentialAccess(credentialId, action, meta =
 
   await writeStore(db);
   return { log, item: materializeCredential(db.credentials[index]) };
-}
+});
 
-export async function refreshCredentialBreachStatus(credentialId) {
+export const refreshCredentialBreachStatus = retryOnConflict(async function refreshCredentialBreachStatus(credentialId) {
   const db = await readStore();
   const index = db.credentials.findIndex((item) => item.id === credentialId);
   if (index === -1) return null;
@@ -725,9 +777,9 @@ export async function refreshCredentialBreachStatus(credentialId) {
   };
   await writeStore(db);
   return materializeCredential(db.credentials[index]);
-}
+});
 
-export async function scanAllCredentialsForBreaches() {
+export const scanAllCredentialsForBreaches = retryOnConflict(async function scanAllCredentialsForBreaches() {
   const db = await readStore();
   const updated = [];
   let compromised = 0;
@@ -763,7 +815,7 @@ export async function scanAllCredentialsForBreaches() {
     compromised,
     items: updated
   };
-}
+});
 
 async function refreshStaleBreachStatuses(db) {
   let changed = false;
@@ -810,7 +862,7 @@ export async function listTrustedDevices() {
   return db.trustedDevices;
 }
 
-export async function upsertDeviceEncryptionKey(payload) {
+export const upsertDeviceEncryptionKey = retryOnConflict(async function upsertDeviceEncryptionKey(payload) {
   if (!payload?.publicKeyPem || !payload?.deviceId) {
     throw new Error("deviceId and publicKeyPem are required.");
   }
@@ -846,7 +898,7 @@ export async function upsertDeviceEncryptionKey(payload) {
     createdAt: merged.createdAt,
     updatedAt: merged.updatedAt
   };
-}
+});
 
 export async function listShareTargets() {
   const db = await readStore();
@@ -901,7 +953,7 @@ export async function createCredentialSharePackage(credentialId, targetDeviceId)
   });
 }
 
-export async function addTrustedDevice(payload) {
+export const addTrustedDevice = retryOnConflict(async function addTrustedDevice(payload) {
   const db = await readStore();
   const now = new Date().toISOString();
   const item = {
@@ -916,9 +968,9 @@ export async function addTrustedDevice(payload) {
   db.trustedDevices = db.trustedDevices.slice(0, 100);
   await writeStore(db);
   return item;
-}
+});
 
-export async function addAuditLog(payload) {
+export const addAuditLog = retryOnConflict(async function addAuditLog(payload) {
   const db = await readStore();
   const item = {
     id: randomUUID(),
@@ -932,7 +984,7 @@ export async function addAuditLog(payload) {
   db.auditLogs = db.auditLogs.slice(0, 500);
   await writeStore(db);
   return item;
-}
+});
 
 export async function listAuditLogs(limit = 60) {
   const db = await readStore();
@@ -948,7 +1000,7 @@ export async function listSharedVaults(actor = "owner") {
     .map((vault) => materializeSharedVault(vault, db.credentials || [], normalizedActor, now));
 }
 
-export async function createSharedVault(payload = {}) {
+export const createSharedVault = retryOnConflict(async function createSharedVault(payload = {}) {
   const db = await readStore();
   const now = new Date().toISOString();
   const audience = normalizeAudience(payload.audience);
@@ -974,9 +1026,9 @@ export async function createSharedVault(payload = {}) {
   db.sharedVaults.unshift(item);
   await writeStore(db);
   return materializeSharedVault(item, db.credentials || [], owner, Date.now());
-}
+});
 
-export async function addSharedVaultMember(vaultId, payload = {}) {
+export const addSharedVaultMember = retryOnConflict(async function addSharedVaultMember(vaultId, payload = {}) {
   const db = await readStore();
   const index = findSharedVaultIndex(db.sharedVaults, vaultId);
   if (index === -1) return null;
@@ -1019,9 +1071,9 @@ export async function addSharedVaultMember(vaultId, payload = {}) {
   db.sharedVaults[index] = updated;
   await writeStore(db);
   return materializeSharedVault(updated, db.credentials || [], actor, Date.now());
-}
+});
 
-export async function removeSharedVaultMember(vaultId, memberId) {
+export const removeSharedVaultMember = retryOnConflict(async function removeSharedVaultMember(vaultId, memberId) {
   const db = await readStore();
   const index = findSharedVaultIndex(db.sharedVaults, vaultId);
   if (index === -1) return null;
@@ -1037,9 +1089,9 @@ export async function removeSharedVaultMember(vaultId, memberId) {
   db.sharedVaults[index] = updated;
   await writeStore(db);
   return materializeSharedVault(updated, db.credentials || [], "owner", Date.now());
-}
+});
 
-export async function addCredentialToSharedVault(vaultId, credentialId, actor = "owner") {
+export const addCredentialToSharedVault = retryOnConflict(async function addCredentialToSharedVault(vaultId, credentialId, actor = "owner") {
   const db = await readStore();
   const index = findSharedVaultIndex(db.sharedVaults, vaultId);
   if (index === -1) return null;
@@ -1067,9 +1119,9 @@ export async function addCredentialToSharedVault(vaultId, credentialId, actor =
   db.sharedVaults[index] = updated;
   await writeStore(db);
   return materializeSharedVault(updated, db.credentials || [], actor, Date.now());
-}
+});
 
-export async function removeCredentialFromSharedVault(vaultId, credentialId, actor = "owner") {
+export const removeCredentialFromSharedVault = retryOnConflict(async function removeCredentialFromSharedVault(vaultId, credentialId, actor = "owner") {
   const db = await readStore();
   const index = findSharedVaultIndex(db.sharedVaults, vaultId);
   if (index === -1) return null;
@@ -1088,7 +1140,7 @@ export async function removeCredentialFromSharedVault(vaultId, credentialId, act
   db.sharedVaults[index] = updated;
   await writeStore(db);
   return materializeSharedVault(updated, db.credentials || [], actor, Date.now());
-}
+});
 
 export async function listEmergencyContacts() {
   const db = await readStore();
@@ -1102,7 +1154,7 @@ export async function listEmergencyContacts() {
   }));
 }
 
-export async function createEmergencyContact(payload = {}) {
+export const createEmergencyContact = retryOnConflict(async function createEmergencyContact(payload = {}) {
   const db = await readStore();
   const label = String(payload.label || "").trim();
   if (!label) {
@@ -1128,9 +1180,9 @@ export async function createEmergencyContact(payload = {}) {
   }
   await writeStore(db);
   return item;
-}
+});
 
-export async function deleteEmergencyContact(contactId) {
+export const deleteEmergencyContact = retryOnConflict(async function deleteEmergencyContact(contactId) {
   const db = await readStore();
   const before = (db.emergencyContacts || []).length;
   db.emergencyContacts = (db.emergencyContacts || []).filter((item) => item.id !== contactId);
@@ -1138,7 +1190,7 @@ export async function deleteEmergencyContact(contactId) {
   if ((db.emergencyContacts || []).length === before) return false;
   await writeStore(db);
   return true;
-}
+});
 
 export async function listEmergencyRequests() {
   const db = await readStore();
@@ -1148,7 +1200,7 @@ export async function listEmergencyRequests() {
     .sort((a, b) => Date.parse(b.requestedAt || 0) - Date.parse(a.requestedAt || 0));
 }
 
-export async function createEmergencyRequest(contactId, payload = {}) {
+export const createEmergencyRequest = retryOnConflict(async function createEmergencyRequest(contactId, payload = {}) {
   const db = await readStore();
   const contact = (db.emergencyContacts || []).find((item) => item.id === contactId);
   if (!contact) {
@@ -1178,9 +1230,9 @@ export async function createEmergencyRequest(contactId, payload = {}) {
   db.emergencyRequests = db.emergencyRequests.slice(0, 300);
   await writeStore(db);
   return materializeEmergencyRequest(item, new Map([[contact.id, contact]]));
-}
+});
 
-export async function resolveEmergencyRequest(requestId, payload = {}) {
+export const resolveEmergencyRequest = retryOnConflict(async function resolveEmergencyRequest(requestId, payload = {}) {
   const db = await readStore();
   const index = (db.emergencyRequests || []).findIndex((item) => item.id === requestId);
   if (index === -1) return null;
@@ -1209,9 +1261,9 @@ export async function resolveEmergencyRequest(requestId, payload = {}) {
   db.emergencyRequests[index] = updated;
   await writeStore(db);
   return materializeEmergencyRequest(updated, new Map((db.emergencyContacts || []).map((item) => [item.id, item])));
-}
+});
 
-export async function processEmergencyAccessDeadlines(nowTs = Date.now()) {
+export const processEmergencyAccessDeadlines = retryOnConflict(async function processEmergencyAccessDeadlines(nowTs = Date.now()) {
   const db = await readStore();
   const requests = Array.isArray(db.emergencyRequests) ? db.emergencyRequests : [];
   let changed = false;
@@ -1233,7 +1285,7 @@ export async function processEmergencyAccessDeadlines(nowTs = Date.now()) {
     await writeStore(db);
   }
   return changed;
-}
+});
 
 export async function getEmergencyAccessGrant(requestId, actor = "") {
   const db = await readStore();
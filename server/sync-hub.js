@@ -1,8 +1,18 @@
 import { createHash, randomUUID } from "node:crypto";
+import { readFile, rename, stat, writeFile } from "node:fs/promises";
+import { withFileLock } from "./file-lock.js";
 
-export function createSyncHub() {
+const JOURNAL_MAX_EVENTS = 256;
+
+// With several API worker processes, a write can land on any of them while the sync clients
+// stay connected to one. Pass journalPath to share events through a small file every worker
+// polls; without it events only reach this process's clients.
+export function createSyncHub({ journalPath = null, journalPollMs = 200 } = {}) {
   const sseClients = new Map();
   const wsClients = new Set();
+  const journal = journalPath
+    ? createJournal(journalPath, journalPollMs, (serialized) => broadcast(serialized))
+    : null;
 
   const registerSseClient = (req, res) => {
     res.setHeader("Content-Type", "text/event-stream");
@@ -86,7 +96,11 @@ export function createSyncHub() {
       ...event
     };
     const serialized = JSON.stringify(payload);
+    broadcast(serialized);
+    journal?.append(payload);
+  };
 
+  const broadcast = (serialized) => {
     for (const [, res] of sseClients) {
       if (res.writableEnded) continue;
       res.write(`event: sync\ndata: ${serialized}\n\n`);
@@ -106,6 +120,70 @@ export function createSyncHub() {
   };
 }
 
+function createJournal(path, pollMs, onRemoteEvent) {
+  const origin = randomUUID();
+  let lastSeq = 0;
+  let lastMtimeMs = 0;
+  let polling = false;
+
+  const read = async () => {
+    try {
+      const parsed = JSON.parse(await readFile(path, "utf8"));
+      return Array.isArray(parsed?.events) ? parsed.events : [];
+    } catch {
+      return [];
+    }
+  };
+
+  const append = (payload) => {
+    withFileLock(`${path}.lock`, async () => {
+      const events = await read();
+      const seq = events.length ? events[events.length - 1].seq + 1 : 1;
+      events.push({ seq, origin, payload });
+      const tmp = `${path}.${process.pid}.tmp`;
+      await writeFile(tmp, JSON.stringify({ events: events.slice(-JOURNAL_MAX_EVENTS) }), "utf8");
+      await rename(tmp, path);
+    }).catch(() => {
+      // Non-fatal: local clients already got the event.
+    });
+  };
+
+  const poll = async () => {
+    if (polling) return;
+    polling = true;
+    try {
+      const info = await stat(path).catch(() => null);
+      if (!info || info.mtimeMs === lastMtimeMs) return;
+      lastMtimeMs = info.mtimeMs;
+      const events = await read();
+      const newest = events.length ? events[events.length - 1].seq : 0;
+      if (newest < lastSeq) {
+        // The journal was recreated; its sequence starts over.
+        lastSeq = 0;
+      }
+      for (const event of events) {
+        if (event.seq <= lastSeq) continue;
+        lastSeq = event.seq;
+        if (event.origin !== origin) onRemoteEvent(JSON.stringify(event.payload));
+      }
+    } finally {
+      polling = false;
+    }
+  };
+
+  const start = async () => {
+    // Older events were already delivered by the workers that published them.
+    const info = await stat(path).catch(() => null);
+    lastMtimeMs = info?.mtimeMs || 0;
+    const events = info ? await read() : [];
+    lastSeq = events.length ? events[events.length - 1].seq : 0;
+    setInterval(() => poll().catch(() => {}), pollMs).unref?.();
+  };
+
+  start().catch(() => {});
+  return { append };
+}
+
 function encodeTextFrame(text) {
   const payload = Buffer.from(String(text || ""), "utf8");
   const length = payload.length;